@@ -19,6 +19,7 @@ setup(
         'matplotlib',
         'huggingface-hub',
         'psycopg2-binary',
+        'pyarrow',
         'google-cloud-bigquery',
         'beautifulsoup4',
         'GitPython',
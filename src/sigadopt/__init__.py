@@ -6,11 +6,14 @@ __init__.py: This is the __init__ file for the top level sigadopt package.
 # Imports
 import logging.config
 import argparse
-from sigadopt.util.files import path_create
+from sigadopt.util.files import path_create, path_exists, dir_create
 from sigadopt.packages import add_arguments as packages_add_arguments
 from sigadopt.filter import add_arguments as filter_add_arguments
 from sigadopt.adoption import add_arguments as adoption_add_arguments
+from sigadopt.estimate import add_arguments as estimate_add_arguments
+from sigadopt.mavenindex import add_arguments as mavenindex_add_arguments
 from sigadopt.analysis import add_arguments as analysis_add_arguments
+from sigadopt.bench import add_arguments as bench_add_arguments
 
 # Author information
 __author__ = 'Taylor R. Schorlemmer'
@@ -76,6 +79,56 @@ parser.add_argument('--log-level',
                     choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
                     help='Set the log level. Defaults to WARNING. This '
                     'will print to the log destination.')
+parser.add_argument('--http-cache',
+                    dest='http_cache',
+                    metavar='DIR',
+                    type=dir_create,
+                    default=None,
+                    help='The directory for an on-disk HTTP response cache. '
+                    'Cached Maven directory listings and Hugging Face commit '
+                    'pages are revalidated with conditional requests. If not '
+                    'provided, responses are not cached.')
+parser.add_argument('--http-cache-ttl',
+                    dest='http_cache_ttl',
+                    metavar='SECONDS',
+                    type=int,
+                    default=86400,
+                    help='The number of seconds a cached response is used '
+                    'without revalidation. Defaults to 86400 (one day).')
+parser.add_argument('--http-cache-size',
+                    dest='http_cache_size',
+                    metavar='MIB',
+                    type=int,
+                    default=1024,
+                    help='The maximum size of the HTTP response cache in MiB. '
+                    'Least recently used responses are evicted past this '
+                    'size. Defaults to 1024.')
+http_cassette_group = parser.add_mutually_exclusive_group()
+http_cassette_group.add_argument('--http-record',
+                                 dest='http_record',
+                                 metavar='DIR',
+                                 type=dir_create,
+                                 default=None,
+                                 help='Record every HTTP response to this '
+                                 'directory. Bodies are stored once per '
+                                 'content hash.')
+http_cassette_group.add_argument('--http-replay',
+                                 dest='http_replay',
+                                 metavar='DIR',
+                                 type=lambda p: path_exists(p, dir=True),
+                                 default=None,
+                                 help='Replay HTTP responses recorded with '
+                                 '--http-record instead of using the network. '
+                                 'Requests that were never recorded fail with '
+                                 'a 404.')
+parser.add_argument('--rate-limit-state',
+                    dest='rate_limit_state',
+                    metavar='PATH',
+                    type=path_create,
+                    default=None,
+                    help='The path to a state file used to share per-host '
+                    'rate limits between sigadopt processes on this machine. '
+                    'If not provided, each process adapts its own limits.')
 
 
 # Create subparsers
@@ -90,4 +143,7 @@ pipeline_stage_parser = parser.add_subparsers(
 packages_add_arguments(pipeline_stage_parser)
 filter_add_arguments(pipeline_stage_parser)
 adoption_add_arguments(pipeline_stage_parser)
+estimate_add_arguments(pipeline_stage_parser)
+mavenindex_add_arguments(pipeline_stage_parser)
 analysis_add_arguments(pipeline_stage_parser)
+bench_add_arguments(pipeline_stage_parser)
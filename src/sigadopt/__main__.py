@@ -8,6 +8,7 @@ registries.
 import logging
 from datetime import datetime
 from sigadopt import parser
+from sigadopt.util import http, ratelimit
 
 # Global variables
 
@@ -36,6 +37,16 @@ def main():
         logging.root.removeHandler(old_handler)
         logging.root.addHandler(new_handler)
 
+    # Configure the shared HTTP layer and rate limits
+    ratelimit.configure(state_path=args.rate_limit_state)
+    http.configure(
+        cache_dir=args.http_cache,
+        cache_ttl=args.http_cache_ttl,
+        cache_size=args.http_cache_size,
+        record_dir=args.http_record,
+        replay_dir=args.http_replay,
+    )
+
     # Log start
     log.info('Starting.')
 
@@ -31,6 +31,38 @@ def add_hf_args(registry_parser):
     #     type=dir_create,
     #     help='The path to the directory to download files to.'
     # )
+    huggingface_parser.add_argument(
+        '--git-mirror',
+        dest='git_mirror',
+        metavar='DIR',
+        type=dir_create,
+        default=None,
+        help='The directory to keep blobless git mirrors of the models in. '
+        'If set, commit signatures are read from the mirrors and checked '
+        'locally with gpg instead of scraping the commit pages.'
+    )
+    hf_token_group = huggingface_parser.add_argument_group(
+        'HuggingFace Tokens',
+        'Pass the Hugging Face API token used to mirror private or gated '
+        'models. This can be passed as an argument or read from a file. Only '
+        'one of these options can be used.')
+    hf_me_group = hf_token_group.add_mutually_exclusive_group()
+    hf_me_group.add_argument(
+        '--token',
+        dest='token',
+        metavar='TOKEN',
+        type=str,
+        default=None,
+        help='The Hugging Face API token.'
+    )
+    hf_me_group.add_argument(
+        '--token-path',
+        dest='token_path',
+        metavar='FILE',
+        type=path_exists,
+        default=None,
+        help='The path to the file containing the Hugging Face API token.'
+    )
 
 
 def add_pypi_args(registry_parser):
@@ -100,6 +132,26 @@ def add_maven_args(registry_parser):
         type=dir_create,
         help='The path to the directory to download files to.'
     )
+    maven_parser.add_argument(
+        '--workers',
+        '-w',
+        dest='workers',
+        metavar='N',
+        type=int,
+        default=1,
+        help='The number of worker processes that list, download and check '
+        'versions. The main process writes all results to the database. '
+        'Defaults to 1, which checks the versions in the main process.'
+    )
+    maven_parser.add_argument(
+        '--from-index',
+        dest='from_index',
+        action='store_true',
+        help='Take the files of each version and whether they are signed '
+        'from the index imported with "maven-index import" instead of the '
+        'directory listing. Only signed files are downloaded. Versions the '
+        'index does not list are still listed. Defaults to False.'
+    )
 
 
 def add_arguments(top_parser):
@@ -144,6 +196,13 @@ def add_arguments(top_parser):
         action='store_true',
         help='Clean the adoption data before starting. Defaults to False.'
     )
+    parser.add_argument(
+        '--changed-only',
+        dest='changed_only',
+        action='store_true',
+        help='Only check the versions added or changed by the last '
+        '"packages --refresh" run. Defaults to False.'
+    )
 
     # Give the parser a stage class to use
     parser.set_defaults(stage=Adoption)
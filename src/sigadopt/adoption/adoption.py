@@ -4,7 +4,10 @@ registries.
 '''
 
 # Imports
+import time
 import logging
+from datetime import datetime, timezone
+from sigadopt.util import http
 from sigadopt.util.database import connect_db, init_db, clean_db, Registry, \
     CleanLevel
 from sigadopt.util.stage import Stage
@@ -39,7 +42,11 @@ class Adoption(Stage):
         huggingface_adoption(
             self.database,
             self.args.start,
-            self.args.stop
+            self.args.stop,
+            changed_only=self.args.changed_only,
+            git_mirror=self.args.git_mirror,
+            token_path=self.args.token_path,
+            token=self.args.token,
         )
 
     def docker(self):
@@ -51,7 +58,8 @@ class Adoption(Stage):
         docker_adoption(
             self.database,
             self.args.start,
-            self.args.stop
+            self.args.stop,
+            changed_only=self.args.changed_only,
         )
 
     def maven(self):
@@ -64,7 +72,10 @@ class Adoption(Stage):
             self.database,
             self.args.download_dir,
             self.args.start,
-            self.args.stop
+            self.args.stop,
+            changed_only=self.args.changed_only,
+            workers=self.args.workers,
+            from_index=self.args.from_index,
         )
 
     def pypi(self):
@@ -77,9 +88,58 @@ class Adoption(Stage):
             self.database,
             self.args.download_dir,
             self.args.start,
-            self.args.stop
+            self.args.stop,
+            changed_only=self.args.changed_only,
         )
 
+    def checked(self):
+        '''
+        This function counts the checked artifacts of the registry.
+
+        returns: The number of sig_check rows for the registry.
+        '''
+        with self.database:
+            return self.database.execute(
+                '''
+                SELECT COUNT(*)
+                FROM sig_check s
+                JOIN artifacts a ON s.artifact_id = a.id
+                JOIN versions v ON a.version_id = v.id
+                JOIN packages p ON v.package_id = p.id
+                WHERE p.registry_id = ?;
+                ''',
+                (self.args.registry_id,)
+            ).fetchone()[0]
+
+    def record_throughput(self, started, seconds, checked, counters):
+        '''
+        This function records the throughput of this run so later estimates
+        can project the wall time of a run.
+
+        started: The UTC time the run started.
+        seconds: The wall time of the run.
+        checked: The number of checked artifacts before the run.
+        counters: The network counters before the run.
+        '''
+        now = http.counters()
+        with self.database:
+            self.database.execute(
+                '''
+                INSERT INTO throughput (registry_id, started, seconds,
+                    workers, artifacts, requests, bytes)
+                VALUES (?, ?, ?, ?, ?, ?, ?);
+                ''',
+                (
+                    self.args.registry_id,
+                    started.strftime('%Y-%m-%d %H:%M:%S'),
+                    seconds,
+                    getattr(self.args, 'workers', 1),
+                    self.checked() - checked,
+                    now['requests'] - counters['requests'],
+                    now['bytes'] - counters['bytes'],
+                )
+            )
+
     def run(self):
         '''
         This function runs the stage.
@@ -113,7 +173,13 @@ class Adoption(Stage):
             Registry.PYPI: self.pypi,
         }
         reg_func = reg_func[self.args.registry_id]
+        started = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        checked = self.checked()
+        counters = http.counters()
         reg_func()
+        self.record_throughput(
+            started, time.perf_counter() - start, checked, counters)
 
         # Close the databases
         self.log.info('Adoption stage complete. Closing database.')
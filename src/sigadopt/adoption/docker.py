@@ -7,11 +7,16 @@ Docker Hub.
 import json
 import subprocess
 import logging
+from sigadopt.util import http, ratelimit
 from sigadopt.util.database import Registry, SignatureStatus
 
 # Set up logging
 log = logging.getLogger(__name__)
 
+# Base url of a server that returns docker trust inspect output as JSON. If
+# None, the docker command line tool is used.
+TRUST_URL = None
+
 
 def get_signatures(package_name):
     '''
@@ -21,20 +26,30 @@ def get_signatures(package_name):
 
     returns: the output of the docker trust inspect command.
     '''
+    # Use the trust server if one is set
+    if TRUST_URL:
+        response = http.get(TRUST_URL + package_name)
+        if response.status_code != 200:
+            return [], f'Failed to get trust data for {package_name}.'
+        return response.json(), ''
+
     # Check to see if package has signatures
-    output = subprocess.run(
-        [
-            "docker",
-            "trust",
-            "inspect",
-            f"{package_name}",
-        ],
-        capture_output=True)
+    with ratelimit.limiter.limit('notary.docker.io') as slot:
+        output = subprocess.run(
+            [
+                "docker",
+                "trust",
+                "inspect",
+                f"{package_name}",
+            ],
+            capture_output=True)
+        if b'toomanyrequests' in output.stderr:
+            slot.status = 429
 
     return json.loads(output.stdout), output.stderr.decode("utf-8")
 
 
-def get_versions(database, start, stop):
+def get_versions(database, start, stop, changed_only=False):
     '''
     This function gets a list of all versions in the start stop range for the
     selected registry.
@@ -42,6 +57,8 @@ def get_versions(database, start, stop):
     database: the database to use.
     start: the start index.
     stop: the stop index.
+    changed_only: whether to only get the versions added or changed by the
+    last refresh.
 
     returns: A list of all versions in the start stop range in the selected
     registry. (p.id, p.name, v.id, v.name)
@@ -59,9 +76,10 @@ def get_versions(database, start, stop):
             SELECT p.id, p.name, v.id, v.name
             FROM packages p
             JOIN versions v ON p.id = v.package_id
-            WHERE registry_id = ?;
+            WHERE registry_id = ?
+            AND (? = 0 OR v.id IN (SELECT version_id FROM changed_versions));
             ''',
-            (Registry.DOCKER,)
+            (Registry.DOCKER, changed_only)
         )
 
         # Fetch the data
@@ -75,7 +93,30 @@ def get_versions(database, start, stop):
     return versions
 
 
-def adoption(database, start, stop, batch_size=50):
+def already_artifacted(database, version_id):
+    '''
+    This function checks if we already have artifacts for a version. A
+    version a refresh only changed the date of keeps the tag it was checked
+    for, so it is not checked again.
+
+    database: the database to use.
+    version_id: the version id to check.
+
+    returns: True if this version already has artifacts, False otherwise.
+    '''
+    with database:
+        count = database.execute(
+            '''
+            SELECT COUNT(*)
+            FROM artifacts
+            WHERE version_id = ?
+            ''',
+            (version_id,)
+        ).fetchone()[0]
+    return count > 0
+
+
+def adoption(database, start, stop, batch_size=50, changed_only=False):
     '''
     This function checks the adoption of signatures for packages from Hugging
     Face.
@@ -84,17 +125,22 @@ def adoption(database, start, stop, batch_size=50):
     start: the start index.
     stop: the stop index.
     batch_size: the number of packages to process at once.
+    changed_only: whether to only check the versions added or changed by the
+    last refresh.
     '''
 
     # Get the packages
     log.info('Getting versions from the database.')
-    versions = get_versions(database, start, stop)
+    versions = get_versions(database, start, stop, changed_only)
     log.info(f'Selected {len(versions)} versions.')
 
     # Create a dictionary for the packages
     packages = {}
     for version in versions:
         pid, pname, vid, vname = version
+        if already_artifacted(database, vid):
+            log.debug(f'Already have artifacts for {pname} {vname}.')
+            continue
         if pid not in packages:
             packages[pid] = {
                 'name': pname,
@@ -4,14 +4,22 @@ Hugging Face.
 '''
 
 # Import statements
-import requests
 import logging
+import tempfile
+from pathlib import Path
 from bs4 import BeautifulSoup
+from sigadopt.util import http
+from sigadopt.util.files import remove_file
+from sigadopt.util.gitmirror import sync, signature
+from sigadopt.util.pgp import list_packets, get_key, verify, parse_verify
 from sigadopt.util.database import SignatureStatus, Registry
 
 # Create a logger
 log = logging.getLogger(__name__)
 
+# Base url for Hugging Face
+HF_URL = 'https://huggingface.co/'
+
 
 def get_commits_page(name, page=0):
     '''
@@ -20,8 +28,8 @@ def get_commits_page(name, page=0):
     name: the name of the package.
     page: the page number.
     '''
-    url = f'https://huggingface.co/{name}/commits/main?p={page}'
-    r = requests.get(url)
+    url = f'{HF_URL}{name}/commits/main?p={page}'
+    r = http.get(url, cached=True)
 
     if not r:
         log.error(f'Failed to get commits for {name} page {page}.')
@@ -78,7 +86,98 @@ def get_commit_data(name):
     return commit_data
 
 
-def get_versions(database, start, stop):
+def check_commit(repo, commit_id, work_dir):
+    '''
+    Check the embedded signature of a commit from a git mirror with gpg.
+
+    repo: the git.Repo of the mirror.
+    commit_id: the full id of the commit.
+    work_dir: the directory to write the payload and signature to.
+
+    returns: (status, signature, verify output, packets, key output,
+    keyserver, signature type) where everything but the status is None for
+    unsigned commits.
+    '''
+    found = signature(repo, commit_id)
+    if found is None:
+        log.debug(f'Commit {commit_id} is not in the mirror.')
+        return SignatureStatus.NO_SIG, None, None, None, None, None, None
+    sig, payload, sig_type = found
+    if sig is None:
+        return SignatureStatus.NO_SIG, None, None, None, None, None, None
+
+    # SSH and X.509 signatures can not be checked with gpg
+    if sig_type != 'PGP':
+        return SignatureStatus.OTHER, sig, None, None, None, None, sig_type
+
+    # Write the signed payload and the signature next to each other
+    payload_path = work_dir / commit_id
+    sig_path = work_dir / (commit_id + '.asc')
+    payload_path.write_bytes(payload)
+    sig_path.write_bytes(sig)
+
+    try:
+        # List packets and get the public key if we can find it
+        packets = list_packets(sig_path)
+        keyserver, key_output = get_key(packets[3])
+        if not keyserver:
+            return SignatureStatus.NO_PUB, sig, None, packets, key_output, \
+                None, sig_type
+
+        # Check the signature
+        verify_output = verify(payload_path, sig_path)
+        return parse_verify(verify_output), sig, verify_output, packets, \
+            key_output, keyserver, sig_type
+    finally:
+        remove_file(payload_path)
+        remove_file(sig_path)
+
+
+def get_mirror_data(name, versions, git_mirror, token, work_dir):
+    '''
+    Get the signature status of the versions of a package from a blobless git
+    mirror of its repository.
+
+    name: the name of the package.
+    versions: the (id, name) of the versions to check.
+    git_mirror: the directory holding the git mirrors.
+    token: the Hugging Face API token, or None.
+    work_dir: the directory to write payloads and signatures to.
+
+    returns: a list of artifacts, or None if the mirror could not be updated.
+    '''
+    log.debug(f'Syncing the git mirror of {name}.')
+    try:
+        repo = sync(git_mirror, name, token)
+    except Exception as e:
+        log.error(f'Failed to sync the git mirror of {name}.')
+        log.debug(e)
+        return None
+
+    artifacts = []
+    with repo:
+        for vid, vname in versions:
+            status, sig, output, packets, key_output, keyserver, \
+                sig_type = check_commit(repo, vname, work_dir)
+            artifacts.append(
+                [
+                    vid,
+                    vname,
+                    'GCS',
+                    sig is not None,
+                    status,
+                    sig,
+                    output,
+                    packets,
+                    key_output,
+                    keyserver,
+                    sig_type,
+                ]
+            )
+    return artifacts
+
+
+def get_versions(database, start, stop, changed_only=False):
     '''
     This function gets a list of all versions in the start stop range for the
     selected registry.
@@ -86,6 +185,8 @@ def get_versions(database, start, stop):
     database: the database to use.
     start: the start index.
     stop: the stop index.
+    changed_only: whether to only get the versions added or changed by the
+    last refresh.
 
     returns: A list of all versions in the start stop range in the selected
     registry. (p.id, p.name, v.id, v.name)
@@ -103,9 +204,10 @@ def get_versions(database, start, stop):
             SELECT p.id, p.name, v.id, v.name
             FROM packages p
             JOIN versions v ON p.id = v.package_id
-            WHERE registry_id = ?;
+            WHERE registry_id = ?
+            AND (? = 0 OR v.id IN (SELECT version_id FROM changed_versions));
             ''',
-            (Registry.HUGGINGFACE,)
+            (Registry.HUGGINGFACE, changed_only)
         )
 
         # Fetch the data
@@ -147,7 +249,37 @@ def already_processed(database, pid):
     return processed
 
 
-def adoption(database, start, stop, batch_size=50):
+def already_artifacted(database, version_id):
+    '''
+    This function checks if we already have artifacts for a version.
+
+    database: the database to use.
+    version_id: the version id to check.
+
+    returns: True if this version already has artifacts, False otherwise.
+    '''
+    with database:
+        count = database.execute(
+            '''
+            SELECT COUNT(*)
+            FROM artifacts
+            WHERE version_id = ?
+            ''',
+            (version_id,)
+        ).fetchone()[0]
+    return count > 0
+
+
+def adoption(
+    database,
+    start,
+    stop,
+    batch_size=50,
+    changed_only=False,
+    git_mirror=None,
+    token_path=None,
+    token=None,
+):
     '''
     This function checks the adoption of signatures for packages from Hugging
     Face.
@@ -156,17 +288,36 @@ def adoption(database, start, stop, batch_size=50):
     start: the start index.
     stop: the stop index.
     batch_size: the number of packages to process at once.
+    changed_only: whether to only check the versions added or changed by the
+    last refresh. A refresh adds commits to models that were already checked,
+    so versions are then skipped one by one instead of by model.
+    git_mirror: the directory holding blobless git mirrors of the models. If
+    set, signatures are read from the commit objects and checked locally
+    instead of scraping the commit pages.
+    token_path: the path to the file containing the Hugging Face API token.
+    token: the Hugging Face API token. If this is provided, token_path is
+    ignored.
     '''
 
+    # Read in token for git mirrors of private or gated models
+    hf_token = token
+    if hf_token is None and token_path:
+        log.debug('Reading in token for Hugging Face.')
+        with open(token_path, 'r') as f:
+            hf_token = f.read().strip()
+
     # Get the packages
     log.info('Getting versions from the database.')
-    versions = get_versions(database, start, stop)
+    versions = get_versions(database, start, stop, changed_only)
     log.info(f'Selected {len(versions)} versions.')
 
     # Create a dictionary for the packages
     packages = {}
     for version in versions:
         pid, pname, vid, vname = version
+        if changed_only and already_artifacted(database, vid):
+            log.debug(f'Already have artifacts for {pname} {vname}.')
+            continue
         if pid not in packages:
             packages[pid] = {
                 'name': pname,
@@ -181,54 +332,115 @@ def adoption(database, start, stop, batch_size=50):
     ]
     log.info(f'Split packages into {len(pid_batches)} batches.')
 
-    # Iterate over the batches
-    for indx, batch in enumerate(pid_batches):
-
-        log.info(f'Processing batch {indx+1}/{len(pid_batches)}.')
-
-        artifacts = []
-
-        # Iterate over the packages
-        for pid in batch:
-
-            # Check if the package is in the database
-            if already_processed(database, pid):
-                log.debug(f'Package {pid} already processed.')
-                continue
-
-            # Get commit data
-            commit_data = get_commit_data(packages[pid]['name'])
-
-            # Iterate over the versions and match the commits
-            for vid, vname in packages[pid]['versions']:
-                status = commit_data.get(vname[:7], SignatureStatus.NO_SIG)
-                artifacts.append(
-                    [
-                        vid,
-                        vname,
-                        'GCS',
-                        status != SignatureStatus.NO_SIG,
-                        status,
-                    ]
-                )
-
-        # Insert the things
-        with database:
-            curr = database.cursor()
-
-            for artifact in artifacts:
-                curr.execute(
-                    '''
-                    INSERT INTO artifacts (version_id, name, type, has_sig)
-                    VALUES (?, ?, ?, ?);
-                    ''',
-                    artifact[:4]
-                )
-                artifact_id = curr.lastrowid
-                curr.execute(
-                    '''
-                    INSERT INTO sig_check (artifact_id, status)
-                    VALUES (?, ?);
-                    ''',
-                    (artifact_id, artifact[4])
-                )
+    # Payloads and signatures are written here to be checked
+    work_dir = None
+    if git_mirror:
+        work_dir = tempfile.TemporaryDirectory(prefix='sigadopt-hf-')
+
+    try:
+        # Iterate over the batches
+        for indx, batch in enumerate(pid_batches):
+
+            log.info(f'Processing batch {indx+1}/{len(pid_batches)}.')
+
+            artifacts = []
+
+            # Iterate over the packages
+            for pid in batch:
+
+                # Check if the package is in the database
+                if not changed_only and already_processed(database, pid):
+                    log.debug(f'Package {pid} already processed.')
+                    continue
+
+                # Check the commits locally from the git mirror
+                if git_mirror:
+                    mirror_artifacts = get_mirror_data(
+                        packages[pid]['name'],
+                        packages[pid]['versions'],
+                        git_mirror,
+                        hf_token,
+                        Path(work_dir.name),
+                    )
+                    if mirror_artifacts is not None:
+                        artifacts.extend(mirror_artifacts)
+                    continue
+
+                # Get commit data
+                commit_data = get_commit_data(packages[pid]['name'])
+
+                # Iterate over the versions and match the commits
+                for vid, vname in packages[pid]['versions']:
+                    status = commit_data.get(vname[:7], SignatureStatus.NO_SIG)
+                    artifacts.append(
+                        [
+                            vid,
+                            vname,
+                            'GCS',
+                            status != SignatureStatus.NO_SIG,
+                            status,
+                            None,
+                            None,
+                            None,
+                            None,
+                            None,
+                            None,
+                        ]
+                    )
+
+            # Insert the things
+            with database:
+                curr = database.cursor()
+
+                for artifact in artifacts:
+                    curr.execute(
+                        '''
+                        INSERT INTO artifacts (version_id, name, type, has_sig)
+                        VALUES (?, ?, ?, ?);
+                        ''',
+                        artifact[:4]
+                    )
+                    artifact_id = curr.lastrowid
+                    curr.execute(
+                        '''
+                        INSERT INTO sig_check (artifact_id, status, raw)
+                        VALUES (?, ?, ?);
+                        ''',
+                        (artifact_id, artifact[4], artifact[6])
+                    )
+
+                    # Signatures read from a git mirror are kept with their
+                    # packets and keys
+                    if artifact[5] is None:
+                        continue
+                    curr.execute(
+                        '''
+                        INSERT INTO signatures (artifact_id, type, raw)
+                        VALUES (?, ?, ?);
+                        ''',
+                        (artifact_id, artifact[10], artifact[5])
+                    )
+                    if artifact[7] is None:
+                        continue
+                    curr.execute(
+                        '''
+                        INSERT INTO list_packets
+                        (signature_id, algo, digest_algo, data, key_id,
+                        created, expires, raw)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+                        ''',
+                        (curr.lastrowid,) + artifact[7]
+                    )
+                    if artifact[7][3] is None:
+                        continue
+                    curr.execute(
+                        '''
+                        INSERT OR IGNORE INTO pgp_keys (key_id, keyserver, raw)
+                        VALUES (?, ?, ?);
+                        ''',
+                        (artifact[7][3], artifact[9], artifact[8])
+                    )
+    finally:
+        # Remove the work directory
+        if work_dir is not None:
+            work_dir.cleanup()
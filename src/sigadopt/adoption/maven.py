@@ -4,18 +4,44 @@ Maven Central.
 '''
 
 # Imports
-import requests
+import os
+import re
+import html
+import shutil
+import signal
 import logging
-from bs4 import BeautifulSoup
+import threading
+import multiprocessing
+from pathlib import Path
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from sigadopt.util import http, pgp, ratelimit
 from sigadopt.util.files import download_file, remove_file
-from sigadopt.util.database import SignatureStatus, Registry
+from sigadopt.util.database import SignatureStatus, Registry, get_progress
 from sigadopt.util.pgp import list_packets, get_key, verify, parse_verify
+from sigadopt.mavenindex.nexus import TIMESTAMP_KEY
 
 # Create a logger
 log = logging.getLogger(__name__)
 
+# Base url for Maven Central
+MAVEN_URL = 'https://repo1.maven.org/maven2/'
 
-def get_versions(database, start, stop):
+# Link targets in a directory listing, with the href quoted or not. The
+# attribute must not be the end of another name such as data-href.
+HREF = re.compile(
+    r'''<a\s[^>]*?(?<![\w-])href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''',
+    re.IGNORECASE
+)
+
+# Comments in a directory listing, which may hold links that are not shown
+COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+
+# Directory a worker process downloads files to, set by init_worker()
+worker_dir = None
+
+
+def get_versions(database, start, stop, changed_only=False):
     '''
     This function gets a list of all versions in the start stop range for
     the selected registry.
@@ -23,6 +49,8 @@ def get_versions(database, start, stop):
     database: the database to use.
     start: the start index.
     stop: the stop index.
+    changed_only: whether to only get the versions added or changed by the
+    last refresh.
 
     returns: A list of all versions in the start stop range in the selected
     registry.
@@ -41,9 +69,12 @@ def get_versions(database, start, stop):
                 SELECT p.id, p.name, v.id, v.name
                 FROM packages p
                 JOIN versions v ON p.id = v.package_id
-                WHERE registry_id = ?;
+                WHERE registry_id = ?
+                AND (? = 0 OR v.id IN (
+                    SELECT version_id FROM changed_versions
+                ));
             ''',
-            (Registry.MAVEN,)
+            (Registry.MAVEN, changed_only)
         )
 
         # Fetch the data
@@ -57,108 +88,339 @@ def get_versions(database, start, stop):
     return versions
 
 
-def insert_artifacts(database, artifacts):
+def get_files(version_url):
+    '''
+    This function gets the files for a package from Maven Central.
+
+    version_url: the URL for the package version.
+
+    returns: the files for the package and corresponding extensions.
+    '''
+
+    # Get the html from the given url, revalidating any cached listing
+    response = http.get(version_url, cached=True)
+
+    # Check to see if we got a response
+    if not response:
+        log.warning(f'Failed to get files for {version_url}.')
+        return None
+
+    return parse_listing(response.text)
+
+
+def list_hrefs(text):
+    '''
+    This function extracts the link targets from a directory listing in one
+    pass of a regular expression, without building a parse tree. Comments
+    are removed first.
+
+    text: the html of the listing.
+
+    returns: the hrefs of the a tags, in listing order.
+    '''
+    return [
+        html.unescape(double or single or bare)
+        for double, single, bare in HREF.findall(COMMENT.sub('', text))
+    ]
+
+
+def group_files(names):
+    '''
+    This function groups file names into base files and their extensions,
+    such as foo.jar with .asc and .sha1. A name is a base file unless another
+    name is a prefix of it. Sorted, every name comes right after the base
+    file it starts with, so one pass over the sorted names finds the groups.
+    Base files and extensions are ordered by length, then by their position
+    in the listing.
+
+    names: the file names.
+
+    returns: a dictionary of base file to its list of extensions.
     '''
-    This function inserts an artifacts into the database.
+    groups = {}
+    base = None
+    for i in sorted(range(len(names)), key=names.__getitem__):
+        if base is None or not names[i].startswith(names[base]):
+            base = i
+            groups[base] = []
+        else:
+            groups[base].append(i)
+
+    def order(i):
+        return len(names[i]), i
+
+    return {
+        names[b]: [names[e][len(names[b]):] for e in sorted(exts, key=order)]
+        for b, exts in sorted(groups.items(), key=lambda g: order(g[0]))
+    }
+
+
+def parse_listing(text):
+    '''
+    This function gets the files of a version from its directory listing.
+
+    text: the html of the listing.
+
+    returns: the files and their extensions.
+    '''
+
+    # If the href includes a forward slash the entry is another sub-dir
+    return group_files([
+        href for href in list_hrefs(text) if href and '/' not in href
+    ])
+
+
+def index_timestamp(database):
+    '''
+    This function checks that the Maven Central index has been imported.
 
     database: the database to use.
-    artifacts: the artifacts to insert. Add the id to the end of each list.
+
+    returns: the time the imported index was published, or None if it is not
+    known. Exits if no index has been imported.
+    '''
+    with database:
+        imported = database.execute(
+            'SELECT EXISTS (SELECT 1 FROM maven_index);').fetchone()[0]
+        timestamp = get_progress(database, TIMESTAMP_KEY)
+    if not imported:
+        log.error('No Maven Central index has been imported. Run '
+                  '"maven-index import" first.')
+        exit(-1)
+    return timestamp
+
+
+def get_indexed_files(database, package_name, version_name):
     '''
+    This function gets the files of a version from the imported Maven Central
+    index instead of its directory listing. The index only records whether a
+    file is signed, so .asc is the only extension it gives. The pom of an
+    artifact that is not packaged as a pom is folded into the document of
+    the main file, so it is added with None as its extensions: whether it is
+    signed is not known.
 
+    database: the database to use.
+    package_name: the name of the package, as group:artifact.
+    version_name: the name of the version.
+
+    returns: the files and their extensions, or None if the index does not
+    list the version.
+    '''
     with database:
-        # Create the cursor
-        cursor = database.cursor()
+        rows = database.execute(
+            '''
+            SELECT suffix, has_sig
+            FROM maven_index
+            WHERE package_name = ? AND version_name = ?
+            ORDER BY suffix;
+            ''',
+            (package_name, version_name)
+        ).fetchall()
+    if not rows:
+        return None
 
-        # Insert the artifact
-        for a in artifacts:
-            cursor.execute(
-                '''
-                INSERT INTO artifacts
-                (version_id, name, type, has_sig, extensions)
-                VALUES (?, ?, ?, ?, ?)
-                ''',
-                a
-            )
-            a.append(cursor.lastrowid)
+    artifact = package_name.split(':')[1]
+    files = {
+        f'{artifact}-{version_name}{suffix}': ['.asc'] if has_sig else []
+        for suffix, has_sig in rows
+    }
+    files.setdefault(f'{artifact}-{version_name}.pom', None)
+    return files
 
 
-def insert_signatures(database, artifacts):
+def already_artifacted(database, version_id):
     '''
-    This function inserts signatures into the database.
+    This function checks if we already have artifacts for a version.
 
     database: the database to use.
-    artifacts: the artifacts to insert. Add the id to the end of each list.
+    version_id: the version id to check.
+
+    returns: True if this version already has artifacts, False otherwise.
     '''
 
+    # Assume we don't have artifacts
+    artifacted = False
+
     with database:
         # Create the cursor
         cursor = database.cursor()
 
-        # Insert the signature
-        for a in artifacts:
-            if not a[3]:
-                continue
-            cursor.execute(
-                '''
-                INSERT INTO signatures
-                (artifact_id, type, raw)
-                VALUES (?, ?, ?)
-                ''',
-                [a[5], 'PGP', a[6]]
-            )
-            a.append(cursor.lastrowid)
+        # Execute the query
+        cursor.execute(
+            '''
+            SELECT COUNT(*)
+            FROM artifacts
+            WHERE version_id = ?
+            ''',
+            (version_id,)
+        )
+
+        # Fetch the data
+        count = cursor.fetchone()[0]
+
+        # Return True if we have artifacts, False otherwise
+        artifacted = count > 0
+
+    return artifacted
 
 
-def check_artifacts(artifacts, download_path, database):
+def version_url(package_name, version_name):
     '''
-    This function checks the adoption of signatures for a file from Maven
+    This function builds the url of the directory of a version on Maven
     Central.
 
-    artifacts: the artifact to check.
-    download_path: the path to the directory to download files to.
-    database: the database to use.
+    package_name: the name of the package, as group:artifact.
+    version_name: the name of the version.
+
+    returns: the url of the version directory.
     '''
+    group, artifact = package_name.split(':')[:2]
+    return MAVEN_URL + f'{group.replace(".", "/")}/{artifact}/{version_name}'
 
-    all_checks = []
-    all_packets = []
-    all_keys = {}
 
-    # Iterate through the artifacts
-    for artifact in artifacts:
+def check_artifact(url, name, download_dir, probe=False):
+    '''
+    This function downloads a file and its signature and checks the
+    signature with gpg. The signature is downloaded first, so a file without
+    one is not downloaded.
+
+    url: the url of the version directory.
+    name: the name of the file.
+    download_dir: the directory to download the file and signature to.
+    probe: whether the file is not known to be signed, so a missing
+    signature is expected rather than an error.
+
+    returns: (status, signature, verify output, packets, key output,
+    keyserver) where the values that could not be found are None.
+    '''
+    file_path = download_dir / name
+    sig_path = download_dir / (name + '.asc')
+    try:
+        # Download the file-signature pair
+        if probe:
+            response = http.get(url + '/' + name + '.asc')
+            sig = None
+            if response is not None and response.status_code == 200:
+                sig = response.content
+                sig_path.write_bytes(sig)
+        else:
+            sig = download_file(url + '/' + name + '.asc', sig_path)
+        if not sig:
+            return SignatureStatus.NO_SIG, None, None, None, None, None
+        download_file(url + '/' + name, file_path)
+
+        # List packets and get the public key if we can find it
+        packets = list_packets(sig_path)
+        if packets[3] is None:
+            return SignatureStatus.NO_PUB, sig, None, packets, None, None
+        keyserver, key_output = get_key(packets[3])
+        if not keyserver:
+            return SignatureStatus.NO_PUB, sig, None, packets, key_output, \
+                None
 
-        # Check if we have a signature
-        if not artifact[3] or not artifact[6]:
-            all_checks.append((artifact[5], SignatureStatus.NO_SIG, None))
-            continue
+        # Check the signature
+        verify_output = verify(file_path, sig_path)
+        return parse_verify(verify_output), sig, verify_output, packets, \
+            key_output, keyserver
+    finally:
+        for path in (file_path, sig_path):
+            if path.exists():
+                remove_file(path)
 
-        # list packets
-        packets = list_packets(download_path / (artifact[1] + '.asc'))
-        all_packets.append((artifact[7],) + packets)
 
-        # Get the public key if we can find it
-        keyserver, key_output = get_key(packets[3])
-        if packets[3] not in all_keys:
-            all_keys[packets[3]] = (keyserver, key_output)
+def get_version_data(url, download_dir, files=None):
+    '''
+    This function lists the files of a version and checks the signature of
+    every signed file. It does not touch the database, so it can run in a
+    worker process.
+
+    url: the url of the version directory.
+    download_dir: the directory to download files to.
+    files: the files and their extensions if they are already known, such as
+    from the index. If None, they are taken from the directory listing. A
+    file whose extensions are None is checked for a signature.
+
+    returns: a list of artifacts, or None if the files could not be listed.
+    Each artifact is [name, has_sig, extensions, status, signature, verify
+    output, packets, key output, keyserver].
+    '''
+    if files is None:
+        files = get_files(url)
 
-        # Check if we have a key
-        if not keyserver:
-            all_checks.append((artifact[5], SignatureStatus.NO_PUB, None))
-            continue
+    # Check if we have any files
+    if not files:
+        return None
 
-        # Check the signature
-        verify_output = verify(
-            download_path / artifact[1],
-            download_path / (artifact[1] + '.asc')
-        )
+    artifacts = []
+    for name, extensions in files.items():
+        if extensions is None:
+            checked = check_artifact(url, name, download_dir, probe=True)
+            has_sig = checked[1] is not None
+            extensions = ['.asc'] if has_sig else []
+        elif '.asc' in extensions:
+            has_sig = True
+            checked = check_artifact(url, name, download_dir)
+        else:
+            has_sig = False
+            checked = (SignatureStatus.NO_SIG, None, None, None, None, None)
+        artifacts.append([name, has_sig, ';'.join(extensions), *checked])
+    return artifacts
+
+
+def write_versions(database, results):
+    '''
+    This function writes the artifacts, signatures, checks, packets and keys
+    of a batch of versions in one transaction.
 
-        # Parse the output
-        status = parse_verify(verify_output)
-        all_checks.append((artifact[5], status, verify_output))
+    database: the database to use.
+    results: a list of (version id, artifacts) as returned by
+    get_version_data.
+    '''
+    all_checks = []
+    all_packets = []
+    all_keys = {}
 
-    # Insert the things
     with database:
         cursor = database.cursor()
 
+        for version_id, artifacts in results:
+            for name, has_sig, extensions, status, sig, output, packets, \
+                    key_output, keyserver in artifacts:
+
+                # Insert the artifact
+                cursor.execute(
+                    '''
+                    INSERT INTO artifacts
+                    (version_id, name, type, has_sig, extensions)
+                    VALUES (?, ?, ?, ?, ?)
+                    ''',
+                    (version_id, name, 'file', int(has_sig), extensions)
+                )
+                artifact_id = cursor.lastrowid
+                all_checks.append((artifact_id, status, output))
+                if not has_sig:
+                    continue
+
+                # Insert the signature
+                cursor.execute(
+                    '''
+                    INSERT INTO signatures
+                    (artifact_id, type, raw)
+                    VALUES (?, ?, ?)
+                    ''',
+                    (artifact_id, 'PGP', sig)
+                )
+                if packets is None:
+                    continue
+                all_packets.append((cursor.lastrowid,) + tuple(packets))
+
+                # Keep the lookup that fetched a key over one that found it
+                # in the keyring, since workers finish in any order
+                if packets[3] is None:
+                    continue
+                if all_keys.get(packets[3], ('local',))[0] in ('local', None):
+                    all_keys[packets[3]] = (keyserver, key_output)
+
         # Insert the checks
         cursor.executemany(
             '''
@@ -183,168 +445,283 @@ def check_artifacts(artifacts, download_path, database):
         # Insert the keys
         cursor.executemany(
             '''
-            INSERT OR IGNORE INTO pgp_keys
+            INSERT INTO pgp_keys
             (key_id, keyserver, raw)
             VALUES (?, ?, ?)
+            ON CONFLICT (key_id) DO UPDATE SET
+                keyserver = excluded.keyserver,
+                raw = excluded.raw
+            WHERE IFNULL(pgp_keys.keyserver, 'local') = 'local'
+            AND excluded.keyserver != 'local'
             ''',
             [(k, v[0], v[1]) for k, v in all_keys.items()]
         )
 
 
-def get_files(version_url):
+def init_worker(download_dir, keyservers, rate_limit_settings, http_settings,
+                log_queue, log_level):
     '''
-    This function gets the files for a package from Maven Central.
-
-    version_url: the URL for the package version.
-
-    returns: the files for the package and corresponding extensions.
+    This function sets up a worker process for parallel adoption. Workers log
+    through the queue of the main process, share its rate limits through the
+    state file and ignore SIGINT, so the main process decides how to shut
+    down.
+
+    download_dir: the directory to create the worker's download directory in.
+    keyservers: the keyservers to look keys up on.
+    rate_limit_settings: the keyword arguments for ratelimit.configure, with
+    the state file shared by all workers.
+    http_settings: the keyword arguments for http.configure.
+    log_queue: the queue the main process reads log records from.
+    log_level: the lowest level any log handler of the main process takes.
     '''
+    global worker_dir
 
-    # Get the html from the given url
-    response = requests.get(version_url)
-
-    # Check to see if we got a response
-    if not response:
-        log.warning(f'Failed to get files for {version_url}.')
-        return None
-
-    files = []
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.root.handlers[:] = [QueueHandler(log_queue)]
+    logging.root.setLevel(log_level)
 
-    # Find all a tags - this is where the files are
-    soup = BeautifulSoup(response.text, "html.parser")
-    for a_tag in soup.find_all("a"):
+    pgp.keyservers[:] = keyservers
+    ratelimit.configure(**rate_limit_settings)
+    http.configure(**http_settings)
 
-        # if the href includes a forward slash the entry is another sub-dir
-        href = a_tag.get("href")
-        if '/' not in href:
-            files.append(href)
+    worker_dir = Path(download_dir) / f'worker-{os.getpid()}'
+    worker_dir.mkdir(parents=True, exist_ok=True)
 
-    # Sort the files by length
-    file_names = sorted(files, key=len)
 
-    file_extensions = {}
-
-    # Iterate through the files and get the extensions
-    while len(file_names) > 0:
-        temp = file_names.pop(0)
-        extensions = [f for f in file_names if f.startswith(temp)]
-        file_names = [f for f in file_names if f not in extensions]
-        file_extensions[temp] = [f[len(temp):] for f in extensions]
-
-    # Return the files and extensions
-    return file_extensions
-
-
-def already_artifacted(database, version_id):
+def check_version(url, files):
     '''
-    This function checks if we already have artifacts for a version.
+    This function checks a version in a worker process.
 
-    database: the database to use.
-    version_id: the version id to check.
+    url: the url of the version directory.
+    files: the files of the version, or None to list them.
 
-    returns: True if this version already has artifacts, False otherwise.
+    returns: (artifacts, requests, bytes) where artifacts is the result of
+    get_version_data, and requests and bytes are what the worker sent and
+    received for it.
     '''
+    before = http.counters()
+    artifacts = get_version_data(url, worker_dir, files)
+    after = http.counters()
+    return artifacts, after['requests'] - before['requests'], \
+        after['bytes'] - before['bytes']
 
-    # Assume we don't have artifacts
-    artifacted = False
-
-    with database:
-        # Create the cursor
-        cursor = database.cursor()
 
-        # Execute the query
-        cursor.execute(
-            '''
-            SELECT COUNT(*)
-            FROM artifacts
-            WHERE version_id = ?
-            ''',
-            (version_id,)
-        )
+def check_serial(versions, download_dir, stopping):
+    '''
+    This function checks versions one at a time in this process.
 
-        # Fetch the data
-        count = cursor.fetchone()[0]
+    versions: a list of (version id, label, url, files) to check.
+    download_dir: the directory to download files to.
+    stopping: an event that is set when no new versions should be started.
 
-        # Return True if we have artifacts, False otherwise
-        artifacted = count > 0
+    returns: a generator of (version id, label, artifacts).
+    '''
+    for indx, (version_id, label, url, files) in enumerate(versions):
+        if stopping.is_set():
+            return
+        log.info(f'Processing version {indx} of {len(versions)}.')
+        yield version_id, label, get_version_data(url, download_dir, files)
 
-    return artifacted
 
+def check_parallel(versions, download_dir, workers, stopping):
+    '''
+    This function checks versions in a pool of worker processes, keeping a
+    bounded number of versions in flight. Once stopping is set no new
+    versions are started, the queued versions are cancelled and the versions
+    already running are finished.
+
+    versions: a list of (version id, label, url, files) to check.
+    download_dir: the directory the worker download directories are created
+    in.
+    workers: the number of worker processes.
+    stopping: an event that is set when no new versions should be started.
+
+    returns: a generator of (version id, label, artifacts) in the order the
+    versions finish.
+    '''
 
-def adoption(database, download_dir, start, stop):
+    # Workers share one rate limit state file so the limits hold across them
+    state_path = ratelimit.limiter.state_path
+    own_state = state_path is None
+    if own_state:
+        state_path = Path(download_dir) / f'ratelimit-{os.getpid()}.json'
+
+    # Workers are forked from a clean server process that has imported this
+    # module once, so they start fast and share no connections with this one
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+
+    # Workers log through the handlers of this process
+    log_queue = context.Queue()
+    listener = QueueListener(
+        log_queue, *logging.root.handlers, respect_handler_level=True)
+    listener.start()
+    log_level = min(
+        [h.level for h in logging.root.handlers] or [logging.INFO])
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=init_worker,
+        initargs=(
+            download_dir,
+            list(pgp.keyservers),
+            {**ratelimit.settings(), 'state_path': state_path},
+            http.settings(),
+            log_queue,
+            log_level,
+        ),
+    )
+    log.info(f'Checking versions with {workers} worker processes.')
+
+    def finished(future):
+        version_id, label = pending.pop(future)
+        try:
+            artifacts, requests, size = future.result()
+        except Exception as e:
+            log.warning(f'Failed to check {label}.')
+            log.debug(e)
+            return None
+        http.count(requests, size)
+        return version_id, label, artifacts
+
+    pending = {}
+    queued = iter(versions)
+    cancelled = False
+    try:
+        while True:
+            if not stopping.is_set():
+                for version_id, label, url, files in queued:
+                    future = pool.submit(check_version, url, files)
+                    pending[future] = (version_id, label)
+                    if len(pending) >= workers * 2:
+                        break
+            elif not cancelled:
+                cancelled = True
+                for future in list(pending):
+                    if future.cancel():
+                        pending.pop(future)
+                log.info(f'Finishing {len(pending)} versions in flight.')
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = finished(future)
+                if result is not None:
+                    yield result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        listener.stop()
+        for path in Path(download_dir).glob('worker-*'):
+            shutil.rmtree(path, ignore_errors=True)
+        if own_state:
+            state_path.unlink(missing_ok=True)
+
+
+def adoption(
+    database,
+    download_dir,
+    start,
+    stop,
+    changed_only=False,
+    workers=1,
+    from_index=False,
+    batch_size=50,
+):
     '''
     This function checks the adoption of signatures for packages from Maven
-    Central.
+    Central. Versions are checked in this process or, with more than one
+    worker, in a pool of worker processes that do the network and gpg work.
+    This process is the only writer and writes the results in batches.
 
     database: the database to use.
     download_dir: the path to the directory to download files to.
     start: the start index.
     stop: the stop index.
+    changed_only: whether to only check the versions added or changed by the
+    last refresh.
+    workers: the number of worker processes. 1 checks the versions in this
+    process.
+    from_index: whether to take the files of each version from the imported
+    Maven Central index. Versions the index does not list are still listed.
+    batch_size: the number of versions written per transaction.
+
+    On SIGINT no new versions are started, the versions in flight are
+    finished and written, and then KeyboardInterrupt is raised. A second
+    SIGINT stops at once.
     '''
     # Get a list of all versions for the registry
     log.info('Getting list of all versions for the registry.')
-    versions = get_versions(database, start, stop)
+    versions = get_versions(database, start, stop, changed_only)
     num_selected = len(versions)
     log.info(f'Selected {num_selected} versions for the registry.')
 
-    # Loop through the versions
-    for indx, version in enumerate(versions):
-        log.info(f'Processing version {indx} of {num_selected}.')
+    if from_index:
+        timestamp = index_timestamp(database)
+        log.info('Using the Maven Central index published '
+                 f'{timestamp or "at an unknown time"}.')
 
-        # Check if we have any artifacts already for this version
+    # Skip the versions we already have artifacts for
+    todo = []
+    unindexed = 0
+    for version in versions:
         if already_artifacted(database, version[2]):
             log.debug(f'Already have artifacts for {version[1]} {version[3]}.')
             continue
-
-        # Get all artifacts for the version
-        version_url = 'https://repo1.maven.org/maven2/' + \
-            f'{version[1].split(":")[0].replace(".", "/")}/' + \
-            f'{version[1].split(":")[1]}/' + \
-            f'{version[3]}'
-        files = get_files(version_url)
-
-        # Check if we have any files
-        if not files:
-            log.warning(f'Skipping {version[1]} {version[3]} due to no files.')
-            continue
-
-        # create the artifact list
-        artifacts = [
-            [
-                version[2],
-                file,
-                'file',
-                1 if '.asc' in extensions else 0,
-                ';'.join(extensions)
-            ] for file, extensions in files.items()
-        ]
-
-        # Insert the artifacts into the database
-        insert_artifacts(database, artifacts)
-
-        # Download all file-signature pairs
-        for artifact in artifacts:
-            if not artifact[3]:
-                continue
-            download_file(
-                version_url + '/' + artifact[1],
-                download_dir / artifact[1]
-            )
-            sig_binary = download_file(
-                version_url + '/' + artifact[1] + '.asc',
-                download_dir / (artifact[1] + '.asc')
-            )
-            artifact.append(sig_binary)
-
-        # Insert the signatures
-        insert_signatures(database, artifacts)
-
-        # Check signatures for each artifact
-        check_artifacts(artifacts, download_dir, database)
-
-        # Remove the files
-        for artifact in artifacts:
-            if not artifact[3]:
+        files = None
+        if from_index:
+            files = get_indexed_files(database, version[1], version[3])
+            unindexed += files is None
+        todo.append((
+            version[2],
+            f'{version[1]} {version[3]}',
+            version_url(version[1], version[3]),
+            files,
+        ))
+    log.info(f'Checking {len(todo)} versions without artifacts.')
+    if from_index:
+        log.info(f'{unindexed} versions are not in the index and will be '
+                 'listed.')
+
+    # The first SIGINT only stops new versions from starting, wherever it
+    # lands, so the versions in flight are still written
+    stopping = threading.Event()
+
+    def interrupt(signum, frame):
+        log.warning('Interrupted. Writing the versions in flight.')
+        stopping.set()
+        signal.signal(signal.SIGINT, previous)
+
+    previous = signal.getsignal(signal.SIGINT)
+    signal.signal(signal.SIGINT, interrupt)
+
+    if workers > 1:
+        checked = check_parallel(todo, download_dir, workers, stopping)
+    else:
+        checked = check_serial(todo, download_dir, stopping)
+
+    # Write the results in batches as they arrive
+    results = []
+    processed = 0
+    try:
+        for version_id, label, artifacts in checked:
+            if not artifacts:
+                log.warning(f'Skipping {label} due to no files.')
                 continue
-            remove_file(download_dir / artifact[1])
-            remove_file(download_dir / (artifact[1] + '.asc'))
+            results.append((version_id, artifacts))
+            if len(results) >= batch_size:
+                write_versions(database, results)
+                processed += len(results)
+                results = []
+                log.info(f'Wrote {processed} of {len(todo)} versions.')
+        write_versions(database, results)
+        processed += len(results)
+    finally:
+        checked.close()
+        signal.signal(signal.SIGINT, previous)
+    log.info(f'Finished writing {processed} of {len(todo)} versions.')
+
+    # Pass the interrupt on so the run is not taken as complete
+    if stopping.is_set():
+        raise KeyboardInterrupt
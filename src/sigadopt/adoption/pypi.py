@@ -12,6 +12,9 @@ from sigadopt.util.pgp import list_packets, get_key, verify, parse_verify
 # Create a logger
 log = logging.getLogger(__name__)
 
+# Base url for PyPI package files
+PYPI_URL = 'https://files.pythonhosted.org/packages/'
+
 
 def url_construction(digest: str, filename: str) -> str:
     '''
@@ -25,18 +28,22 @@ def url_construction(digest: str, filename: str) -> str:
     '''
 
     # Construct the url
-    prefix = "https://files.pythonhosted.org/packages/"
+    prefix = PYPI_URL
     hash_section = f"{digest[0:2]}/{digest[2:4]}/{digest[4:]}/"
     url = prefix + hash_section + filename
 
     return url
 
 
-def get_artifacts(database, start, stop):
+def get_artifacts(database, start, stop, changed_only=False):
     '''
     This function gets the artifacts for a version.
 
     database: the database to use.
+    start: the start artifact.
+    stop: the stop artifact.
+    changed_only: whether to only get the artifacts of the versions added or
+    changed by the last refresh.
 
     return: the artifacts for the version that have not been checked yet.
             id, version_id, name, type, has_sig, digest, date, extensions.
@@ -58,21 +65,24 @@ def get_artifacts(database, start, stop):
             JOIN packages p ON v.package_id = p.id
             WHERE p.registry_id = ?
             AND a.has_sig = 0
+            AND (? = 0 OR v.id IN (SELECT version_id FROM changed_versions))
             ''',
-            (SignatureStatus.NO_SIG, None, Registry.PYPI)
+            (SignatureStatus.NO_SIG, None, Registry.PYPI, changed_only)
         )
 
         # Find signed artifacts
         cursor.execute(
             '''
-            SELECT a.*
+            SELECT a.id, a.version_id, a.name, a.type, a.has_sig, a.digest,
+                a.date, a.extensions
             FROM artifacts a
             JOIN versions v ON a.version_id = v.id
             JOIN packages p ON v.package_id = p.id
             WHERE p.registry_id = ?
             AND a.has_sig = 1
+            AND (? = 0 OR v.id IN (SELECT version_id FROM changed_versions))
             ''',
-            (Registry.PYPI,)
+            (Registry.PYPI, changed_only)
         )
         artifacts = cursor.fetchall()
 
@@ -224,7 +234,14 @@ def already_checked(database, artifact_id):
     return checked
 
 
-def adoption(database, download_dir, start, stop, batch_size=25):
+def adoption(
+    database,
+    download_dir,
+    start,
+    stop,
+    batch_size=25,
+    changed_only=False,
+):
     '''
     This function checks the adoption of signatures for packages from PyPI.
 
@@ -233,11 +250,13 @@ def adoption(database, download_dir, start, stop, batch_size=25):
     start: the start artifact.
     stop: the stop artifact.
     batch_size: the number of artifacts to check at once.
+    changed_only: whether to only check the artifacts of the versions added
+    or changed by the last refresh.
     '''
 
     # Get artifacts for the version
     log.info('Getting artifacts for PyPI.')
-    artifacts = get_artifacts(database, start, stop)
+    artifacts = get_artifacts(database, start, stop, changed_only)
     num_selected = len(artifacts)
     log.info(f'Selected {num_selected} artifacts for the registry.')
 
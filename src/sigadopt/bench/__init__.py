@@ -0,0 +1,217 @@
+'''
+__init__.py: This is the __init__ file for the bench subpackage.
+'''
+
+# Imports
+from sigadopt.bench.bench import Bench
+from sigadopt.util.files import path_exists, path_create, dir_create
+from sigadopt.util.database import Registry
+from sigadopt.adoption.maven import MAVEN_URL
+
+
+def add_adoption(type_parser):
+    '''
+    This function adds the adoption benchmark subparser.
+
+    type_parser: The subparser for the stage.
+    '''
+
+    func_parser = type_parser.add_parser(
+        'adoption',
+        help='Benchmark the adoption stage against a local registry '
+        'stand-in server.'
+    )
+
+    # Set the function to use in the stage class
+    func_parser.set_defaults(type_func=Bench.adoption)
+
+    # Add type specific arguments
+    func_parser.add_argument(
+        'registries',
+        metavar='REGISTRY',
+        nargs='*',
+        type=lambda x: Registry[x.upper()],
+        help='The registries to benchmark. Defaults to all. '
+        f'Options: {",".join([r.name.lower() for r in Registry])}'
+    )
+    func_parser.add_argument(
+        '--fixtures',
+        '-f',
+        dest='fixtures',
+        metavar='DIR',
+        type=dir_create,
+        default=None,
+        help='The directory to keep the generated fixtures in. Fixtures are '
+        'generated on the first run and reused by runs with the same '
+        'fixture options. If not provided, fixtures are generated in a '
+        'temporary directory.'
+    )
+    func_parser.add_argument(
+        '--packages',
+        '-p',
+        dest='packages',
+        metavar='N',
+        type=int,
+        default=20,
+        help='The number of packages to generate per registry. Defaults to '
+        '20.'
+    )
+    func_parser.add_argument(
+        '--versions',
+        '-v',
+        dest='versions',
+        metavar='N',
+        type=int,
+        default=5,
+        help='The number of versions to generate per package. Defaults to 5.'
+    )
+    func_parser.add_argument(
+        '--file-size',
+        dest='file_size',
+        metavar='KIB',
+        type=int,
+        default=64,
+        help='The size of each generated file in KiB. Defaults to 64.'
+    )
+    func_parser.add_argument(
+        '--signed',
+        dest='signed',
+        metavar='FRACTION',
+        type=float,
+        default=0.8,
+        help='The fraction of versions that are signed. Defaults to 0.8.'
+    )
+    func_parser.add_argument(
+        '--seed',
+        dest='seed',
+        metavar='N',
+        type=int,
+        default=0,
+        help='The seed used to generate fixtures. Defaults to 0.'
+    )
+    func_parser.add_argument(
+        '--git-mirror',
+        dest='git_mirror',
+        action='store_true',
+        help='Benchmark Hugging Face adoption from blobless git mirrors of '
+        'the fixture repositories instead of the commit pages.'
+    )
+    func_parser.add_argument(
+        '--workers',
+        '-w',
+        dest='workers',
+        metavar='N',
+        type=int,
+        default=1,
+        help='The number of worker processes for Maven adoption. With more '
+        'than one, the per-step latencies only cover the main process. '
+        'Defaults to 1.'
+    )
+    func_parser.add_argument(
+        '--rate',
+        dest='rate',
+        metavar='REQUESTS',
+        type=float,
+        default=None,
+        help='The number of requests per second to limit the local server '
+        'to. Defaults to no limit.'
+    )
+    func_parser.add_argument(
+        '--from-index',
+        dest='from_index',
+        action='store_true',
+        help='Benchmark Maven adoption from the fixture repository index '
+        'instead of the directory listings.'
+    )
+    func_parser.add_argument(
+        '--json',
+        '-j',
+        dest='json',
+        metavar='PATH',
+        type=path_create,
+        default=None,
+        help='The path to write the results to as JSON.'
+    )
+
+
+def add_listing(type_parser):
+    '''
+    This function adds the listing benchmark subparser.
+
+    type_parser: The subparser for the stage.
+    '''
+
+    func_parser = type_parser.add_parser(
+        'listing',
+        help='Benchmark parsing Maven directory listings recorded with '
+        '--http-record.'
+    )
+
+    # Set the function to use in the stage class
+    func_parser.set_defaults(type_func=Bench.listing)
+
+    # Add type specific arguments
+    func_parser.add_argument(
+        'cassette',
+        metavar='CASSETTE_DIR',
+        type=lambda p: path_exists(p, dir=True),
+        help='The directory of a cassette recorded with --http-record.'
+    )
+    func_parser.add_argument(
+        '--prefix',
+        dest='prefix',
+        metavar='URL',
+        default=MAVEN_URL,
+        help='Only recorded urls starting with this prefix are parsed. '
+        f'Defaults to {MAVEN_URL}.'
+    )
+    func_parser.add_argument(
+        '--repeat',
+        '-r',
+        dest='repeat',
+        metavar='N',
+        type=int,
+        default=5,
+        help='The number of times each parser goes over the listings. The '
+        'best time is reported. Defaults to 5.'
+    )
+    func_parser.add_argument(
+        '--json',
+        '-j',
+        dest='json',
+        metavar='PATH',
+        type=path_create,
+        default=None,
+        help='The path to write the results to as JSON.'
+    )
+
+
+def add_arguments(top_parser):
+    '''
+    This function adds arguments to the top level parser.
+
+    top_parser: The top level parser for the script.
+    '''
+
+    # Create a parser for the bench stage
+    parser = top_parser.add_parser(
+        'bench',
+        help='Benchmark pipeline stages without live registries.'
+    )
+
+    # Give the parser a stage class to use
+    parser.set_defaults(stage=Bench)
+
+    # Create subparsers for each benchmark
+    type_parser = parser.add_subparsers(
+        title='benchmark',
+        description='The benchmark to run.',
+        help='The benchmark to run.',
+        dest='benchmark',
+        metavar='BENCHMARK',
+        required=True
+    )
+
+    # Add subparser specific arguments
+    add_adoption(type_parser)
+    add_listing(type_parser)
@@ -0,0 +1,430 @@
+'''
+bench.py: This module contains a class to benchmark pipeline stages against
+the local registry stand-in server.
+'''
+
+# Imports
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+from pathlib import Path
+from sigadopt.util import pgp, gitmirror, ratelimit
+from sigadopt.util.stage import Stage
+from sigadopt.util.database import connect_db, Registry
+from sigadopt.bench.fixtures import generate, parameters, \
+    stored_parameters, remove
+from sigadopt.mavenindex.nexus import import_index
+from sigadopt.bench.server import RegistryServer
+from sigadopt.bench import listing as listing_bench
+from sigadopt.adoption import docker as docker_adoption
+from sigadopt.adoption import huggingface as huggingface_adoption
+from sigadopt.adoption import maven as maven_adoption
+from sigadopt.adoption import pypi as pypi_adoption
+
+# Request rate and requests in flight high enough that the rate limiter never
+# waits on the local server
+UNLIMITED_RATE = 1e6
+UNLIMITED_CONCURRENCY = 1024
+
+
+class StageTimer:
+    '''
+    This class times calls to module level functions. It swaps each function
+    for a timing wrapper and puts the originals back on restore.
+    '''
+
+    def __init__(self):
+        self.timings = {}
+        self.originals = []
+
+    def wrap(self, module, name, label):
+        '''
+        This function wraps a module level function.
+
+        module: The module containing the function.
+        name: The name of the function.
+        label: The stage label to record the time under.
+        '''
+        original = getattr(module, name)
+        timings = self.timings.setdefault(label, [])
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timings.append(time.perf_counter() - start)
+
+        self.originals.append((module, name, original))
+        setattr(module, name, timed)
+
+    def restore(self):
+        '''
+        This function puts the original functions back.
+        '''
+        for module, name, original in reversed(self.originals):
+            setattr(module, name, original)
+        self.originals = []
+
+    def summary(self):
+        '''
+        This function summarizes the recorded timings.
+
+        returns: A dictionary of stage label to call count, mean and total
+        seconds.
+        '''
+        return {
+            label: {
+                'calls': len(t),
+                'mean': sum(t) / len(t) if t else 0.0,
+                'total': sum(t),
+            } for label, t in self.timings.items()
+        }
+
+
+class Bench(Stage):
+    '''
+    This class runs each registry's adoption against the local registry
+    stand-in server and reports throughput and per-stage latency.
+    '''
+
+    def __init__(self, args):
+        '''
+        This function initializes the class.
+
+        args: The arguments passed to the script.
+        '''
+        self.log = logging.getLogger(__name__)
+        self.log.debug('Initializing Bench stage...')
+        self.args = args
+        self.log.debug(f'{self.args=}')
+
+    def measure(self, registry, timer, func):
+        '''
+        This function runs an adoption function and measures it.
+
+        registry: The registry being measured.
+        timer: The StageTimer with the wrapped functions.
+        func: The function to run.
+
+        returns: A dictionary with the results.
+        '''
+        sent = self.server.sent
+        requests = self.server.requests
+        start = time.perf_counter()
+        try:
+            func()
+        finally:
+            elapsed = time.perf_counter() - start
+            timer.restore()
+
+        # Every artifact that was looked at gets a sig_check row
+        with self.database:
+            artifacts = self.database.execute(
+                '''
+                SELECT COUNT(*)
+                FROM sig_check s
+                JOIN artifacts a ON s.artifact_id = a.id
+                JOIN versions v ON a.version_id = v.id
+                JOIN packages p ON v.package_id = p.id
+                WHERE p.registry_id = ?;
+                ''',
+                (registry,)
+            ).fetchone()[0]
+
+        sent = self.server.sent - sent
+        return {
+            'registry': registry.name.lower(),
+            'seconds': elapsed,
+            'artifacts': artifacts,
+            'requests': self.server.requests - requests,
+            'bytes': sent,
+            'artifacts_per_second': artifacts / elapsed,
+            'bytes_per_second': sent / elapsed,
+            'stages': timer.summary(),
+        }
+
+    def huggingface(self):
+        '''
+        This function benchmarks Hugging Face adoption.
+        '''
+        timer = StageTimer()
+        if self.args.git_mirror:
+            timer.wrap(huggingface_adoption, 'sync', 'fetch')
+            timer.wrap(huggingface_adoption, 'list_packets', 'list_packets')
+            timer.wrap(huggingface_adoption, 'get_key', 'get_key')
+            timer.wrap(huggingface_adoption, 'verify', 'verify')
+        else:
+            timer.wrap(
+                huggingface_adoption, 'get_commits_page', 'commit_page')
+            timer.wrap(huggingface_adoption, 'get_commit_data', 'commit_data')
+        return self.measure(
+            Registry.HUGGINGFACE,
+            timer,
+            lambda: huggingface_adoption.adoption(
+                self.database,
+                0,
+                None,
+                git_mirror=self.mirror_dir if self.args.git_mirror else None
+            )
+        )
+
+    def docker(self):
+        '''
+        This function benchmarks Docker Hub adoption.
+        '''
+        timer = StageTimer()
+        timer.wrap(docker_adoption, 'get_signatures', 'trust')
+        return self.measure(
+            Registry.DOCKER,
+            timer,
+            lambda: docker_adoption.adoption(self.database, 0, None)
+        )
+
+    def maven(self):
+        '''
+        This function benchmarks Maven Central adoption.
+        '''
+        timer = StageTimer()
+        timer.wrap(maven_adoption, 'get_files', 'listing')
+        timer.wrap(maven_adoption, 'download_file', 'download')
+        timer.wrap(maven_adoption, 'list_packets', 'list_packets')
+        timer.wrap(maven_adoption, 'get_key', 'get_key')
+        timer.wrap(maven_adoption, 'verify', 'verify')
+        timer.wrap(maven_adoption, 'write_versions', 'database')
+
+        # The index is imported before the run, as import is its own command
+        if self.args.from_index:
+            index = self.workdir / 'www' / 'maven2' / '.index' / \
+                'nexus-maven-repository-index.gz'
+            if not index.exists():
+                self.log.error(f'No Maven index in {self.workdir}. Remove the '
+                               'fixtures to generate them again.')
+                exit(-1)
+            import_index(self.database, [index])
+
+        return self.measure(
+            Registry.MAVEN,
+            timer,
+            lambda: maven_adoption.adoption(
+                self.database,
+                self.download_dir,
+                0,
+                None,
+                workers=self.args.workers,
+                from_index=self.args.from_index,
+            )
+        )
+
+    def pypi(self):
+        '''
+        This function benchmarks PyPI adoption.
+        '''
+        timer = StageTimer()
+        timer.wrap(pypi_adoption, 'download_file', 'download')
+        timer.wrap(pypi_adoption, 'list_packets', 'list_packets')
+        timer.wrap(pypi_adoption, 'get_key', 'get_key')
+        timer.wrap(pypi_adoption, 'verify', 'verify')
+        timer.wrap(pypi_adoption, 'insert_signatures', 'database')
+        return self.measure(
+            Registry.PYPI,
+            timer,
+            lambda: pypi_adoption.adoption(
+                self.database, self.download_dir, 0, None)
+        )
+
+    def prepare(self, workdir):
+        '''
+        This function generates fixtures if needed, copies the fixture
+        database, and points the registries at the local server.
+
+        workdir: The directory for the fixtures and run files.
+        '''
+        self.workdir = workdir
+        wanted = parameters(
+            packages=self.args.packages,
+            versions=self.args.versions,
+            file_size=self.args.file_size * 1024,
+            signed=self.args.signed,
+            seed=self.args.seed,
+        )
+        stored = stored_parameters(workdir)
+        if stored == wanted:
+            self.log.info(f'Reusing registry fixtures in {workdir}.')
+        else:
+            if stored is not None:
+                self.log.info(f'Fixtures in {workdir} were generated with '
+                              f'{stored}. Generating them again.')
+            remove(workdir)
+            generate(
+                workdir,
+                packages=wanted['packages'],
+                versions=wanted['versions'],
+                file_size=wanted['file_size'],
+                signed=wanted['signed'],
+                seed=wanted['seed'],
+            )
+
+        # Each run starts from a fresh copy of the fixture database
+        run_dir = Path(tempfile.mkdtemp(prefix='run-', dir=workdir))
+        shutil.copy(workdir / 'fixtures.db', run_dir / 'run.db')
+        self.database = connect_db(run_dir / 'run.db')
+        self.download_dir = run_dir / 'downloads'
+        self.download_dir.mkdir()
+        self.mirror_dir = run_dir / 'mirrors'
+
+        # Empty keyring so keys have to come from the local keyserver
+        gnupg = run_dir / 'gnupg'
+        gnupg.mkdir(mode=0o700)
+        self.saved_gnupghome = os.environ.get('GNUPGHOME')
+        os.environ['GNUPGHOME'] = str(gnupg)
+
+        # The local server is not limited unless a rate is given, so the
+        # results measure adoption and not the limiter
+        self.saved_limiter = ratelimit.limiter
+        rate = self.args.rate or UNLIMITED_RATE
+        ratelimit.configure(
+            rate=rate,
+            max_rate=rate,
+            concurrency=UNLIMITED_CONCURRENCY,
+            max_concurrency=UNLIMITED_CONCURRENCY,
+        )
+
+        # Serve the fixtures and point the registries at them
+        self.server = RegistryServer(workdir / 'www')
+        self.server.start()
+        host, port = self.server.server_address[:2]
+        self.saved_keyservers = list(pgp.keyservers)
+        pgp.keyservers[:] = [f'hkp://{host}:{port}']
+        self.saved_urls = []
+        git_url = (workdir / 'git').absolute().as_uri() + '/'
+        for module, name, url in [
+            (maven_adoption, 'MAVEN_URL', self.server.url + 'maven2/'),
+            (pypi_adoption, 'PYPI_URL', self.server.url + 'packages/'),
+            (huggingface_adoption, 'HF_URL', self.server.url),
+            (docker_adoption, 'TRUST_URL', self.server.url + 'trust/'),
+            (gitmirror, 'GIT_URL', git_url),
+        ]:
+            self.saved_urls.append((module, name, getattr(module, name)))
+            setattr(module, name, url)
+
+        return run_dir
+
+    def cleanup(self, run_dir):
+        '''
+        This function stops the server and restores the global settings.
+
+        run_dir: The directory with the files for this run.
+        '''
+        self.server.stop()
+        self.database.close()
+
+        if self.saved_gnupghome is None:
+            os.environ.pop('GNUPGHOME', None)
+        else:
+            os.environ['GNUPGHOME'] = self.saved_gnupghome
+        pgp.keyservers[:] = self.saved_keyservers
+        ratelimit.limiter = self.saved_limiter
+        for module, name, url in self.saved_urls:
+            setattr(module, name, url)
+
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    def report(self, results):
+        '''
+        This function prints the results and optionally writes them as JSON.
+
+        results: The list of result dictionaries.
+        '''
+        for r in results:
+            print(
+                f'{r["registry"]}: {r["artifacts"]} artifacts in '
+                f'{r["seconds"]:.2f}s ({r["artifacts_per_second"]:.1f} '
+                f'artifacts/s, {r["bytes_per_second"] / 1024:.1f} KiB/s, '
+                f'{r["requests"]} requests)'
+            )
+            for label, s in r['stages'].items():
+                print(
+                    f'    {label:<14} {s["calls"]:>7} calls  '
+                    f'{s["mean"] * 1000:>9.2f} ms mean  '
+                    f'{s["total"]:>8.2f} s total'
+                )
+
+        if self.args.json:
+            with open(self.args.json, 'w') as f:
+                json.dump(results, f, indent=4)
+
+    def adoption(self):
+        '''
+        This function benchmarks the adoption stage.
+        '''
+        workdir = self.args.fixtures
+        temporary = workdir is None
+        if temporary:
+            workdir = Path(tempfile.mkdtemp(prefix='sigadopt-bench-'))
+
+        reg_func = {
+            Registry.HUGGINGFACE: self.huggingface,
+            Registry.DOCKER: self.docker,
+            Registry.MAVEN: self.maven,
+            Registry.PYPI: self.pypi,
+        }
+        registries = self.args.registries or list(reg_func)
+
+        run_dir = self.prepare(workdir)
+        try:
+            results = []
+            for registry in registries:
+                self.log.info(f'Benchmarking {registry.name} adoption.')
+                results.append(reg_func[registry]())
+        finally:
+            self.cleanup(run_dir)
+            if temporary:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        self.report(results)
+
+    def listing(self):
+        '''
+        This function benchmarks parsing Maven directory listings.
+        '''
+        listings = listing_bench.load_listings(
+            self.args.cassette, self.args.prefix)
+        if not listings:
+            self.log.error(f'No listings under {self.args.prefix} in '
+                           f'{self.args.cassette}.')
+            exit(-1)
+
+        results = listing_bench.measure(listings, self.args.repeat)
+        print(
+            f'{results["listings"]} listings, {results["files_mean"]:.1f} '
+            f'files on average, {results["files_max"]} at most'
+        )
+        baseline = next(iter(results['parsers'].values()))['best']
+        for name, r in results['parsers'].items():
+            print(
+                f'    {name:<14} {r["per_listing"] * 1e6:>9.1f} us/listing  '
+                f'{r["best"]:>8.3f} s best  {r["mean"]:>8.3f} s mean  '
+                f'{baseline / r["best"]:>6.1f}x'
+            )
+        if results['mismatches']:
+            print(f'    {results["mismatches"]} listings parsed differently')
+
+        if self.args.json:
+            with open(self.args.json, 'w') as f:
+                json.dump(results, f, indent=4)
+
+    def run(self):
+        '''
+        This function runs the stage.
+        '''
+        self.log.info('Running Bench stage.')
+
+        # Run the benchmark type set in the subparser defined in the local
+        # __init__.py
+        self.args.type_func(self)
+
+        self.log.info('Bench stage complete.')
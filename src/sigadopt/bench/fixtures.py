@@ -0,0 +1,454 @@
+'''
+fixtures.py: This module generates synthetic registry data for the local
+registry stand-in server. All signatures are made with a locally generated
+key so adoption can verify them end to end.
+'''
+
+# Imports
+import os
+import json
+import random
+import shutil
+import hashlib
+import logging
+import subprocess
+from datetime import datetime, timezone
+from sigadopt.util.database import connect_db, init_db, Registry
+from sigadopt.mavenindex.nexus import write_index
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Number of commits on a Hugging Face commits page
+HF_PAGE_SIZE = 50
+
+# Version of the fixture layout, raised when generate() writes new files
+FIXTURES_FORMAT = 2
+
+# Entries generate() creates in the fixture directory
+FIXTURE_ENTRIES = ['fixtures.json', 'fixtures.db', 'gnupg', 'www', 'git']
+
+
+def gpg(home, *args, data=None):
+    '''
+    This function runs gpg against a given home directory.
+
+    home: The gpg home directory.
+    args: The arguments to pass to gpg.
+    data: Bytes to pass on stdin.
+
+    returns: The stdout of the command.
+    '''
+    return subprocess.run(
+        ['gpg', '--homedir', str(home), '--batch', '--yes', *args],
+        input=data,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    ).stdout
+
+
+def git(path, *args, env=None):
+    '''
+    This function runs git in a repository.
+
+    path: The path to the repository.
+    args: The arguments to pass to git.
+    env: Extra environment variables.
+
+    returns: The stdout of the command.
+    '''
+    return subprocess.run(
+        ['git', '-C', str(path), *args],
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    ).stdout
+
+
+def create_key(home, keys_dir):
+    '''
+    This function creates a signing key and exports the public part for the
+    HKP keyserver.
+
+    home: The gpg home directory to create the key in.
+    keys_dir: The directory the keyserver serves keys from.
+
+    returns: The long key id of the new key.
+    '''
+    home.mkdir(mode=0o700, parents=True, exist_ok=True)
+    keys_dir.mkdir(parents=True, exist_ok=True)
+
+    log.debug('Generating a signing key.')
+    gpg(
+        home, '--pinentry-mode', 'loopback', '--passphrase', '',
+        '--quick-gen-key', 'Sigadopt Bench <bench@example.com>',
+        'rsa2048', 'sign', 'never'
+    )
+
+    # Find the key id
+    listing = gpg(home, '--list-keys', '--with-colons').decode('utf-8')
+    key_id = next(
+        line.split(':')[4] for line in listing.splitlines()
+        if line.startswith('pub:')
+    )
+
+    # Export it for the keyserver
+    (keys_dir / f'{key_id}.asc').write_bytes(
+        gpg(home, '--armor', '--export', key_id)
+    )
+    return key_id
+
+
+def write_signed(home, path, size, signed, rng):
+    '''
+    This function writes a random file and, if requested, a detached armored
+    signature next to it.
+
+    home: The gpg home directory with the signing key.
+    path: The path of the file to write.
+    size: The size of the file in bytes.
+    signed: Whether to sign the file.
+    rng: The random number generator to use.
+    '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = rng.randbytes(size)
+    path.write_bytes(data)
+    if signed:
+        path.with_name(path.name + '.asc').write_bytes(
+            gpg(home, '--armor', '--detach-sign', data=data)
+        )
+
+
+def maven(conn, home, www, packages, versions, size, signed, rng):
+    '''
+    This function creates Maven Central style directories. Each version has a
+    jar, a sources jar and a pom with checksums and, optionally, signatures.
+    The repository index is written like Central's: one document per jar,
+    with the pom folded into the document of the main jar, between a
+    descriptor and the group lists.
+    '''
+    documents = [[('DESCRIPTOR', 'NexusIndex'), ('IDXINFO', '1.0|central')]]
+    groups = []
+    for i in range(packages):
+        group = f'org.sigadopt.bench{i}'
+        artifact = f'artifact{i}'
+        cursor = conn.execute(
+            'INSERT INTO packages (name, registry_id) VALUES (?, ?);',
+            (f'{group}:{artifact}', Registry.MAVEN)
+        )
+        package_id = cursor.lastrowid
+        groups.append(group)
+
+        for j in range(versions):
+            version = f'1.{j}.0'
+            date = datetime(2023, 1, j % 28 + 1, tzinfo=timezone.utc)
+            conn.execute(
+                '''
+                INSERT INTO versions (package_id, name, date)
+                VALUES (?, ?, ?);
+                ''',
+                (package_id, version, date.strftime('%Y-%m-%d %H:%M:%S'))
+            )
+
+            directory = www / 'maven2' / group.replace('.', '/') / \
+                artifact / version
+            is_signed = rng.random() < signed
+            for name in (
+                f'{artifact}-{version}.jar',
+                f'{artifact}-{version}-sources.jar',
+                f'{artifact}-{version}.pom',
+            ):
+                write_signed(home, directory / name, size, is_signed, rng)
+                for checksum in ('md5', 'sha1'):
+                    digest = hashlib.new(
+                        checksum, (directory / name).read_bytes()
+                    ).hexdigest()
+                    (directory / f'{name}.{checksum}').write_text(digest)
+
+            # Index documents of the jars
+            modified = str(int(date.timestamp() * 1000))
+            sig = '1' if is_signed else '0'
+            for classifier, extra in (
+                ('NA', [('n', artifact), ('d', f'Bench artifact {i}')]),
+                ('sources', []),
+            ):
+                suffix = '' if classifier == 'NA' else f'-{classifier}'
+                sha1 = (directory / f'{artifact}-{version}{suffix}.jar.sha1')
+                documents.append([
+                    ('u', f'{group}|{artifact}|{version}|{classifier}|jar'),
+                    ('i', f'jar|{modified}|{size}|'
+                     f'{int(classifier == "NA")}|0|{sig}|jar'),
+                    ('m', modified),
+                    *extra,
+                    ('1', sha1.read_text()),
+                ])
+
+    documents.append([('rootGroups', 'rootGroups'), ('rootGroupsList', 'org')])
+    documents.append([
+        ('allGroups', 'allGroups'), ('allGroupsList', '|'.join(groups))])
+    index = www / 'maven2' / '.index' / 'nexus-maven-repository-index.gz'
+    index.parent.mkdir(parents=True, exist_ok=True)
+    write_index(
+        index, documents, datetime(2023, 2, 1, tzinfo=timezone.utc))
+
+
+def pypi(conn, home, www, packages, versions, size, signed, rng):
+    '''
+    This function creates files.pythonhosted.org style file paths and the
+    matching artifacts.
+    '''
+    for i in range(packages):
+        name = f'sigadopt-bench-{i}'
+        cursor = conn.execute(
+            'INSERT INTO packages (name, registry_id) VALUES (?, ?);',
+            (name, Registry.PYPI)
+        )
+        package_id = cursor.lastrowid
+
+        for j in range(versions):
+            version = f'1.{j}.0'
+            cursor = conn.execute(
+                'INSERT INTO versions (package_id, name) VALUES (?, ?);',
+                (package_id, version)
+            )
+            version_id = cursor.lastrowid
+
+            filename = f'sigadopt_bench_{i}-{version}.tar.gz'
+            digest = hashlib.blake2b(
+                filename.encode('utf-8'), digest_size=32).hexdigest()
+            is_signed = rng.random() < signed
+            write_signed(
+                home,
+                www / 'packages' / digest[0:2] / digest[2:4] / digest[4:] /
+                filename,
+                size,
+                is_signed,
+                rng
+            )
+            conn.execute(
+                '''
+                INSERT INTO artifacts (version_id, name, type, has_sig,
+                    digest, date, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?);
+                ''',
+                (
+                    version_id,
+                    filename,
+                    'file',
+                    int(is_signed),
+                    digest,
+                    f'2023-01-{j % 28 + 1:02} 00:00:00',
+                    size,
+                )
+            )
+
+
+def huggingface(conn, home, key_id, root, www, packages, versions, size,
+                signed, rng):
+    '''
+    This function creates a git repository for each model, with a signed or
+    unsigned commit per version, and Hugging Face commit pages for the same
+    commits in the format scraped by the adoption stage. The repositories
+    allow partial clones so they can stand in for the Hugging Face git server.
+    '''
+    for i in range(packages):
+        name = f'sigadopt-bench/model-{i}'
+        cursor = conn.execute(
+            'INSERT INTO packages (name, registry_id) VALUES (?, ?);',
+            (name, Registry.HUGGINGFACE)
+        )
+        package_id = cursor.lastrowid
+
+        repo = root / 'git' / name
+        repo.mkdir(parents=True)
+        git(repo, 'init', '--quiet', '--initial-branch=main')
+        git(repo, 'config', 'uploadpack.allowFilter', 'true')
+        git(repo, 'config', 'user.name', 'Sigadopt Bench')
+        git(repo, 'config', 'user.email', 'bench@example.com')
+        git(repo, 'config', 'user.signingkey', key_id)
+
+        # Newest commits come first on the pages
+        articles = []
+        for j in range(versions):
+            date = f'2023-01-{j % 28 + 1:02} 00:00:00'
+            is_signed = rng.random() < signed
+
+            # Each commit changes a weights file that mirrors never fetch
+            (repo / 'model.bin').write_bytes(rng.randbytes(size))
+            git(repo, 'add', 'model.bin')
+            git(
+                repo, 'commit', '--quiet', '-m', f'Commit {j}',
+                '--gpg-sign' if is_signed else '--no-gpg-sign',
+                env={
+                    'GNUPGHOME': str(home),
+                    'GIT_AUTHOR_DATE': date + ' +0000',
+                    'GIT_COMMITTER_DATE': date + ' +0000',
+                }
+            )
+            commit_id = git(repo, 'rev-parse', 'HEAD').decode('utf-8').strip()
+
+            conn.execute(
+                '''
+                INSERT INTO versions (package_id, name, date)
+                VALUES (?, ?, ?);
+                ''',
+                (package_id, commit_id, date)
+            )
+            status = ''
+            if is_signed:
+                status = '<span>Verified</span>'
+            articles.insert(
+                0,
+                f'<article><h3><span>{commit_id[:7]}</span>{status}</h3>'
+                f'<p>Commit {j}</p></article>'
+            )
+
+        directory = www / 'hf' / name
+        directory.mkdir(parents=True, exist_ok=True)
+        for page in range(0, max(len(articles), 1), HF_PAGE_SIZE):
+            body = ''.join(articles[page:page + HF_PAGE_SIZE])
+            (directory / f'{page // HF_PAGE_SIZE}.html').write_text(
+                f'<html><body>{body}</body></html>'
+            )
+
+
+def docker(conn, www, packages, versions, signed, rng):
+    '''
+    This function creates docker trust inspect style JSON documents.
+    '''
+    for i in range(packages):
+        name = f'sigadopt-bench/image-{i}'
+        cursor = conn.execute(
+            'INSERT INTO packages (name, registry_id) VALUES (?, ?);',
+            (name, Registry.DOCKER)
+        )
+        package_id = cursor.lastrowid
+
+        signed_tags = []
+        for j in range(versions):
+            tag = f'v1.{j}'
+            conn.execute(
+                '''
+                INSERT INTO versions (package_id, name, date)
+                VALUES (?, ?, ?);
+                ''',
+                (package_id, tag, f'2023-01-{j % 28 + 1:02} 00:00:00')
+            )
+            if rng.random() < signed:
+                signed_tags.append({
+                    'SignedTag': tag,
+                    'Digest': rng.randbytes(32).hex(),
+                    'Signers': ['bench'],
+                })
+
+        path = www / 'trust' / f'{name}.json'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps([{
+            'Name': name,
+            'SignedTags': signed_tags,
+            'Signers': [],
+            'AdministrativeKeys': [],
+        }]))
+
+
+def parameters(packages, versions, file_size, signed, seed):
+    '''
+    This function collects the parameters fixtures are generated with, so
+    fixtures can be reused only when they match.
+
+    packages: The number of packages per registry.
+    versions: The number of versions per package.
+    file_size: The size of each generated file in bytes.
+    signed: The fraction of versions that are signed.
+    seed: The seed for the random number generator.
+
+    returns: A dictionary of the parameters.
+    '''
+    return {
+        'format': FIXTURES_FORMAT,
+        'packages': packages,
+        'versions': versions,
+        'file_size': file_size,
+        'signed': signed,
+        'seed': seed,
+    }
+
+
+def stored_parameters(root):
+    '''
+    This function reads the parameters of the fixtures in a directory.
+
+    root: The fixture directory.
+
+    returns: A dictionary of the parameters, or None if there are no
+    complete fixtures.
+    '''
+    marker = root / 'fixtures.json'
+    if not marker.exists():
+        return None
+    try:
+        return json.loads(marker.read_text())
+    except json.JSONDecodeError:
+        return None
+
+
+def remove(root):
+    '''
+    This function removes the fixtures from a directory, leaving anything
+    else in it.
+
+    root: The fixture directory.
+    '''
+    for name in FIXTURE_ENTRIES:
+        path = root / name
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+
+
+def generate(
+    root,
+    packages=20,
+    versions=5,
+    file_size=65536,
+    signed=0.8,
+    seed=0,
+):
+    '''
+    This function generates fixtures for all registries.
+
+    root: The directory to create the fixtures in.
+    packages: The number of packages per registry.
+    versions: The number of versions per package.
+    file_size: The size of each generated file in bytes.
+    signed: The fraction of versions that are signed.
+    seed: The seed for the random number generator.
+
+    returns: The path to the generated database.
+    '''
+    rng = random.Random(seed)
+    home = root / 'gnupg'
+    www = root / 'www'
+    db_path = root / 'fixtures.db'
+
+    log.info(f'Generating registry fixtures in {root}.')
+    key_id = create_key(home, www / 'pks')
+
+    conn = connect_db(db_path)
+    init_db(conn)
+    with conn:
+        maven(conn, home, www, packages, versions, file_size, signed, rng)
+        pypi(conn, home, www, packages, versions, file_size, signed, rng)
+        huggingface(conn, home, key_id, root, www, packages, versions,
+                    file_size, signed, rng)
+        docker(conn, www, packages, versions, signed, rng)
+    conn.close()
+
+    # Mark the fixtures as complete
+    (root / 'fixtures.json').write_text(json.dumps(
+        parameters(packages, versions, file_size, signed, seed)))
+
+    return db_path
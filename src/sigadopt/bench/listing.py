@@ -0,0 +1,115 @@
+'''
+listing.py: This module contains the micro-benchmark for parsing Maven
+directory listings. The listings come from a cassette recorded with
+--http-record, so the parsers are measured on real Maven Central pages.
+'''
+
+# Imports
+import time
+import logging
+from bs4 import BeautifulSoup
+from sigadopt.util.cassette import Cassette
+from sigadopt.adoption import maven as maven_adoption
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+
+def soup_listing(text):
+    '''
+    This function is the previous listing parser, kept as the baseline. It
+    builds a BeautifulSoup tree and groups the extensions by repeatedly
+    taking the shortest name and scanning the rest.
+
+    text: the html of the listing.
+
+    returns: the files and their extensions.
+    '''
+    files = []
+    soup = BeautifulSoup(text, 'html.parser')
+    for a_tag in soup.find_all('a'):
+        href = a_tag.get('href')
+        if href and '/' not in href:
+            files.append(href)
+
+    file_names = sorted(files, key=len)
+    file_extensions = {}
+    while len(file_names) > 0:
+        temp = file_names.pop(0)
+        extensions = [f for f in file_names if f.startswith(temp)]
+        file_names = [f for f in file_names if f not in extensions]
+        file_extensions[temp] = [f[len(temp):] for f in extensions]
+    return file_extensions
+
+
+# Parsers to compare, baseline first
+PARSERS = {
+    'soup': soup_listing,
+    'regex': maven_adoption.parse_listing,
+}
+
+
+def load_listings(cassette_dir, prefix):
+    '''
+    This function reads the recorded directory listings from a cassette.
+
+    cassette_dir: the directory of the cassette.
+    prefix: only urls starting with this prefix are read.
+
+    returns: a list of listing texts.
+    '''
+    cassette = Cassette(cassette_dir, replaying=True)
+    listings = []
+    for url in cassette.urls(prefix):
+        response = cassette.replay(url)
+        if response.status_code != 200:
+            continue
+        if 'html' not in response.headers.get('Content-Type', ''):
+            continue
+        listings.append(response.text)
+    log.info(f'Read {len(listings)} listings from {cassette_dir}.')
+    return listings
+
+
+def measure(listings, repeat):
+    '''
+    This function times every parser over all listings and checks that they
+    agree.
+
+    listings: a list of listing texts.
+    repeat: the number of times each parser goes over the listings.
+
+    returns: a dictionary with the listing statistics, the timings of each
+    parser and the number of listings the parsers disagree on.
+    '''
+    parsers = {}
+    for name, parse in PARSERS.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for text in listings:
+                parse(text)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        parsers[name] = {
+            'best': best,
+            'mean': sum(timings) / len(timings),
+            'per_listing': best / len(listings) if listings else 0.0,
+        }
+
+    baseline = next(iter(PARSERS.values()))
+    mismatches = sum(
+        1 for text in listings
+        if any(
+            list(parse(text).items()) != list(baseline(text).items())
+            for parse in PARSERS.values()
+        )
+    )
+    files = [sum(1 + len(e) for e in baseline(t).values()) for t in listings]
+    return {
+        'listings': len(listings),
+        'files_mean': sum(files) / len(files) if files else 0.0,
+        'files_max': max(files, default=0),
+        'parsers': parsers,
+        'mismatches': mismatches,
+    }
@@ -0,0 +1,121 @@
+'''
+server.py: This module contains a local HTTP server that stands in for the
+registries. It serves generated fixtures as Maven directory listings, PyPI
+file paths, Hugging Face commit pages, docker trust JSON and an HKP keyserver.
+'''
+
+# Imports
+import re
+import logging
+import threading
+from functools import partial
+from urllib.parse import urlsplit, parse_qs
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Pattern for Hugging Face commit pages
+HF_COMMITS = re.compile(r'^/([^/]+/[^/]+)/commits/main$')
+
+
+class RegistryHandler(SimpleHTTPRequestHandler):
+    '''
+    This class maps registry style requests onto the fixture directory.
+    '''
+
+    def do_GET(self):
+        '''
+        This function rewrites registry specific paths and serves the file.
+        '''
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        # HKP keyserver lookups
+        if url.path == '/pks/lookup':
+            search = query.get('search', [''])[0].upper()
+            key_id = search[2:] if search.startswith('0X') else search
+            self.path = f'/pks/{key_id[-16:]}.asc'
+
+        # Hugging Face commit pages
+        elif HF_COMMITS.match(url.path):
+            name = HF_COMMITS.match(url.path).group(1)
+            page = query.get('p', ['0'])[0]
+            self.path = f'/hf/{name}/{page}.html'
+
+        # Docker trust documents
+        elif url.path.startswith('/trust/'):
+            self.path = url.path + '.json'
+
+        self.server.count(requests=1)
+        super().do_GET()
+
+    def copyfile(self, source, outputfile):
+        '''
+        This function copies a response body and counts the bytes sent.
+        '''
+        data = source.read()
+        outputfile.write(data)
+        self.server.count(sent=len(data))
+
+    def log_message(self, format, *args):
+        '''
+        This function sends request logs to the debug log.
+        '''
+        log.debug(format % args)
+
+
+class RegistryServer(ThreadingHTTPServer):
+    '''
+    This class is a threaded HTTP server that keeps request and byte counts.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, root, host='127.0.0.1', port=0):
+        '''
+        This function initializes the server.
+
+        root: The fixture directory to serve.
+        host: The address to bind to.
+        port: The port to bind to. 0 picks a free port.
+        '''
+        super().__init__(
+            (host, port),
+            partial(RegistryHandler, directory=str(root))
+        )
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.sent = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        '''
+        The base url of the server.
+        '''
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def count(self, requests=0, sent=0):
+        '''
+        This function updates the request and byte counters.
+        '''
+        with self.lock:
+            self.requests += requests
+            self.sent += sent
+
+    def start(self):
+        '''
+        This function serves requests on a background thread.
+        '''
+        log.info(f'Serving registry fixtures at {self.url}.')
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        '''
+        This function stops the server.
+        '''
+        self.shutdown()
+        self.server_close()
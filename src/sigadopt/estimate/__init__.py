@@ -0,0 +1,100 @@
+'''
+__init__.py: This is the __init__ file for the estimate subpackage.
+'''
+
+# Imports
+from sigadopt.estimate.estimate import Estimate
+from sigadopt.util.files import path_exists, path_create
+from sigadopt.util.database import Registry
+
+
+def add_registry_args(registry_parser, name, registry, help):
+    '''
+    This function creates a registry subparser.
+
+    registry_parser: The subparser for the stage.
+    name: The name of the registry subcommand.
+    registry: The Registry to estimate.
+    help: The help text of the subcommand.
+    '''
+    parser = registry_parser.add_parser(name, help=help)
+
+    # Set the registry to use in the stage class
+    parser.set_defaults(registry_id=registry)
+
+
+def add_arguments(top_parser):
+    '''
+    This function adds arguments to the top level parser.
+
+    top_parser: The top level parser for the script.
+    '''
+
+    # Create a parser for the estimate stage
+    parser = top_parser.add_parser(
+        'estimate',
+        help='Estimate the cost of checking signature adoption.'
+    )
+
+    # Add stage specific arguments
+    parser.add_argument(
+        'database',
+        metavar='DATABASE',
+        type=path_exists,
+        help='The path to the database file, usually the output of the '
+        'filter stage.'
+    )
+    parser.add_argument(
+        '--changed-only',
+        dest='changed_only',
+        action='store_true',
+        help='Only count the versions added or changed by the last '
+        '"packages --refresh" run. Defaults to False.'
+    )
+    parser.add_argument(
+        '--workers',
+        '-w',
+        dest='workers',
+        metavar='N',
+        type=int,
+        action='append',
+        default=None,
+        help='A worker count to project the wall time for. Can be given more '
+        'than once. Defaults to 1, 2, 4, 8 and 16.'
+    )
+    parser.add_argument(
+        '--json',
+        '-j',
+        dest='json',
+        metavar='PATH',
+        type=path_create,
+        default=None,
+        help='The path to write the estimate to as JSON.'
+    )
+
+    # Give the parser a stage class to use
+    parser.set_defaults(stage=Estimate)
+
+    # Create subparsers for each registry
+    registry_parser = parser.add_subparsers(
+        title='registry',
+        description='The registry to estimate the cost for.',
+        help='The registry to estimate the cost for.',
+        dest='registry',
+        metavar='REGISTRY',
+        required=True
+    )
+
+    # Add subparser specific arguments
+    add_registry_args(
+        registry_parser, 'huggingface', Registry.HUGGINGFACE,
+        'Estimate the cost of checking adoption on Hugging Face.')
+    add_registry_args(
+        registry_parser, 'pypi', Registry.PYPI,
+        'Estimate the cost of checking adoption on PyPI.')
+    add_registry_args(
+        registry_parser, 'docker', Registry.DOCKER,
+        'Estimate the cost of checking adoption on Docker Hub.')
+    add_registry_args(
+        registry_parser, 'maven', Registry.MAVEN,
+        'Estimate the cost of checking adoption on Maven.')
@@ -0,0 +1,428 @@
+'''
+estimate.py: This module contains a class to estimate the cost of checking
+signature adoption on a filtered database before running the adoption stage.
+'''
+
+# Imports
+import json
+import math
+import logging
+from sigadopt.util import ratelimit
+from sigadopt.util.stage import Stage
+from sigadopt.util.database import connect_db, init_db, Registry
+
+# Size of a detached armored signature, which is not stored anywhere
+SIGNATURE_BYTES = 1024
+
+# Number of commits on a Hugging Face commits page
+COMMITS_PER_PAGE = 50
+
+# Signed files per Maven version when no version has been listed yet: the
+# jar, the pom, the sources jar and the javadoc jar
+MAVEN_SIGNED_FILES = 4
+
+# gpg calls for every signature: list packets, look up the key and verify
+GPG_PER_SIGNATURE = 3
+
+# Worker counts to project the wall time for
+WORKERS = [1, 2, 4, 8, 16]
+
+# Filter for the versions added or changed by the last refresh
+CHANGED = '(? = 0 OR v.id IN (SELECT version_id FROM changed_versions))'
+
+
+def byte_format(num):
+    '''
+    This function formats a number of bytes with binary units.
+
+    num: The number of bytes.
+
+    returns: The formatted size.
+    '''
+    for unit in ['B', 'KiB', 'MiB', 'GiB', 'TiB']:
+        if abs(num) < 1024 or unit == 'TiB':
+            break
+        num /= 1024
+    return f'{num:.1f} {unit}'
+
+
+def duration(seconds):
+    '''
+    This function formats a number of seconds as days, hours and minutes.
+
+    seconds: The number of seconds.
+
+    returns: The formatted duration.
+    '''
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f'{days}d {hours:02}h {minutes:02}m'
+    if hours:
+        return f'{hours}h {minutes:02}m'
+    return f'{minutes}m {seconds:02}s'
+
+
+class Estimate(Stage):
+    '''
+    This class estimates the requests, bytes, gpg calls and key lookups the
+    adoption stage will need for the packages left in a database, and
+    projects its wall time from the throughput of earlier runs.
+    '''
+
+    def __init__(self, args):
+        '''
+        This function initializes the class.
+
+        args: The arguments passed to the script.
+        '''
+        self.log = logging.getLogger(__name__)
+        self.log.debug('Initializing Estimate stage...')
+        self.args = args
+        self.log.debug(f'{self.args=}')
+
+    def query(self, sql, params=()):
+        '''
+        This function runs a query that returns one row.
+
+        sql: The query.
+        params: The parameters of the query.
+
+        returns: The row.
+        '''
+        with self.database:
+            return self.database.execute(sql, params).fetchone()
+
+    def measured(self):
+        '''
+        This function sums the throughput of earlier adoption runs of the
+        registry.
+
+        returns: (runs, requests per worker second, bytes per request) where
+        the rates are None without measurements.
+        '''
+        runs, requests, worker_seconds, size = self.query(
+            '''
+            SELECT COUNT(*), SUM(requests), SUM(seconds * workers),
+                SUM(bytes)
+            FROM throughput
+            WHERE registry_id = ? AND requests > 0 AND seconds > 0;
+            ''',
+            (self.args.registry_id,)
+        )
+        if not runs:
+            return 0, None, None
+        return runs, requests / worker_seconds, size / requests
+
+    def signature_costs(self, signed):
+        '''
+        This function estimates the gpg calls and key lookups for a number of
+        signatures. The share of new keys is taken from the signatures of the
+        registry that were already checked.
+
+        signed: The expected number of signatures.
+
+        returns: (gpg calls, key lookups, note) where note is None if the
+        estimate is based on checked signatures.
+        '''
+        keys, packets = self.query(
+            '''
+            SELECT COUNT(DISTINCT lp.key_id), COUNT(*)
+            FROM list_packets lp
+            JOIN signatures s ON lp.signature_id = s.id
+            JOIN artifacts a ON s.artifact_id = a.id
+            JOIN versions v ON a.version_id = v.id
+            JOIN packages p ON v.package_id = p.id
+            WHERE p.registry_id = ?;
+            ''',
+            (self.args.registry_id,)
+        )
+        note = None
+        if packets:
+            lookups = signed * keys / packets
+        else:
+            lookups = signed
+            note = 'No checked signatures, so every key is counted as new.'
+        return GPG_PER_SIGNATURE * signed + lookups, lookups, note
+
+    def huggingface(self):
+        '''
+        This function estimates the cost for Hugging Face. Every model without
+        artifacts has its commit pages scraped, one page per 50 commits. The
+        --git-mirror mode, which fetches the commits with git instead, is not
+        estimated.
+        '''
+        models, pages = self.query(
+            f'''
+            SELECT COUNT(*), SUM(commits / ? + 1)
+            FROM (
+                SELECT p.id, COUNT(*) AS commits
+                FROM packages p
+                JOIN versions v ON p.id = v.package_id
+                WHERE p.registry_id = ?
+                AND {CHANGED}
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM artifacts a
+                    JOIN versions w ON a.version_id = w.id
+                    WHERE w.package_id = p.id
+                )
+                GROUP BY p.id
+            );
+            ''',
+            (COMMITS_PER_PAGE, Registry.HUGGINGFACE, self.args.changed_only)
+        )
+        return {
+            'pending': models,
+            'unit': 'models',
+            'requests': pages or 0,
+            'bytes': None,
+            'gpg': 0,
+            'key_lookups': 0,
+            'notes': [
+                'Commit pages are counted as scraped. Runs with --git-mirror '
+                'fetch the commits with git and are not estimated.',
+            ],
+        }
+
+    def docker(self):
+        '''
+        This function estimates the cost for Docker Hub. Every package with
+        versions without artifacts takes one trust data request.
+        '''
+        packages, = self.query(
+            f'''
+            SELECT COUNT(DISTINCT p.id)
+            FROM packages p
+            JOIN versions v ON p.id = v.package_id
+            WHERE p.registry_id = ?
+            AND {CHANGED}
+            AND NOT EXISTS (
+                SELECT 1 FROM artifacts a WHERE a.version_id = v.id
+            );
+            ''',
+            (Registry.DOCKER, self.args.changed_only)
+        )
+        return {
+            'pending': packages,
+            'unit': 'packages',
+            'requests': packages,
+            'bytes': None,
+            'gpg': 0,
+            'key_lookups': 0,
+            'notes': [],
+        }
+
+    def maven(self):
+        '''
+        This function estimates the cost for Maven Central. Every version
+        without artifacts takes one listing request and two downloads per
+        signed file. The signed files of a version are predicted from the
+        file and extension lists already stored for the same package, then
+        for the registry. Every version is counted as listed, so runs with
+        --from-index need fewer requests than estimated.
+        '''
+        notes = [
+            'Every version is counted as listed. Runs with --from-index skip '
+            'the listing of indexed versions and need fewer requests.',
+        ]
+
+        # Signed files per listed version across the registry
+        listed, signed = self.query(
+            '''
+            SELECT COUNT(DISTINCT v.id), SUM(a.has_sig)
+            FROM artifacts a
+            JOIN versions v ON a.version_id = v.id
+            JOIN packages p ON v.package_id = p.id
+            WHERE p.registry_id = ?;
+            ''',
+            (Registry.MAVEN,)
+        )
+        if listed:
+            default = signed / listed
+        else:
+            default = MAVEN_SIGNED_FILES
+            notes.append(
+                f'No listed versions, so {MAVEN_SIGNED_FILES} signed files '
+                'are assumed per version.')
+
+        # Pending versions, predicted from their package where possible
+        pending, signed = self.query(
+            f'''
+            WITH listed AS (
+                SELECT v.package_id,
+                    CAST(SUM(a.has_sig) AS REAL) / COUNT(DISTINCT v.id)
+                    AS signed
+                FROM artifacts a
+                JOIN versions v ON a.version_id = v.id
+                JOIN packages p ON v.package_id = p.id
+                WHERE p.registry_id = ?
+                GROUP BY v.package_id
+            )
+            SELECT COUNT(*), TOTAL(IFNULL(l.signed, ?))
+            FROM versions v
+            JOIN packages p ON v.package_id = p.id
+            LEFT JOIN listed l ON l.package_id = v.package_id
+            WHERE p.registry_id = ?
+            AND {CHANGED}
+            AND NOT EXISTS (
+                SELECT 1 FROM artifacts a WHERE a.version_id = v.id
+            );
+            ''',
+            (Registry.MAVEN, default, Registry.MAVEN, self.args.changed_only)
+        )
+
+        gpg, lookups, note = self.signature_costs(signed)
+        if note:
+            notes.append(note)
+        return {
+            'pending': pending,
+            'unit': 'versions',
+            'requests': pending + 2 * signed,
+            'bytes': None,
+            'gpg': gpg,
+            'key_lookups': lookups,
+            'notes': notes,
+        }
+
+    def pypi(self):
+        '''
+        This function estimates the cost for PyPI. Every signed artifact that
+        was not checked yet takes a download of the file and its signature.
+        The file sizes come from the packages stage, and files without a size
+        are counted at the mean size.
+        '''
+        notes = []
+        pending, sized, size, mean = self.query(
+            f'''
+            SELECT COUNT(*), COUNT(a.size), TOTAL(a.size), (
+                SELECT AVG(b.size)
+                FROM artifacts b
+                JOIN versions w ON b.version_id = w.id
+                JOIN packages q ON w.package_id = q.id
+                WHERE q.registry_id = ?
+            )
+            FROM artifacts a
+            JOIN versions v ON a.version_id = v.id
+            JOIN packages p ON v.package_id = p.id
+            WHERE p.registry_id = ?
+            AND a.has_sig = 1
+            AND {CHANGED}
+            AND NOT EXISTS (
+                SELECT 1 FROM sig_check s WHERE s.artifact_id = a.id
+            );
+            ''',
+            (Registry.PYPI, Registry.PYPI, self.args.changed_only)
+        )
+
+        size_bytes = size + pending * SIGNATURE_BYTES
+        if sized < pending:
+            if mean is None:
+                size_bytes = None
+                notes.append('No artifact sizes are stored. Reload the '
+                             'packages to store them.')
+            else:
+                size_bytes += (pending - sized) * mean
+                notes.append(f'{pending - sized} artifacts have no size and '
+                             'are counted at the mean size.')
+
+        gpg, lookups, note = self.signature_costs(pending)
+        if note:
+            notes.append(note)
+        return {
+            'pending': pending,
+            'unit': 'artifacts',
+            'requests': 2 * pending,
+            'bytes': size_bytes,
+            'gpg': gpg,
+            'key_lookups': lookups,
+            'notes': notes,
+        }
+
+    def project(self, estimate):
+        '''
+        This function adds the measured throughput and the projected wall
+        time for each worker count to an estimate. Bytes that could not be
+        estimated from stored metadata are projected from the bytes per
+        request of earlier runs. Adding workers stops helping once the
+        requests reach the most the rate limiter allows for one host.
+
+        estimate: The estimate of a registry.
+        '''
+        runs, rate, per_request = self.measured()
+        estimate['runs'] = runs
+        estimate['requests_per_worker_second'] = rate
+        estimate['wall_time'] = {}
+
+        if not runs:
+            estimate['notes'].append(
+                'No adoption runs are recorded, so the wall time can not be '
+                'projected. Run adoption on a sample first.')
+            return
+
+        if estimate['bytes'] is None:
+            estimate['bytes'] = estimate['requests'] * per_request
+            estimate['notes'].append(
+                f'Bytes are projected at {byte_format(per_request)} per '
+                'request from earlier runs.')
+
+        ceiling = ratelimit.limiter.max_rate
+        for workers in self.args.workers or WORKERS:
+            estimate['wall_time'][workers] = estimate['requests'] / min(
+                rate * workers, ceiling)
+
+    def report(self, estimate):
+        '''
+        This function prints an estimate and optionally writes it as JSON.
+
+        estimate: The estimate of a registry.
+        '''
+        print(f'{estimate["registry"]}: {estimate["pending"]} '
+              f'{estimate["unit"]} to check')
+        print(f'    {"requests":<14} {math.ceil(estimate["requests"]):>12}')
+        if estimate['bytes'] is not None:
+            print(f'    {"bytes":<14} '
+                  f'{byte_format(estimate["bytes"]):>12}')
+        print(f'    {"gpg calls":<14} {math.ceil(estimate["gpg"]):>12}')
+        print(f'    {"key lookups":<14} '
+              f'{math.ceil(estimate["key_lookups"]):>12}')
+        if estimate['runs']:
+            runs = 'run' if estimate['runs'] == 1 else 'runs'
+            print(f'    measured over {estimate["runs"]} {runs} at '
+                  f'{estimate["requests_per_worker_second"]:.2f} requests '
+                  'per worker second')
+        for workers, seconds in estimate['wall_time'].items():
+            print(f'    {workers:>3} workers  {duration(seconds):>12}')
+        for note in estimate['notes']:
+            print(f'    note: {note}')
+
+        if self.args.json:
+            with open(self.args.json, 'w') as f:
+                json.dump(estimate, f, indent=4)
+
+    def run(self):
+        '''
+        This function runs the stage.
+        '''
+        self.log.info('Running Estimate stage.')
+
+        # Ensure the database is available
+        self.database = connect_db(self.args.database)
+        init_db(self.database)
+
+        # Get the registry function
+        reg_func = {
+            Registry.HUGGINGFACE: self.huggingface,
+            Registry.DOCKER: self.docker,
+            Registry.MAVEN: self.maven,
+            Registry.PYPI: self.pypi,
+        }
+        estimate = {'registry': self.args.registry_id.name.lower()}
+        estimate.update(reg_func[self.args.registry_id]())
+        self.project(estimate)
+        self.report(estimate)
+
+        # Close the database
+        self.log.info('Estimate stage complete. Closing database.')
+        self.database.close()
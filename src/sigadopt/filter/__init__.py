@@ -4,10 +4,30 @@ __init__.py: This is the __init__ file for the filter subpackage.
 
 # Imports
 from datetime import datetime
+from argparse import ArgumentTypeError
 from sigadopt.filter.filter import Filter
+from sigadopt.filter.engine import STRATA
 from sigadopt.util.files import path_exists, path_create
 
 
+def strata_columns(value):
+    '''
+    This function parses a comma separated list of strata columns.
+
+    value: The argument value.
+
+    returns: The list of columns.
+    '''
+    columns = [c.strip() for c in value.split(',') if c.strip()]
+    for column in columns:
+        if column not in STRATA:
+            raise ArgumentTypeError(
+                f'Unknown stratum column {column}. '
+                f'Options: {",".join(STRATA)}'
+            )
+    return columns
+
+
 def add_hf_args(registry_parser):
     '''
     This function creates and adds arguments to the Hugging Face subparser.
@@ -157,6 +177,37 @@ def add_arguments(top_parser):
         default=-1,
         help='Randomly select N packages. Defaults to -1, which means all.'
     )
+    parser.add_argument(
+        '--seed',
+        dest='seed',
+        metavar='N',
+        type=int,
+        default=None,
+        help='The seed for --random-select and --stratify. The same seed '
+        'always selects the same packages from the same input. If not '
+        'provided, a seed is picked and logged.'
+    )
+    parser.add_argument(
+        '--stratify',
+        dest='stratify',
+        metavar='COLUMNS',
+        type=strata_columns,
+        default=None,
+        help='Take a stratified sample instead of a uniform one. Strata are '
+        'the combinations of the given comma separated columns: year '
+        '(release year), downloads (download decile) and versions (version '
+        'count bucket). The weight of each sampled package is written to the '
+        'sample_weights table.'
+    )
+    parser.add_argument(
+        '--per-stratum',
+        dest='per_stratum',
+        metavar='N',
+        type=int,
+        default=None,
+        help='The number of packages to sample from each stratum when using '
+        '--stratify.'
+    )
     parser.add_argument(
         '--min-versions',
         '-v',
@@ -177,6 +228,45 @@ def add_arguments(top_parser):
         help='The maximum number of versions a package can have to be '
         'included. Defaults to None.'
     )
+    parser.add_argument(
+        '--min-downloads',
+        dest='min_downloads',
+        metavar='N',
+        type=int,
+        default=None,
+        help='The minimum number of downloads a package must have to be '
+        'included. Defaults to None.'
+    )
+    parser.add_argument(
+        '--max-downloads',
+        dest='max_downloads',
+        metavar='N',
+        type=int,
+        default=None,
+        help='The maximum number of downloads a package can have to be '
+        'included. Defaults to None.'
+    )
+    parser.add_argument(
+        '--name',
+        '-n',
+        dest='names',
+        metavar='PATTERN',
+        action='append',
+        default=[],
+        help='Only include packages whose name matches this GLOB pattern, '
+        'such as "org.apache.*". Can be given more than once to include '
+        'packages matching any of the patterns.'
+    )
+    parser.add_argument(
+        '--exclude-name',
+        '-x',
+        dest='exclude_names',
+        metavar='PATTERN',
+        action='append',
+        default=[],
+        help='Exclude packages whose name matches this GLOB pattern. Can be '
+        'given more than once.'
+    )
 
     # Give the parser a stage class to use
     parser.set_defaults(stage=Filter)
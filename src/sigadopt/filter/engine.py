@@ -0,0 +1,466 @@
+'''
+engine.py: This module contains the filter engine. A filter is a list of
+predicates that compile into one SQL plan, which is run against the input
+database attached to the output database.
+'''
+
+# Import statements
+import random
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from sigadopt.util.database import Registry, clean_db
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Date columns a registry can be filtered on
+VERSION_DATE = 'v.date'
+ARTIFACT_DATE = 'a.date'
+
+# The date column each registry is filtered on. Registries filtered on the
+# artifact date keep their artifacts, since they come from the packages stage.
+DATE_COLUMNS = {
+    Registry.HUGGINGFACE: VERSION_DATE,
+    Registry.DOCKER: VERSION_DATE,
+    Registry.MAVEN: VERSION_DATE,
+    Registry.PYPI: ARTIFACT_DATE,
+}
+
+# Artifact columns copied from the input database
+ARTIFACT_COLUMNS = (
+    'id',
+    'version_id',
+    'name',
+    'type',
+    'has_sig',
+    'digest',
+    'date',
+    'extensions',
+    'size',
+)
+
+# Temporary tables the selection is staged in
+STAGING = (
+    'filter_versions',
+    'filter_packages',
+    'filter_strata',
+    'filter_artifacts',
+)
+
+# Levels of the plan a predicate applies to
+ROW = 'row'
+GROUP = 'group'
+SAMPLE = 'sample'
+STRATIFY = 'stratify'
+
+# Columns packages can be stratified by. f is a candidate package, and
+# f.first_released is its first release inside the date window on the
+# registry's date column.
+STRATA = {
+    'year': "IFNULL(substr(f.first_released, 1, 4), 'none')",
+    'downloads': '''
+        CASE WHEN f.downloads IS NULL THEN 'none'
+        ELSE NTILE(10) OVER (
+            PARTITION BY f.downloads IS NULL
+            ORDER BY f.downloads
+        ) END
+    ''',
+    'versions': '''
+        CASE
+            WHEN f.versions_count < 2 THEN '1'
+            WHEN f.versions_count < 5 THEN '2-4'
+            WHEN f.versions_count < 10 THEN '5-9'
+            WHEN f.versions_count < 25 THEN '10-24'
+            WHEN f.versions_count < 100 THEN '25-99'
+            ELSE '100+'
+        END
+    ''',
+}
+
+
+class Predicate(ABC):
+    '''
+    This class is the parent class for all filter predicates. A predicate
+    compiles into an SQL fragment for one level of the plan: a condition on
+    each version row (p, v and a are in scope), a condition on the number of
+    versions of a package (c.versions_count is in scope), or the selection of
+    a sample of packages.
+    '''
+
+    level = ROW
+
+    @abstractmethod
+    def compile(self, date_column):
+        '''
+        This function compiles the predicate.
+
+        date_column: The date column of the registry being filtered.
+
+        returns: (sql, params)
+        '''
+        pass
+
+
+class DateWindow(Predicate):
+    '''
+    This class keeps the versions, or artifacts, dated inside a window.
+    '''
+
+    def __init__(self, min_date, max_date):
+        self.min_date = min_date
+        self.max_date = max_date
+
+    def compile(self, date_column):
+        return f'{date_column} BETWEEN ? AND ?', (self.min_date, self.max_date)
+
+
+class VersionCount(Predicate):
+    '''
+    This class keeps the packages with a number of versions inside the
+    bounds. The versions are counted after the row predicates are applied.
+    '''
+
+    level = GROUP
+
+    def __init__(self, minimum=None, maximum=None):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def compile(self, date_column):
+        return '(? IS NULL OR c.versions_count >= ?) ' \
+            'AND (? IS NULL OR c.versions_count <= ?)', \
+            (self.minimum, self.minimum, self.maximum, self.maximum)
+
+
+class Downloads(Predicate):
+    '''
+    This class keeps the packages with a number of downloads inside the
+    bounds. Packages without a download count are dropped when a bound is
+    set.
+    '''
+
+    def __init__(self, minimum=None, maximum=None):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def compile(self, date_column):
+        return '(? IS NULL OR p.downloads >= ?) ' \
+            'AND (? IS NULL OR p.downloads <= ?)', \
+            (self.minimum, self.minimum, self.maximum, self.maximum)
+
+
+class NamePattern(Predicate):
+    '''
+    This class keeps the packages whose name matches any of a list of GLOB
+    patterns, or, if exclude is set, none of them.
+    '''
+
+    def __init__(self, patterns, exclude=False):
+        self.patterns = list(patterns)
+        self.exclude = exclude
+
+    def compile(self, date_column):
+        matches = ' OR '.join(['p.name GLOB ?'] * len(self.patterns))
+        if self.exclude:
+            return f'NOT ({matches})', tuple(self.patterns)
+        return f'({matches})', tuple(self.patterns)
+
+
+def sample_key(seed, package_id):
+    '''
+    This function is the keyed hash packages are sampled by. It is registered
+    as an SQLite function, so the sample is drawn inside the query.
+
+    seed: The seed of the draw.
+    package_id: The id of the package.
+
+    returns: A signed 64-bit integer.
+    '''
+    digest = hashlib.blake2b(
+        str(package_id).encode('utf-8'),
+        digest_size=8,
+        key=str(seed).encode('utf-8')
+    ).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class Sample(Predicate):
+    '''
+    This class keeps a random sample of N of the packages that pass every
+    other predicate. Packages are ordered by a keyed hash of their id and the
+    first N are kept, so the same seed always draws the same sample and SQLite
+    only has to hold N candidates while sorting.
+    '''
+
+    level = SAMPLE
+
+    def __init__(self, size, seed=None):
+        self.size = size
+        self.seed = seed
+        if self.seed is None:
+            self.seed = random.randrange(2 ** 32)
+            log.info(f'Sampling with seed {self.seed}.')
+
+    def compile(self, date_column):
+        return 'ORDER BY sample_key(?, p.id) LIMIT ?', (self.seed, self.size)
+
+
+class Stratify(Predicate):
+    '''
+    This class keeps a sample of up to a quota of packages from every
+    stratum, where strata are the combinations of the release year bucket,
+    the download decile and the version count bucket. Each sampled package
+    gets the weight population / sampled of its stratum, so estimates over
+    the sample stay representative of all candidates.
+    '''
+
+    level = STRATIFY
+
+    def __init__(self, columns, quota, seed=None):
+        self.columns = list(columns)
+        self.quota = quota
+        self.seed = seed
+        if self.seed is None:
+            self.seed = random.randrange(2 ** 32)
+            log.info(f'Sampling strata with seed {self.seed}.')
+
+    def compile(self, date_column):
+        label = " || ';' || ".join(
+            f"'{c}=' || {STRATA[c]}" for c in self.columns
+        )
+        return label, ()
+
+
+def compile_plan(registry, schema, predicates, columns=ARTIFACT_COLUMNS):
+    '''
+    This function compiles the predicates for a registry into the statements
+    that stage the selection in temporary tables, and the query for the
+    artifacts of the selected versions.
+
+    registry: The Registry to filter.
+    schema: The schema the input database is attached as.
+    predicates: The list of Predicates.
+    columns: The artifact columns to copy.
+
+    returns: (plan, artifacts) where plan is a list of (sql, params)
+    statements and artifacts is an (sql, params) query, or None if the
+    registry does not keep its artifacts.
+    '''
+    date_column = DATE_COLUMNS[registry]
+
+    def compiled(level):
+        parts = [
+            p.compile(date_column) for p in predicates if p.level == level
+        ]
+        return [s for s, _ in parts], [v for _, ps in parts for v in ps]
+
+    rows, row_params = compiled(ROW)
+    groups, group_params = compiled(GROUP)
+    samples, sample_params = compiled(SAMPLE)
+    strata = [p for p in predicates if p.level == STRATIFY]
+
+    # Registries dated by artifact need the artifacts of each version
+    artifacts_join = ''
+    if date_column == ARTIFACT_DATE:
+        artifacts_join = f'JOIN {schema}.artifacts a ON a.version_id = v.id'
+
+    plan = [
+        (
+            f'''
+                CREATE TEMP TABLE filter_versions AS
+                SELECT v.id, v.package_id, v.name, v.date,
+                    MIN({date_column}) AS released
+                FROM {schema}.versions v
+                JOIN {schema}.packages p ON v.package_id = p.id
+                {artifacts_join}
+                WHERE p.registry_id = ?
+                {''.join(f' AND {s}' for s in rows)}
+                GROUP BY v.id
+            ''',
+            [registry] + row_params
+        ),
+        (
+            f'''
+                CREATE TEMP TABLE filter_packages AS
+                SELECT p.id, p.name, p.registry_id, c.versions_count,
+                    p.latest_release_date, p.first_release_date, p.downloads,
+                    p.downloads_period, c.first_released
+                FROM (
+                    SELECT package_id, COUNT(*) AS versions_count,
+                        MIN(released) AS first_released
+                    FROM temp.filter_versions
+                    GROUP BY package_id
+                ) c
+                JOIN {schema}.packages p ON p.id = c.package_id
+                WHERE true
+                {''.join(f' AND {s}' for s in groups)}
+                {' '.join(samples)}
+            ''',
+            group_params + sample_params
+        ),
+    ]
+
+    # Draw up to the quota from each stratum by the keyed hash
+    for stratify in strata:
+        label, label_params = stratify.compile(date_column)
+        plan.extend([
+            (
+                f'''
+                    CREATE TEMP TABLE filter_strata AS
+                    SELECT id, stratum,
+                        COUNT(*) OVER (PARTITION BY stratum) AS population,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY stratum
+                            ORDER BY sample_key(?, id)
+                        ) AS draw
+                    FROM (
+                        SELECT f.id, {label} AS stratum
+                        FROM temp.filter_packages f
+                    )
+                ''',
+                [stratify.seed] + list(label_params)
+            ),
+            (
+                'DELETE FROM temp.filter_strata WHERE draw > ?',
+                [stratify.quota]
+            ),
+            (
+                '''
+                    DELETE FROM temp.filter_packages
+                    WHERE id NOT IN (SELECT id FROM temp.filter_strata)
+                ''',
+                []
+            ),
+        ])
+
+    plan.extend([
+        (
+            '''
+                DELETE FROM temp.filter_versions
+                WHERE package_id NOT IN (
+                    SELECT id FROM temp.filter_packages
+                )
+            ''',
+            []
+        ),
+    ])
+
+    # The artifacts of the selected versions that pass the row predicates,
+    # found by a join from the selected version ids into the artifacts index
+    artifacts = None
+    if date_column == ARTIFACT_DATE:
+        artifacts = (
+            f'''
+                SELECT {', '.join(f'a.{c}' for c in columns)}
+                FROM temp.filter_versions v
+                JOIN {schema}.artifacts a ON a.version_id = v.id
+                JOIN {schema}.packages p ON p.id = v.package_id
+                WHERE true
+                {''.join(f' AND {s}' for s in rows)}
+            ''',
+            row_params
+        )
+
+    return plan, artifacts
+
+
+def filter(output_conn, schema, registry, predicates):
+    '''
+    This function filters the packages of a registry from the attached input
+    database into the output database. The selection is staged in temporary
+    tables before the output is cleared, so the input can be the output.
+    Artifacts are streamed from the input into the output by one
+    INSERT ... SELECT, and are only staged when filtering in place. The
+    strata and weights of a stratified sample are written to sample_weights.
+
+    output_conn: The connection to the output database.
+    schema: The schema the input database is attached as.
+    registry: The Registry to filter.
+    predicates: The list of Predicates a package must pass.
+    '''
+    log.info(f'Filtering {registry.name} packages.')
+    output_conn.create_function(
+        'sample_key', 2, sample_key, deterministic=True)
+
+    # Inputs written before a column was added do not have it
+    available = {
+        row[1] for row in output_conn.execute(
+            f'PRAGMA {schema}.table_info(artifacts);')
+    }
+    columns = [c for c in ARTIFACT_COLUMNS if c in available]
+    plan, artifacts = compile_plan(registry, schema, predicates, columns)
+
+    # In place, the artifacts have to be read before the output is cleared
+    if artifacts is not None and schema == 'main':
+        plan.append((
+            f'CREATE TEMP TABLE filter_artifacts AS {artifacts[0]}',
+            artifacts[1]
+        ))
+        artifacts = ('SELECT * FROM temp.filter_artifacts', [])
+
+    # Stage the selection
+    with output_conn:
+        for table in STAGING:
+            output_conn.execute(f'DROP TABLE IF EXISTS temp.{table};')
+        for sql, params in plan:
+            log.debug(f'Running filter plan statement: {sql}')
+            output_conn.execute(sql, params)
+
+    # Clear the output database for the registry
+    log.debug('Cleaning the output database.')
+    clean_db(output_conn, registry)
+
+    # Insert the selection into the output database
+    log.debug('Inserting selected packages, versions and artifacts.')
+    with output_conn:
+        output_conn.execute(
+            '''
+                INSERT INTO packages (
+                    id, name, registry_id, versions_count, latest_release_date,
+                    first_release_date, downloads, downloads_period
+                )
+                SELECT id, name, registry_id, versions_count,
+                    latest_release_date, first_release_date, downloads,
+                    downloads_period
+                FROM temp.filter_packages
+            '''
+        )
+        selected = output_conn.execute(
+            '''
+                INSERT INTO versions (id, package_id, name, date)
+                SELECT id, package_id, name, date
+                FROM temp.filter_versions
+            '''
+        ).rowcount
+        if any(p.level == STRATIFY for p in predicates):
+            output_conn.execute(
+                '''
+                    INSERT INTO sample_weights (package_id, stratum,
+                        population, sampled, weight)
+                    SELECT s.id, s.stratum, s.population, n.sampled,
+                        CAST(s.population AS REAL) / n.sampled
+                    FROM temp.filter_strata s
+                    JOIN (
+                        SELECT stratum, COUNT(*) AS sampled
+                        FROM temp.filter_strata
+                        GROUP BY stratum
+                    ) n ON n.stratum = s.stratum
+                '''
+            )
+        if artifacts is not None:
+            output_conn.execute(
+                f'''
+                    INSERT INTO artifacts ({', '.join(columns)})
+                    {artifacts[0]}
+                ''',
+                artifacts[1]
+            )
+        packages = output_conn.execute(
+            'SELECT COUNT(*) FROM temp.filter_packages;'
+        ).fetchone()[0]
+        for table in STAGING:
+            output_conn.execute(f'DROP TABLE IF EXISTS temp.{table};')
+
+    log.info(f'Selected {packages} {registry.name} packages with {selected} '
+             'versions.')
@@ -5,12 +5,10 @@ registries.
 
 # Imports
 import logging
-from sigadopt.util.database import connect_db, init_db
+from sigadopt.util.database import connect_db, init_db, attach_db, Registry
 from sigadopt.util.stage import Stage
-from sigadopt.filter.huggingface import filter as huggingface_filter
-from sigadopt.filter.docker import filter as docker_filter
-from sigadopt.filter.maven import filter as maven_filter
-from sigadopt.filter.pypi import filter as pypi_filter
+from sigadopt.filter.engine import filter as run_filter, DateWindow, \
+    VersionCount, Downloads, NamePattern, Sample, Stratify
 
 
 class Filter(Stage):
@@ -29,61 +27,78 @@ class Filter(Stage):
         self.args = args
         self.log.debug(f'{self.args=}')
 
-    def huggingface(self):
+    def predicates(self):
         '''
-        This function gets the packages from Hugging Face.
+        This function builds the filter predicates from the arguments.
+
+        returns: A list of Predicates.
+        '''
+        predicates = [
+            DateWindow(self.args.min_date, self.args.max_date),
+            VersionCount(
+                self.args.min_versions or None,
+                self.args.max_versions or None
+            ),
+        ]
+        if self.args.min_downloads is not None \
+                or self.args.max_downloads is not None:
+            predicates.append(
+                Downloads(self.args.min_downloads, self.args.max_downloads)
+            )
+        if self.args.names:
+            predicates.append(NamePattern(self.args.names))
+        if self.args.exclude_names:
+            predicates.append(NamePattern(self.args.exclude_names, True))
+        if self.args.random_select != -1:
+            predicates.append(
+                Sample(self.args.random_select, self.args.seed)
+            )
+        if self.args.stratify:
+            predicates.append(
+                Stratify(
+                    self.args.stratify,
+                    self.args.per_stratum,
+                    self.args.seed
+                )
+            )
+        return predicates
+
+    def filter(self, registry):
         '''
-        huggingface_filter(
-            input_conn=self.input_conn,
+        This function filters the packages of a registry.
+
+        registry: The Registry to filter.
+        '''
+        run_filter(
             output_conn=self.output_conn,
-            min_date=self.args.min_date,
-            max_date=self.args.max_date,
-            min_versions=self.args.min_versions,
-            max_versions=self.args.max_versions,
-            random_select=self.args.random_select
+            schema=self.schema,
+            registry=registry,
+            predicates=self.predicates()
         )
 
+    def huggingface(self):
+        '''
+        This function gets the packages from Hugging Face.
+        '''
+        self.filter(Registry.HUGGINGFACE)
+
     def docker(self):
         '''
         This function gets the packages from Docker Hub.
         '''
-        docker_filter(
-            input_conn=self.input_conn,
-            output_conn=self.output_conn,
-            min_date=self.args.min_date,
-            max_date=self.args.max_date,
-            min_versions=self.args.min_versions,
-            max_versions=self.args.max_versions,
-            random_select=self.args.random_select
-        )
+        self.filter(Registry.DOCKER)
 
     def maven(self):
         '''
         This function gets the packages from Maven.
         '''
-        maven_filter(
-            input_conn=self.input_conn,
-            output_conn=self.output_conn,
-            min_date=self.args.min_date,
-            max_date=self.args.max_date,
-            min_versions=self.args.min_versions,
-            max_versions=self.args.max_versions,
-            random_select=self.args.random_select
-        )
+        self.filter(Registry.MAVEN)
 
     def pypi(self):
         '''
         This function gets the packages from PyPI.
         '''
-        pypi_filter(
-            input_conn=self.input_conn,
-            output_conn=self.output_conn,
-            min_date=self.args.min_date,
-            max_date=self.args.max_date,
-            min_versions=self.args.min_versions,
-            max_versions=self.args.max_versions,
-            random_select=self.args.random_select
-        )
+        self.filter(Registry.PYPI)
 
     def all(self):
         '''
@@ -100,10 +115,20 @@ class Filter(Stage):
         '''
         self.log.info('Running Filter stage.')
 
-        # Ensure the input/output database is available
-        self.input_conn = connect_db(self.args.input)
+        # A stratified sample replaces the uniform one
+        if self.args.stratify and self.args.random_select != -1:
+            self.log.error('--stratify and --random-select can not be used '
+                           'together.')
+            exit(-1)
+        if self.args.stratify and self.args.per_stratum is None:
+            self.log.error('--stratify needs --per-stratum.')
+            exit(-1)
+
+        # Ensure the output database is available and attach the input
+        # database to it so filtering runs as statements across both
         self.output_conn = connect_db(self.args.output)
         init_db(self.output_conn)
+        self.schema = attach_db(self.output_conn, self.args.input, 'input')
 
         # Call the appropriate function this is set in the subparser defined
         # in the local __init__.py
@@ -111,5 +136,4 @@ class Filter(Stage):
 
         # Close the databases
         self.log.info('Filter stage complete. Closing databases.')
-        self.input_conn.close()
         self.output_conn.close()
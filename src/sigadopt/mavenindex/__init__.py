@@ -0,0 +1,83 @@
+'''
+__init__.py: This is the __init__ file for the mavenindex subpackage.
+'''
+
+# Imports
+from sigadopt.mavenindex.mavenindex import MavenIndex
+from sigadopt.util.files import path_exists
+
+
+def add_import(type_parser):
+    '''
+    This function adds the import subparser.
+
+    type_parser: The subparser for the stage.
+    '''
+
+    func_parser = type_parser.add_parser(
+        'import',
+        help='Import the files listed by a local copy of the Maven Central '
+        'index.'
+    )
+
+    # Set the function to use in the stage class
+    func_parser.set_defaults(type_func=MavenIndex.import_index)
+
+    # Add type specific arguments
+    func_parser.add_argument(
+        'database',
+        metavar='DATABASE',
+        type=path_exists,
+        help='The path to the database file. Will modify this file.'
+    )
+    func_parser.add_argument(
+        'index',
+        metavar='INDEX',
+        type=path_exists,
+        nargs='+',
+        help='The path to nexus-maven-repository-index.gz, optionally '
+        'followed by incremental chunks to apply in order.'
+    )
+    func_parser.add_argument(
+        '--all-packages',
+        dest='all_packages',
+        action='store_true',
+        help='Keep the files of every package in the index instead of only '
+        'the Maven packages in the database. Defaults to False.'
+    )
+    func_parser.add_argument(
+        '--replace',
+        dest='replace',
+        action='store_true',
+        help='Remove the files of earlier imports first. Defaults to False.'
+    )
+
+
+def add_arguments(top_parser):
+    '''
+    This function adds arguments to the top level parser.
+
+    top_parser: The top level parser for the script.
+    '''
+
+    # Create a parser for the maven-index stage
+    parser = top_parser.add_parser(
+        'maven-index',
+        help='Manage a local copy of the Maven Central index.'
+    )
+
+    # Give the parser a stage class to use
+    parser.set_defaults(stage=MavenIndex)
+
+    # Create subparsers for each command
+    type_parser = parser.add_subparsers(
+        title='command',
+        description='The command to run on the index.',
+        help='The command to run on the index.',
+        dest='type',
+        metavar='COMMAND',
+        required=True
+    )
+
+    # Add subparser specific arguments
+    add_import(type_parser)
@@ -0,0 +1,77 @@
+'''
+mavenindex.py: This module contains a class to manage the local copy of the
+Maven Central repository index.
+'''
+
+# Imports
+import logging
+from sigadopt.util.database import connect_db, init_db
+from sigadopt.mavenindex.nexus import import_index, maven_packages
+
+
+class MavenIndex:
+    '''
+    This class manages the files of the Maven Central repository index, so
+    the Maven adoption stage can find signed files without listing every
+    version.
+    '''
+
+    def __init__(self, args):
+        '''
+        This function initializes the class.
+
+        args: The arguments passed to the script.
+        '''
+        self.log = logging.getLogger(__name__)
+        self.log.debug('Initializing MavenIndex stage...')
+        self.args = args
+        self.log.debug(f'{self.args=}')
+
+    def import_index(self):
+        '''
+        This function imports index files into the maven_index table.
+        '''
+
+        # Only keep the packages in the database unless told otherwise
+        packages = None
+        if not self.args.all_packages:
+            packages = maven_packages(self.database)
+            if not packages:
+                self.log.error(
+                    f'No Maven packages in {self.args.database}. Run the '
+                    'packages stage first or use --all-packages.')
+                exit(-1)
+            self.log.info(f'Keeping files of {len(packages)} packages.')
+
+        if self.args.replace:
+            self.log.info('Removing the files of earlier imports.')
+            with self.database:
+                self.database.execute('DELETE FROM maven_index;')
+
+        try:
+            written, deleted = import_index(
+                self.database,
+                self.args.index,
+                packages=packages,
+            )
+        except ValueError as e:
+            self.log.error(f'Failed to read the index: {e}')
+            exit(-1)
+        self.log.info(f'Imported {written} files, removed {deleted} files.')
+
+    def run(self):
+        '''
+        This function runs the stage.
+        '''
+        self.log.info('Running MavenIndex stage.')
+
+        # Ensure the output database is available
+        self.database = connect_db(self.args.database)
+        init_db(self.database)
+
+        # Run the subcommand
+        self.args.type_func(self)
+
+        # Close the databases
+        self.log.info('MavenIndex stage complete. Closing database.')
+        self.database.close()
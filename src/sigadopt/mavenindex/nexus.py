@@ -0,0 +1,304 @@
+'''
+nexus.py: This module reads the Maven Central repository index
+(nexus-maven-repository-index) and imports the files it lists into the
+maven_index table.
+'''
+
+# Imports
+import io
+import gzip
+import struct
+import logging
+from datetime import datetime, timezone
+from sigadopt.util.database import Registry, set_progress
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Version of the index data format
+INDEX_VERSION = 1
+
+# Progress key of the timestamp of the last imported index
+TIMESTAMP_KEY = 'maven_index_timestamp'
+
+# Fields of a document that are decoded, the rest are skipped
+UINFO = 'u'
+INFO = 'i'
+DELETED = 'del'
+FIELDS = {UINFO.encode(), INFO.encode(), DELETED.encode()}
+
+# Classifier of the main file of an artifact
+NO_CLASSIFIER = 'NA'
+
+# Signature availability of a file that has a signature
+SIG_PRESENT = '1'
+
+# Flags of a written field: indexed and stored
+FIELD_FLAGS = 5
+
+INT = struct.Struct('>i')
+LONG = struct.Struct('>q')
+
+
+def open_index(path):
+    '''
+    This function opens an index file, compressed with gzip or not.
+
+    path: the path to the index file.
+
+    returns: a buffered binary stream of the index data.
+    '''
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return io.BufferedReader(gzip.open(path), buffer_size=1 << 20)
+    return open(path, 'rb', buffering=1 << 20)
+
+
+def decode(raw):
+    '''
+    This function decodes a string written by Java's DataOutput, which uses
+    modified UTF-8: NUL is two bytes and characters outside the BMP are
+    surrogate pairs.
+
+    raw: the encoded bytes.
+
+    returns: the string.
+    '''
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        text = raw.replace(b'\xc0\x80', b'\x00').decode(
+            'utf-8', 'surrogatepass')
+        return text.encode('utf-16', 'surrogatepass').decode('utf-16')
+
+
+def encode(text):
+    '''
+    This function encodes a string the way Java's DataOutput does, in
+    modified UTF-8.
+
+    text: the string.
+
+    returns: the encoded bytes.
+    '''
+    pairs = ''.join(
+        c if ord(c) <= 0xffff else
+        chr(0xd800 + ((ord(c) - 0x10000) >> 10)) +
+        chr(0xdc00 + ((ord(c) - 0x10000) & 0x3ff))
+        for c in text
+    )
+    return pairs.encode('utf-8', 'surrogatepass').replace(b'\x00', b'\xc0\x80')
+
+
+def read_exact(stream, size):
+    '''
+    This function reads exactly size bytes from a stream.
+
+    stream: the stream to read from.
+    size: the number of bytes to read.
+
+    returns: the bytes.
+    '''
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError('The index is truncated.')
+    return data
+
+
+def read_header(stream):
+    '''
+    This function reads the header of an index file.
+
+    stream: the stream of the index data.
+
+    returns: the time the index was published, or None if it is not set.
+    '''
+    version = read_exact(stream, 1)[0]
+    if version != INDEX_VERSION:
+        raise ValueError(f'Unsupported index version {version}.')
+    timestamp, = LONG.unpack(read_exact(stream, 8))
+    if timestamp == -1:
+        return None
+    return datetime.fromtimestamp(timestamp / 1000, timezone.utc)
+
+
+def read_documents(stream):
+    '''
+    This function reads the documents of an index file. A document is a list
+    of fields, each a flags byte, a name with a two byte length and a value
+    with a four byte length. Only the fields in FIELDS are decoded.
+
+    stream: the stream of the index data, after the header.
+
+    returns: a generator of dictionaries of field name to value.
+    '''
+    read = stream.read
+    while True:
+        head = read(4)
+        if not head:
+            return
+        if len(head) != 4:
+            raise ValueError('The index is truncated.')
+        count, = INT.unpack(head)
+
+        document = {}
+        for _ in range(count):
+            flags_size = read_exact(stream, 3)
+            name = read_exact(stream, flags_size[1] << 8 | flags_size[2])
+            size, = INT.unpack(read_exact(stream, 4))
+            value = read_exact(stream, size)
+            if name in FIELDS:
+                document[name.decode()] = decode(value)
+        yield document
+
+
+def write_index(path, documents, published=None):
+    '''
+    This function writes documents in the index data format, compressed with
+    gzip like the index Maven Central publishes.
+
+    path: the path to write the index to.
+    documents: an iterable of lists of (field name, value).
+    published: the time the index was published, or None.
+    '''
+    timestamp = -1 if published is None else \
+        int(published.timestamp() * 1000)
+    with gzip.open(path, 'wb') as f:
+        f.write(bytes([INDEX_VERSION]) + LONG.pack(timestamp))
+        for document in documents:
+            f.write(INT.pack(len(document)))
+            for name, value in document:
+                name = encode(name)
+                value = encode(value)
+                f.write(bytes([FIELD_FLAGS]) + len(name).to_bytes(2, 'big'))
+                f.write(name + INT.pack(len(value)) + value)
+
+
+def parse_uinfo(uinfo, info=None):
+    '''
+    This function splits the unique key of an indexed file, which is
+    group|artifact|version|classifier|extension. Old documents leave the
+    extension out and keep it in the info field.
+
+    uinfo: the unique key.
+    info: the info field, if the document has one.
+
+    returns: (package name, version name, suffix), or None if the extension
+    is unknown.
+    '''
+    parts = uinfo.split('|')
+    if len(parts) < 4:
+        return None
+    group, artifact, version, classifier = parts[:4]
+    if len(parts) > 4:
+        extension = parts[4]
+    elif info is not None and len(info) > 6:
+        extension = info[6]
+    else:
+        return None
+
+    suffix = '' if classifier == NO_CLASSIFIER else f'-{classifier}'
+    return f'{group}:{artifact}', version, f'{suffix}.{extension}'
+
+
+def import_index(database, paths, packages=None, batch_size=50000):
+    '''
+    This function imports the files listed by index files into the
+    maven_index table. The files are applied in order, so a full index can
+    be followed by its incremental chunks.
+
+    database: the database to use.
+    paths: the paths to the index files.
+    packages: the set of package names to keep files for, or None to keep
+    all files.
+    batch_size: the number of files written per transaction.
+
+    returns: (files written, files deleted).
+    '''
+    written = 0
+    deleted = 0
+    timestamp = None
+    rows = []
+
+    def write():
+        nonlocal written, rows
+        with database:
+            database.executemany(
+                '''
+                INSERT OR REPLACE INTO maven_index
+                (package_name, version_name, suffix, has_sig)
+                VALUES (?, ?, ?, ?);
+                ''',
+                rows
+            )
+        written += len(rows)
+        rows = []
+
+    for path in paths:
+        log.info(f'Reading index {path}.')
+        with open_index(path) as stream:
+            published = read_header(stream)
+            log.info(f'Index published {published or "at an unknown time"}.')
+            for document in read_documents(stream):
+
+                # Remove the files the index deleted, after the files before
+                # them are written
+                if DELETED in document:
+                    key = parse_uinfo(document[DELETED])
+                    if key is None:
+                        continue
+                    if rows:
+                        write()
+                    with database:
+                        deleted += database.execute(
+                            '''
+                            DELETE FROM maven_index
+                            WHERE package_name = ? AND version_name = ?
+                            AND suffix = ?;
+                            ''',
+                            key
+                        ).rowcount
+                    continue
+
+                # Skip descriptor and group documents
+                if UINFO not in document or INFO not in document:
+                    continue
+                info = document[INFO].split('|')
+                key = parse_uinfo(document[UINFO], info)
+                if key is None:
+                    continue
+                if packages is not None and key[0] not in packages:
+                    continue
+
+                rows.append(
+                    key + (int(len(info) > 5 and info[5] == SIG_PRESENT),))
+                if len(rows) >= batch_size:
+                    write()
+                    log.info(f'Wrote {written} files.')
+
+        if published is not None:
+            timestamp = published
+
+    if rows:
+        write()
+    if timestamp is not None:
+        with database:
+            set_progress(database, TIMESTAMP_KEY, timestamp.isoformat())
+    return written, deleted
+
+
+def maven_packages(database):
+    '''
+    This function gets the names of the Maven packages in a database.
+
+    database: the database to use.
+
+    returns: a set of package names.
+    '''
+    with database:
+        rows = database.execute(
+            'SELECT name FROM packages WHERE registry_id = ?;',
+            (Registry.MAVEN,)
+        ).fetchall()
+    return {row[0] for row in rows}
@@ -3,8 +3,10 @@ __init__.py: This is the __init__ file for the packages subpackage.
 '''
 
 # Imports
+from pathlib import Path
 from sigadopt.packages.packages import Packages
-from sigadopt.util.files import path_exists, path_create
+from sigadopt.util.files import path_exists, path_create, dir_create
+from sigadopt.util.database import Registry
 
 
 def add_hf_args(registry_parser):
@@ -21,7 +23,10 @@ def add_hf_args(registry_parser):
     )
 
     # Set the function to use in the stage class
-    huggingface_parser.set_defaults(reg_func=Packages.huggingface)
+    huggingface_parser.set_defaults(
+        reg_func=Packages.huggingface,
+        registry_id=Registry.HUGGINGFACE
+    )
 
     # Add Hugging Face specific arguments
     hf_token_group = huggingface_parser.add_argument_group(
@@ -46,6 +51,13 @@ def add_hf_args(registry_parser):
         default=None,
         help='The path to the file containing the Hugging Face API token.'
     )
+    huggingface_parser.add_argument(
+        '--resume',
+        dest='resume',
+        action='store_true',
+        help='Continue an interrupted listing from the last committed page '
+        'instead of starting over.'
+    )
 
 
 def add_hfcommits_args(registry_parser):
@@ -63,7 +75,47 @@ def add_hfcommits_args(registry_parser):
     )
 
     # Set the function to use in the stage class
-    huggingface_parser.set_defaults(reg_func=Packages.hfcommits)
+    huggingface_parser.set_defaults(
+        reg_func=Packages.hfcommits,
+        registry_id=Registry.HUGGINGFACE
+    )
+
+    # Add commit harvesting arguments
+    huggingface_parser.add_argument(
+        '--workers',
+        '-w',
+        dest='workers',
+        metavar='N',
+        type=int,
+        default=8,
+        help='The number of models to get commits for at the same time. '
+        'Requests still go through the shared rate limiter. Defaults to 8.'
+    )
+    huggingface_parser.add_argument(
+        '--retry-failed',
+        dest='retry_failed',
+        action='store_true',
+        help='Only get the commits of models that failed in an earlier run. '
+        'Failed models are kept in the retries table.'
+    )
+    huggingface_parser.add_argument(
+        '--incremental',
+        '-i',
+        dest='incremental',
+        action='store_true',
+        help='Get the new commits of every model. The commit history is read '
+        'newest first and stops at the first commit already in the database.'
+    )
+    huggingface_parser.add_argument(
+        '--git-mirror',
+        dest='git_mirror',
+        metavar='DIR',
+        type=dir_create,
+        default=None,
+        help='The directory to keep blobless git mirrors of the models in. '
+        'If set, commits are read from the mirrors instead of the API. A '
+        'mirror is cloned once and later runs only fetch new objects.'
+    )
 
     # Add Hugging Face specific arguments
     hf_token_group = huggingface_parser.add_argument_group(
@@ -104,7 +156,10 @@ def add_pypi_args(registry_parser):
     )
 
     # Set the function to use in the stage class
-    pypi_parser.set_defaults(reg_func=Packages.pypi)
+    pypi_parser.set_defaults(
+        reg_func=Packages.pypi,
+        registry_id=Registry.PYPI
+    )
 
     # Add PyPI specific arguments
     pypi_parser.add_argument(
@@ -119,6 +174,134 @@ def add_pypi_args(registry_parser):
         'authentication information is in the GOOGLE_APPLICATION_CREDENTIALS '
         'environment variable.'
     )
+    pypi_parser.add_argument(
+        '--chunk-size',
+        dest='chunk_size',
+        metavar='N',
+        type=int,
+        default=50000,
+        help='The largest number of files written to the output database per '
+        'batch. Each batch is committed. Defaults to 50000.'
+    )
+    pypi_parser.add_argument(
+        '--resume',
+        dest='resume',
+        action='store_true',
+        help='Continue an interrupted load from the last committed package '
+        'instead of starting over.'
+    )
+    pypi_parser.add_argument(
+        '--incremental',
+        '-i',
+        dest='incremental',
+        action='store_true',
+        help='Only get files uploaded after the newest file already in the '
+        'database and upsert them. The first load is a full load.'
+    )
+
+    # Add PyPI result cache arguments
+    cache_group = pypi_parser.add_argument_group(
+        'Result Cache',
+        'Cache the BigQuery result as compressed Parquet so later runs do not '
+        'scan the table again. Results are keyed by the query and a snapshot '
+        'label.')
+    cache_group.add_argument(
+        '--cache-dir',
+        dest='cache_dir',
+        metavar='DIR',
+        type=dir_create,
+        default=None,
+        help='The directory holding cached query results. A cached result '
+        'for the same query and snapshot is loaded instead of querying.'
+    )
+    cache_group.add_argument(
+        '--snapshot',
+        dest='snapshot',
+        metavar='LABEL',
+        type=str,
+        default='latest',
+        help='The label of the snapshot to cache or load. Use a new label to '
+        'fetch fresh data. Defaults to latest.'
+    )
+    cache_group.add_argument(
+        '--from-cache',
+        dest='from_cache',
+        action='store_true',
+        help='Only load from the cache. Fails instead of querying BigQuery '
+        'when there is no cached result.'
+    )
+    cache_group.add_argument(
+        '--import-parquet',
+        dest='import_path',
+        metavar='FILE',
+        type=path_exists,
+        default=None,
+        help='Prepare the cache for the snapshot from a local Parquet file '
+        'with the distribution_metadata columns, then load from it.'
+    )
+
+
+def add_ecosystems_args(parser):
+    '''
+    This function adds arguments shared by the registries that are loaded
+    from the ecosystems database.
+
+    parser: The subparser for the registry.
+    '''
+    parser.add_argument(
+        '--source',
+        dest='source',
+        choices=['postgres', 'dump', 'sqlite'],
+        default='postgres',
+        help='Where to read the ecosystems data from: the live PostgreSQL '
+        'database, a directory of packages and versions table dumps '
+        '(.parquet, .csv or .csv.gz), or an SQLite database with those '
+        'tables. Defaults to postgres.'
+    )
+    parser.add_argument(
+        '--source-path',
+        dest='source_path',
+        metavar='PATH',
+        type=Path,
+        default=None,
+        help='The path to the dump directory or SQLite database. Required '
+        'for the dump and sqlite sources.'
+    )
+    parser.add_argument(
+        '--eco-registry-id',
+        dest='eco_registry_id',
+        metavar='ID',
+        type=int,
+        default=None,
+        help='The id of the registry in the ecosystems data, for dumps that '
+        'number registries differently. Defaults to the id used by the '
+        'ecosystems database.'
+    )
+    parser.add_argument(
+        '--itersize',
+        dest='itersize',
+        metavar='N',
+        type=int,
+        default=10000,
+        help='The number of rows each server-side cursor fetches from the '
+        'ecosystems database at a time. Defaults to 10000.'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        dest='chunk_size',
+        metavar='N',
+        type=int,
+        default=50000,
+        help='The number of rows written to the output database per batch. '
+        'Each batch is committed. Defaults to 50000.'
+    )
+    parser.add_argument(
+        '--copy',
+        dest='copy',
+        action='store_true',
+        help='Read from the ecosystems database with COPY ... TO STDOUT in '
+        'CSV form instead of cursors. This is faster for large registries.'
+    )
 
 
 def add_docker_args(registry_parser):
@@ -135,7 +318,13 @@ def add_docker_args(registry_parser):
     )
 
     # Set the function to use in the stage class
-    docker_parser.set_defaults(reg_func=Packages.docker)
+    docker_parser.set_defaults(
+        reg_func=Packages.docker,
+        registry_id=Registry.DOCKER
+    )
+
+    # Add Docker specific arguments
+    add_ecosystems_args(docker_parser)
 
 
 def add_maven_args(registry_parser):
@@ -152,7 +341,13 @@ def add_maven_args(registry_parser):
     )
 
     # Set the function to use in the stage class
-    maven_parser.set_defaults(reg_func=Packages.maven)
+    maven_parser.set_defaults(
+        reg_func=Packages.maven,
+        registry_id=Registry.MAVEN
+    )
+
+    # Add Maven specific arguments
+    add_ecosystems_args(maven_parser)
 
 
 def add_arguments(top_parser):
@@ -175,7 +370,8 @@ def add_arguments(top_parser):
         type=path_create,
         help='The path to the output database file.'
     )
-    parser.add_argument(
+    update_group = parser.add_mutually_exclusive_group()
+    update_group.add_argument(
         '--clean',
         '-c',
         dest='clean',
@@ -183,6 +379,16 @@ def add_arguments(top_parser):
         help='Flag to clear existing data from the database before adding new '
         'data. Defaults to False.'
     )
+    update_group.add_argument(
+        '--refresh',
+        '-r',
+        dest='refresh',
+        action='store_true',
+        help='Update existing data in place instead of clearing it. Package '
+        'and version ids are kept, and the versions that were added or '
+        'changed are recorded so the adoption stage can check only those '
+        'with --changed-only.'
+    )
 
     # Give the parser a stage class to use
     parser.set_defaults(stage=Packages)
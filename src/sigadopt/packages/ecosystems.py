@@ -0,0 +1,307 @@
+'''
+ecosystems.py: This module loads the packages and versions of a registry from
+an ecosystems source into the output database.
+'''
+
+# Import statements
+import queue
+import logging
+import threading
+from sigadopt.util.database import clean_db
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Marker a reader puts on the queue when its query is exhausted
+DONE = object()
+
+
+def create_staging(output_conn):
+    '''
+    This function creates the temporary staging tables used to remap
+    ecosystems package ids to local package ids.
+
+    output_conn: A connection to the output database.
+    '''
+    with output_conn:
+        output_conn.execute(
+            '''
+            CREATE TEMP TABLE IF NOT EXISTS eco_packages (
+                eco_id INTEGER,
+                name TEXT,
+                versions_count INTEGER,
+                latest_release_date TEXT,
+                first_release_date TEXT,
+                downloads INTEGER,
+                downloads_period TEXT
+            );
+            '''
+        )
+        output_conn.execute(
+            '''
+            CREATE TEMP TABLE IF NOT EXISTS eco_versions (
+                eco_package_id INTEGER,
+                name TEXT,
+                date TEXT
+            );
+            '''
+        )
+        output_conn.execute(
+            '''
+            CREATE TEMP TABLE IF NOT EXISTS pending_versions (
+                eco_package_id INTEGER,
+                name TEXT,
+                date TEXT
+            );
+            '''
+        )
+        output_conn.execute(
+            '''
+            CREATE INDEX IF NOT EXISTS temp.pending_versions_package
+            ON pending_versions (eco_package_id);
+            '''
+        )
+        output_conn.execute(
+            '''
+            CREATE TEMP TABLE IF NOT EXISTS package_map (
+                eco_id INTEGER PRIMARY KEY,
+                id INTEGER NOT NULL
+            );
+            '''
+        )
+        output_conn.execute('DELETE FROM temp.package_map;')
+        output_conn.execute('DELETE FROM temp.pending_versions;')
+
+
+def write_packages(output_conn, registry, chunk):
+    '''
+    This function upserts a chunk of packages and records the local id of
+    each ecosystems package id. Packages already loaded keep their ids.
+    Versions that arrived before their package are written as soon as the
+    package is mapped.
+
+    output_conn: A connection to the output database.
+    registry: The Registry the packages belong to.
+    chunk: The package rows from the ecosystems database.
+
+    returns: The number of pending versions that were written or changed.
+    '''
+    with output_conn:
+        output_conn.executemany(
+            '''
+            INSERT INTO temp.eco_packages
+            VALUES (?, ?, ?, ?, ?, ?, ?);
+            ''',
+            chunk
+        )
+        output_conn.execute(
+            '''
+            INSERT INTO packages (registry_id, name, versions_count,
+                latest_release_date, first_release_date, downloads,
+                downloads_period)
+            SELECT ?, name, versions_count, latest_release_date,
+                first_release_date, downloads, downloads_period
+            FROM temp.eco_packages
+            WHERE true
+            ON CONFLICT (name, registry_id) DO UPDATE SET
+                versions_count = excluded.versions_count,
+                latest_release_date = excluded.latest_release_date,
+                first_release_date = excluded.first_release_date,
+                downloads = excluded.downloads,
+                downloads_period = excluded.downloads_period;
+            ''',
+            (registry,)
+        )
+        output_conn.execute(
+            '''
+            INSERT INTO temp.package_map (eco_id, id)
+            SELECT e.eco_id, p.id
+            FROM temp.eco_packages e
+            JOIN packages p
+            ON p.registry_id = ? AND p.name = e.name;
+            ''',
+            (registry,)
+        )
+
+        # Release the versions waiting on the packages in this chunk
+        released = output_conn.execute(
+            '''
+            INSERT INTO versions (package_id, name, date)
+            SELECT m.id, v.name, v.date
+            FROM temp.eco_packages e
+            JOIN temp.package_map m
+            ON m.eco_id = e.eco_id
+            JOIN temp.pending_versions v
+            ON v.eco_package_id = e.eco_id
+            WHERE true
+            ON CONFLICT (package_id, name) DO UPDATE SET
+                date = excluded.date
+            WHERE versions.date IS NOT excluded.date;
+            '''
+        ).rowcount
+        output_conn.execute(
+            '''
+            DELETE FROM temp.pending_versions
+            WHERE eco_package_id IN (
+                SELECT eco_id FROM temp.eco_packages
+            );
+            '''
+        )
+        output_conn.execute('DELETE FROM temp.eco_packages;')
+    return released
+
+
+def write_versions(output_conn, chunk):
+    '''
+    This function upserts a chunk of versions, remapping their package ids
+    with a join against the package map. Versions whose package has not been
+    mapped yet are kept in a pending table until it is.
+
+    output_conn: A connection to the output database.
+    chunk: The version rows from the ecosystems database.
+
+    returns: The number of versions that were written or changed.
+    '''
+    with output_conn:
+        output_conn.executemany(
+            'INSERT INTO temp.eco_versions VALUES (?, ?, ?);',
+            chunk
+        )
+        written = output_conn.execute(
+            '''
+            INSERT INTO versions (package_id, name, date)
+            SELECT m.id, e.name, e.date
+            FROM temp.eco_versions e
+            JOIN temp.package_map m
+            ON m.eco_id = e.eco_package_id
+            WHERE true
+            ON CONFLICT (package_id, name) DO UPDATE SET
+                date = excluded.date
+            WHERE versions.date IS NOT excluded.date;
+            '''
+        ).rowcount
+        output_conn.execute(
+            '''
+            INSERT INTO temp.pending_versions
+            SELECT e.*
+            FROM temp.eco_versions e
+            LEFT JOIN temp.package_map m
+            ON m.eco_id = e.eco_package_id
+            WHERE m.eco_id IS NULL;
+            '''
+        )
+        output_conn.execute('DELETE FROM temp.eco_versions;')
+    return written
+
+
+def read(chunks, out, stop, kind):
+    '''
+    This function runs on a reader thread. It puts the chunks of one source
+    query on a bounded queue so reading overlaps with writing.
+
+    chunks: The iterable of chunks from the source.
+    out: The queue shared with the writer.
+    stop: An Event set when the writer gives up.
+    kind: The label put on each chunk.
+    '''
+    def put(item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        for chunk in chunks:
+            if not put((kind, chunk)):
+                return
+        put((kind, DONE))
+    except Exception as e:
+        put((kind, e))
+
+
+def load(
+    output_conn,
+    source,
+    eco_registry_id,
+    registry,
+    clean=False,
+    chunk_size=50000,
+    queue_size=4,
+):
+    '''
+    This function streams the packages and versions of a registry from an
+    ecosystems source into the output database. The packages and versions
+    queries run at the same time on reader threads, and the calling thread is
+    the only writer. Rows are written in fixed-size chunks through staging
+    tables, each chunk followed by a commit, so memory use does not grow with
+    the size of the registry.
+
+    output_conn: A connection to the output database.
+    source: The Source to read the ecosystems data from.
+    eco_registry_id: The id of the registry in the ecosystems database.
+    registry: The Registry to load the packages into.
+    clean: Whether to clear the tables for the registry before adding the new
+    data.
+    chunk_size: The number of rows written per executemany and commit.
+    queue_size: The number of chunks read ahead of the writer.
+    '''
+
+    # Clean output database
+    if clean:
+        log.info(f'Clearing tables for {registry.name}.')
+        clean_db(output_conn, registry)
+    create_staging(output_conn)
+
+    # Start a reader for each query
+    log.info(f'Getting packages and versions for {registry.name}.')
+    chunks = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    readers = [
+        threading.Thread(
+            target=read,
+            args=(query(eco_registry_id, chunk_size), chunks, stop, kind),
+            name=f'ecosystems-{kind}',
+            daemon=True
+        ) for kind, query in [
+            ('packages', source.packages),
+            ('versions', source.versions),
+        ]
+    ]
+    for reader in readers:
+        reader.start()
+
+    # Write chunks as they arrive
+    packages = versions = 0
+    running = len(readers)
+    try:
+        while running:
+            kind, chunk = chunks.get()
+            if chunk is DONE:
+                running -= 1
+                log.info(f'Finished reading {kind}.')
+            elif isinstance(chunk, Exception):
+                raise chunk
+            elif kind == 'packages':
+                versions += write_packages(output_conn, registry, chunk)
+                packages += len(chunk)
+                log.info(f'Committed {packages} packages.')
+            else:
+                versions += write_versions(output_conn, chunk)
+                log.info(f'Committed {versions} versions.')
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+    # Versions still pending have no package in the registry
+    with output_conn:
+        orphans = output_conn.execute(
+            'SELECT COUNT(*) FROM temp.pending_versions;'
+        ).fetchone()[0]
+        output_conn.execute('DELETE FROM temp.pending_versions;')
+    if orphans:
+        log.warning(f'Skipped {orphans} versions without a package.')
+    log.info(f'Committed {packages} packages and {versions} versions.')
@@ -5,8 +5,137 @@ from Hugging Face.
 
 # Import statements
 import logging
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from huggingface_hub.hf_api import list_repo_commits
-from sigadopt.util.database import clean_db
+from huggingface_hub.utils import HfHubHTTPError
+from sigadopt.util import http, ratelimit, gitmirror
+from sigadopt.util.database import clean_db, Registry
+from sigadopt.packages.huggingface import parse_timestamp
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Hugging Face commit history endpoint, newest commit first
+COMMITS_URL = 'https://huggingface.co/api/models/{}/commits/main'
+
+
+def get_commits(model_id, token):
+    '''
+    This function gets the commits of a model. It runs on a worker thread and
+    shares the rate limiter with every other request to Hugging Face.
+
+    model_id: The id of the model.
+    token: The Hugging Face API token, or None.
+
+    returns: A dictionary of commit id to commit date.
+    '''
+    with ratelimit.limiter.limit('huggingface.co') as slot:
+        try:
+            commits = list_repo_commits(model_id, token=token)
+        except HfHubHTTPError as e:
+            slot.status = getattr(e.response, 'status_code', None)
+            raise
+
+    # Use a dict to ensure no duplicates
+    return {
+        commit.commit_id: commit.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        for commit in commits
+    }
+
+
+def get_new_commits(model_id, token, known):
+    '''
+    This function pages through the commits of a model from newest to oldest
+    and stops at the first commit that is already known, so only the new
+    commits are fetched.
+
+    model_id: The id of the model.
+    token: The Hugging Face API token, or None.
+    known: The set of commit ids already in the database.
+
+    returns: A dictionary of commit id to commit date for the new commits.
+    '''
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    url = COMMITS_URL.format(quote(model_id, safe='/'))
+    commits = {}
+    while url is not None:
+        response = http.fetch(url, headers=headers, timeout=60)
+        response.raise_for_status()
+        for commit in response.json():
+            if commit['id'] in known:
+                return commits
+            commits[commit['id']] = parse_timestamp(
+                commit['date']).strftime('%Y-%m-%d %H:%M:%S')
+        url = response.links.get('next', {}).get('url')
+    return commits
+
+
+def get_mirror_commits(model_id, token, git_mirror):
+    '''
+    This function gets the commits of a model from a blobless git mirror of
+    its repository. The mirror is cloned on first use and fetched afterwards,
+    so only new commits and trees are transferred.
+
+    model_id: The id of the model.
+    token: The Hugging Face API token, or None.
+    git_mirror: The directory holding the git mirrors.
+
+    returns: A dictionary of commit id to commit date.
+    '''
+    with gitmirror.sync(git_mirror, model_id, token) as repo:
+        return gitmirror.commits(repo)
+
+
+def write_results(output_conn, results):
+    '''
+    This function writes the commits of a batch of models in one
+    transaction. Models that failed are recorded in the retries table and
+    models that succeeded are removed from it.
+
+    output_conn: A connection to the output database.
+    results: A list of (package_id, commits, error) tuples. commits is None
+    when the model failed.
+    '''
+    done = [(pid, commits) for pid, commits, _ in results if commits]
+    failed = [(pid, str(e)) for pid, commits, e in results if e is not None]
+    with output_conn:
+        output_conn.executemany(
+            '''
+            INSERT INTO versions (package_id, name, date)
+            VALUES (?, ?, ?)
+            ON CONFLICT (package_id, name) DO NOTHING;
+            ''',
+            [
+                (pid, commit_id, created_at)
+                for pid, commits in done
+                for commit_id, created_at in commits.items()
+            ]
+        )
+        output_conn.executemany(
+            '''
+            UPDATE packages
+            SET versions_count = (
+                SELECT COUNT(*) FROM versions WHERE package_id = ?
+            )
+            WHERE id = ?;
+            ''',
+            [(pid, pid) for pid, commits in done]
+        )
+        output_conn.executemany(
+            '''
+            INSERT INTO retries (package_id, attempts, error)
+            VALUES (?, 1, ?)
+            ON CONFLICT (package_id) DO UPDATE SET
+                attempts = attempts + 1,
+                error = excluded.error;
+            ''',
+            failed
+        )
+        output_conn.executemany(
+            'DELETE FROM retries WHERE package_id = ?;',
+            [(pid,) for pid, _, e in results if e is None]
+        )
 
 
 def packages(
@@ -14,22 +143,38 @@ def packages(
     token_path=None,
     token=None,
     clean=False,
+    refresh=False,
+    workers=8,
+    batch_size=100,
+    retry_failed=False,
+    incremental=False,
+    git_mirror=None,
 ):
     '''
     This function gets the repositories and associated metadata from
-    HuggingFace. The data is saved in the output_conn database.
+    HuggingFace. The data is saved in the output_conn database. Commits are
+    fetched by a pool of worker threads while this thread writes the results
+    in batches.
 
     output_conn: The path to the output database.
     token_path: The path to the file containing the HuggingFace API token.
     token: The HuggingFace API token. If this is provided, token_path is
     ignored.
     clean: Whether to clear the versions table before adding the new data.
+    refresh: Whether to get the commits of packages that already have
+    versions and add the new ones.
+    workers: The number of models fetched at the same time.
+    batch_size: The number of models written per commit.
+    retry_failed: Whether to only get the models in the retries table.
+    incremental: Whether to only get the commits newer than the newest one
+    already in the database, for every model.
+    git_mirror: The directory holding blobless git mirrors of the models. If
+    set, commits are read from the mirrors instead of the API.
 
     returns: None
     '''
 
     # Log start of function
-    log = logging.getLogger(__name__)
     log.info("Getting Hugging Face packages from local database.")
 
     # Read in token for huggingface api
@@ -40,23 +185,16 @@ def packages(
             hf_token = f.read().strip()
 
     # Get list of all models on HuggingFace
-    package_list = None
     with output_conn:
-        # Create the cursor
-        output_cursor = output_conn.cursor()
-
-        # Create the query
-        query = '''
+        package_list = output_conn.execute(
+            '''
             SELECT id, name, versions_count
             FROM packages
-            WHERE registry_id = 1;
-        '''
-
-        # Execute the query
-        output_cursor.execute(query)
-
-        # Fetch the data
-        package_list = output_cursor.fetchall()
+            WHERE registry_id = ?
+            AND (? = 0 OR id IN (SELECT package_id FROM retries));
+            ''',
+            (Registry.HUGGINGFACE, retry_failed)
+        ).fetchall()
 
     # Clean the versions table
     if clean:
@@ -64,78 +202,64 @@ def packages(
         log.info('Cleaning versions for Hugging Face.')
         clean_db(output_conn, 1, 1)
 
-    # Get commits for each package
-    log.info('Getting commits from Hugging Face.')
-    with output_conn:
+    # Skip if we already have the versions
+    package_list = [
+        (package_id, model_id)
+        for package_id, model_id, versions_count in package_list
+        if refresh or retry_failed or incremental or not versions_count
+    ]
+    log.info(f'Getting commits for {len(package_list)} models.')
 
-        # Create the cursor
-        output_cursor = output_conn.cursor()
-
-        # Tracker for number of failed packages
-        failed_packages = 0
-
-        # Iterate through the packages
-        for indx, package in enumerate(package_list):
-
-            # Info from package
-            package_id = package[0]
-            model_id = package[1]
-            versions_count = package[2]
-
-            # Skip if we already have the versions
-            if versions_count:
-                continue
-
-            # Get commits
-            commits = None
-            try:
-                commits = list_repo_commits(model_id, token=hf_token)
-            except Exception as e:
-                failed_packages += 1
-                log.warning(f'Unable to get commits for {model_id}')
-                log.debug(e)
-
-            # Update package with number of versions or delete if no versions
-            if commits:
-
-                # Create a set of commits to ensure no duplicates
-                commits = {
-                    commit.commit_id: commit.created_at for commit in commits}
-
-                # Insert commits into output database
-                for commit_id, created_at in commits.items():
-                    try:
-                        output_cursor.execute(
-                            '''
-                                INSERT INTO versions (package_id, name, date)
-                                VALUES (?, ?, ?);
-                            ''',
-                            (
-                                package_id,           # package_id
-                                commit_id,            # name
-                                created_at.strftime('%Y-%m-%d %H:%M:%S')
-                            )
-                        )
-                    except Exception as e:
-                        log.error(
-                            f'Error inserting commit {commit_id} '
-                            f'for {model_id}'
+    # Fetch with a pool of workers, keeping a bounded number of models in
+    # flight, and write from this thread only
+    failed_packages = 0
+    processed = 0
+    results = []
+    models = iter(package_list)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        while True:
+            for package_id, model_id in models:
+                if git_mirror:
+                    future = pool.submit(
+                        get_mirror_commits, model_id, hf_token, git_mirror)
+                elif incremental:
+                    known = {
+                        row[0] for row in output_conn.execute(
+                            'SELECT name FROM versions WHERE package_id = ?;',
+                            (package_id,)
                         )
-                        log.debug(e)
-
-                    output_cursor.execute(
-                        '''
-                            UPDATE packages
-                            SET versions_count = ?
-                            WHERE id = ?;
-                        ''',
-                        (len(commits), package_id)
-                    )
-
-            # Log progress and make the occasional commit
-            if indx % 100 == 0:
-                log.info(f'Processing package {indx}.')
-                output_conn.commit()
-
-        # Log the number of failed packages
-        log.info(f'Failed to get commits for {failed_packages} packages.')
+                    }
+                    future = pool.submit(
+                        get_new_commits, model_id, hf_token, known)
+                else:
+                    future = pool.submit(get_commits, model_id, hf_token)
+                pending[future] = (package_id, model_id)
+                if len(pending) >= workers * 4:
+                    break
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                package_id, model_id = pending.pop(future)
+                try:
+                    results.append((package_id, future.result(), None))
+                except Exception as e:
+                    failed_packages += 1
+                    log.warning(f'Unable to get commits for {model_id}')
+                    log.debug(e)
+                    results.append((package_id, None, e))
+
+            # Write a full batch
+            if len(results) >= batch_size:
+                write_results(output_conn, results)
+                processed += len(results)
+                results = []
+                log.info(f'Processed {processed} models.')
+
+    # Write the rest
+    write_results(output_conn, results)
+
+    # Log the number of failed packages
+    log.info(f'Failed to get commits for {failed_packages} packages.')
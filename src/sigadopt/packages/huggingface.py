@@ -5,26 +5,96 @@ from Hugging Face.
 
 # Import statements
 import logging
-from huggingface_hub.hf_api import list_models
-from sigadopt.util.database import clean_db
+from datetime import datetime
+from urllib.parse import urlencode
+from sigadopt.util import http
+from sigadopt.util.database import (
+    clean_db,
+    get_progress,
+    set_progress,
+    Registry,
+)
 
+# Create a logger
+log = logging.getLogger(__name__)
 
-def packages(output_conn, token_path=None, token=None, clean=False):
+# Hugging Face model listing endpoint
+MODELS_URL = 'https://huggingface.co/api/models'
+
+# Number of models requested per page
+PAGE_SIZE = 1000
+
+# Fields of each model the schema stores
+FIELDS = ('createdAt', 'lastModified', 'downloads')
+
+# Checkpoint key for the url of the next page
+PROGRESS_KEY = 'huggingface.models.next'
+
+
+def first_page():
+    '''
+    This function builds the url of the first page of the model listing,
+    asking only for the fields the schema stores.
+
+    returns: The url.
+    '''
+    query = [('limit', PAGE_SIZE)] + [('expand[]', f) for f in FIELDS]
+    return f'{MODELS_URL}?{urlencode(query)}'
+
+
+def parse_timestamp(value):
+    '''
+    This function parses a timestamp from the API.
+
+    value: The ISO 8601 timestamp.
+
+    returns: The timestamp as a datetime.
+    '''
+
+    # fromisoformat only accepts a trailing Z from Python 3.11
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
+
+
+def timestamp(value):
+    '''
+    This function converts a timestamp from the API to the format used in the
+    database.
+
+    value: The ISO 8601 timestamp, or None.
+
+    returns: The timestamp as stored in the database, or None.
+    '''
+    if value is None:
+        return None
+    return str(parse_timestamp(value))
+
+
+def packages(
+    output_conn,
+    token_path=None,
+    token=None,
+    clean=False,
+    resume=False,
+):
     '''
     This function gets the repositories and associated metadata from
-    HuggingFace. The data is saved in the output_conn database.
+    HuggingFace. The data is saved in the output_conn database. Models are
+    listed a page at a time and each page is committed together with the url
+    of the next one, so an interrupted listing can be resumed.
 
     output_conn: The path to the output database.
     token_path: The path to the file containing the HuggingFace API token.
     token: The HuggingFace API token. If this is provided, token_path is
     ignored.
     clean: Whether to clear the packages table before adding the new data.
+    resume: Whether to continue from the last committed page.
 
     returns: None
     '''
 
     # Log start of function
-    log = logging.getLogger(__name__)
     log.info("Getting packages from Hugging Face.")
 
     # Read in token for huggingface api
@@ -33,41 +103,60 @@ def packages(output_conn, token_path=None, token=None, clean=False):
         log.debug('Reading in token for Hugging Face API.')
         with open(token_path, 'r') as f:
             hf_token = f.read().strip()
+    headers = {'Authorization': f'Bearer {hf_token}'} if hf_token else {}
 
     # Clear the packages table
     if clean:
         log.info('Clearing tables for Hugging Face.')
         clean_db(output_conn, 1)
+        with output_conn:
+            set_progress(output_conn, PROGRESS_KEY, None)
 
-    # Get list of all models on HuggingFace
-    model_list = list_models(full=True, token=hf_token)
-
-    # Insert packages into output database
-    log.info('Adding packages to the output database.')
-    with output_conn:
-
-        # Create the cursor
-        output_cursor = output_conn.cursor()
+    # Start at the first page or where the last run stopped
+    url = get_progress(output_conn, PROGRESS_KEY) if resume else None
+    if url is None:
+        url = first_page()
+    else:
+        log.info('Resuming the Hugging Face model listing.')
 
-        # Create the query
-        query = '''
-            INSERT INTO packages (name, registry_id, latest_release_date,
-                first_release_date, downloads, downloads_period)
-            VALUES (?, ?, ?, ?, ?, ?);
-        '''
+    # Create the query. Models already in the database are updated in
+    # place so their ids, and everything that references them, are kept.
+    query = '''
+        INSERT INTO packages (name, registry_id, latest_release_date,
+            first_release_date, downloads, downloads_period)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (name, registry_id) DO UPDATE SET
+            latest_release_date = excluded.latest_release_date,
+            first_release_date = excluded.first_release_date,
+            downloads = excluded.downloads,
+            downloads_period = excluded.downloads_period;
+    '''
 
-        # Insert the data
-        for model in model_list:
+    # Insert packages into output database a page at a time
+    log.info('Adding packages to the output database.')
+    listed = 0
+    while url is not None:
+        response = http.fetch(url, headers=headers, timeout=60)
+        response.raise_for_status()
+        models = response.json()
+        url = response.links.get('next', {}).get('url')
 
-            # Put it in the database
-            output_cursor.execute(
+        # Put the page and the next url in the database together
+        with output_conn:
+            output_conn.executemany(
                 query,
-                (
-                    model.id,              # name
-                    1,                     # registry_id
-                    model.last_modified,   # latest_release_date
-                    model.created_at,      # first_release_date
-                    model.downloads,       # downloads
-                    'all_time',            # downloads_period
-                )
+                [
+                    (
+                        model['id'],                          # name
+                        Registry.HUGGINGFACE,                 # registry_id
+                        timestamp(model.get('lastModified')),
+                        timestamp(model.get('createdAt')),
+                        model.get('downloads'),               # downloads
+                        'all_time',                           # period
+                    ) for model in models
+                ]
             )
+            set_progress(output_conn, PROGRESS_KEY, url)
+
+        listed += len(models)
+        log.info(f'Committed {listed} Hugging Face models.')
@@ -5,13 +5,14 @@ registries.
 
 # Imports
 import logging
-from sigadopt.util.database import connect_db, init_db
+from sigadopt.util.database import connect_db, init_db, track_changes
 from sigadopt.util.stage import Stage
 from sigadopt.packages.huggingface import packages as huggingface_packages
 from sigadopt.packages.docker import packages as docker_packages
 from sigadopt.packages.maven import packages as maven_packages
 from sigadopt.packages.pypi import packages as pypi_packages
 from sigadopt.packages.hfcommits import packages as hfcommits_packages
+from sigadopt.packages.sources import open_source
 
 
 class Packages(Stage):
@@ -38,7 +39,8 @@ class Packages(Stage):
             output_conn=self.output_conn,
             token_path=self.args.token_path,
             token=self.args.token,
-            clean=self.args.clean
+            clean=self.args.clean,
+            resume=self.args.resume,
         )
 
     def hfcommits(self):
@@ -50,15 +52,46 @@ class Packages(Stage):
             token_path=self.args.token_path,
             token=self.args.token,
             clean=self.args.clean,
+            refresh=self.args.refresh,
+            workers=self.args.workers,
+            retry_failed=self.args.retry_failed,
+            incremental=self.args.incremental,
+            git_mirror=self.args.git_mirror,
         )
 
+    def source(self):
+        '''
+        This function creates the ecosystems source set by the arguments.
+
+        returns: A Source.
+        '''
+        return open_source(
+            self.args.source,
+            self.args.source_path,
+            itersize=self.args.itersize,
+            copy=self.args.copy,
+        )
+
+    def eco_registry_id(self):
+        '''
+        This function gets the ecosystems registry id override, if any.
+
+        returns: Keyword arguments for the registry loader.
+        '''
+        if self.args.eco_registry_id is None:
+            return {}
+        return {'eco_registry_id': self.args.eco_registry_id}
+
     def docker(self):
         '''
         This function gets the packages from Docker Hub.
         '''
         docker_packages(
             output_conn=self.output_conn,
-            clean=self.args.clean
+            source=self.source(),
+            clean=self.args.clean,
+            chunk_size=self.args.chunk_size,
+            **self.eco_registry_id(),
         )
 
     def maven(self):
@@ -67,7 +100,10 @@ class Packages(Stage):
         '''
         maven_packages(
             output_conn=self.output_conn,
-            clean=self.args.clean
+            source=self.source(),
+            clean=self.args.clean,
+            chunk_size=self.args.chunk_size,
+            **self.eco_registry_id(),
         )
 
     def pypi(self):
@@ -77,7 +113,14 @@ class Packages(Stage):
         pypi_packages(
             output_conn=self.output_conn,
             auth_path=self.args.auth_path,
-            clean=self.args.clean
+            clean=self.args.clean,
+            chunk_size=self.args.chunk_size,
+            resume=self.args.resume,
+            cache_dir=self.args.cache_dir,
+            snapshot=self.args.snapshot,
+            from_cache=self.args.from_cache,
+            import_path=self.args.import_path,
+            incremental=self.args.incremental,
         )
 
     def run(self):
@@ -90,6 +133,10 @@ class Packages(Stage):
         self.output_conn = connect_db(self.args.output)
         init_db(self.output_conn)
 
+        # Record what a refresh adds or changes
+        if self.args.refresh:
+            track_changes(self.output_conn, self.args.registry_id)
+
         # Call the appropriate function this is set in the subparser defined
         # in the local __init__.py
         self.args.reg_func(self)
@@ -4,26 +4,372 @@ pypi.py: This script gets the repositories and associated metadata from PyPI.
 
 # Import statements
 import os
+import hashlib
 import logging
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet
 from google.cloud import bigquery
-from sigadopt.util.database import clean_db
+from datetime import datetime
+from sigadopt.util.database import (
+    clean_db,
+    get_progress,
+    set_progress,
+    Registry,
+)
 
+# The BigQuery Storage API is faster but optional
+try:
+    from google.cloud import bigquery_storage
+except ImportError:
+    bigquery_storage = None
 
-def packages(output_conn, auth_path=None, clean=False):
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Checkpoint key for the last package name written
+PROGRESS_KEY = 'pypi.packages.name'
+
+# Progress key for the newest upload time already loaded
+WATERMARK_KEY = 'pypi.packages.upload_time'
+
+# Columns of the query results, in order
+COLUMNS = (
+    'name',
+    'version',
+    'filename',
+    'blake2_256_digest',
+    'upload_time',
+    'download_url',
+    'has_signature',
+    'size',
+)
+
+# Query for the PyPI files, ordered so each package arrives contiguously
+QUERY = '''
+    SELECT name, version, filename, blake2_256_digest, upload_time,
+    download_url, has_signature, size
+    FROM `bigquery-public-data.pypi.distribution_metadata`
+    {where}
+    ORDER BY name, version
+'''
+
+
+def create_staging(output_conn):
+    '''
+    This function creates the temporary staging table for PyPI files.
+
+    output_conn: A connection to the output database.
+    '''
+    with output_conn:
+        output_conn.execute(
+            '''
+            CREATE TEMP TABLE IF NOT EXISTS pypi_files (
+                name TEXT,
+                version TEXT,
+                filename TEXT,
+                digest TEXT,
+                upload_time TEXT,
+                has_sig INTEGER,
+                size INTEGER
+            );
+            '''
+        )
+        output_conn.execute('DELETE FROM temp.pypi_files;')
+
+
+def cache_path(cache_dir, sql, snapshot):
+    '''
+    This function gets the path of a cached query result. The name is a hash
+    of the SQL text and the snapshot label, so a changed query or a new
+    snapshot never reads a stale result.
+
+    cache_dir: The cache directory.
+    sql: The SQL text of the query.
+    snapshot: The label of the snapshot.
+
+    returns: The path to the Parquet file.
+    '''
+    key = hashlib.sha256(f'{sql}\0{snapshot}'.encode('utf-8')).hexdigest()
+    return cache_dir / f'pypi-{key[:16]}.parquet'
+
+
+def query_batches(sql, params, chunk_size):
+    '''
+    This function runs a query in BigQuery and streams the result.
+
+    sql: The SQL text of the query.
+    params: The query parameters.
+    chunk_size: The number of rows in each page of results.
+
+    returns: An iterator of pyarrow RecordBatches.
+    '''
+
+    # Create the client for the bigquery database and run the query
+    client = bigquery.Client()
+    query_job = client.query(
+        sql,
+        job_config=bigquery.QueryJobConfig(query_parameters=params)
+    )
+
+    # Stream the results as Arrow record batches
+    read_client = None
+    if bigquery_storage is not None:
+        read_client = bigquery_storage.BigQueryReadClient()
+    return query_job.result(page_size=chunk_size).to_arrow_iterable(
+        bqstorage_client=read_client
+    )
+
+
+def cache_batches(path, chunk_size, after=None, watermark=None):
+    '''
+    This function streams a cached query result.
+
+    path: The path to the Parquet file.
+    chunk_size: The number of rows in each batch.
+    after: If set, only packages named after or equal to it are read.
+    watermark: If set, only files uploaded after it are read.
+
+    returns: A generator of pyarrow RecordBatches.
+    '''
+    log.info(f'Reading PyPI files from cache {path}.')
+    for batch in pyarrow.parquet.ParquetFile(path).iter_batches(
+        batch_size=chunk_size,
+        columns=list(COLUMNS)
+    ):
+        if after is not None:
+            batch = batch.filter(
+                pc.greater_equal(batch.column('name'), after))
+        if watermark is not None:
+            upload_time = batch.column('upload_time')
+            batch = batch.filter(pc.greater(
+                upload_time, pa.scalar(watermark, type=upload_time.type)))
+        yield batch
+
+
+def write_cache(batches, path):
+    '''
+    This function passes batches through while writing them to the cache. The
+    file is written under a temporary name and only moved into place once the
+    result is complete.
+
+    batches: An iterable of pyarrow RecordBatches.
+    path: The path to the Parquet file.
+
+    returns: A generator of the same RecordBatches.
+    '''
+    temp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(
+                    temp, batch.schema, compression='zstd')
+            writer.write_batch(batch)
+            yield batch
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(temp, path)
+            log.info(f'Cached PyPI files in {path}.')
+    finally:
+        if writer is not None:
+            writer.close()
+        temp.unlink(missing_ok=True)
+
+
+def import_cache(source_path, path):
+    '''
+    This function prepares the cache from a local Parquet file, such as an
+    export of the BigQuery table, so the loader can run offline. The rows are
+    sorted by package and version like the query result.
+
+    source_path: The path to the local Parquet file.
+    path: The path to the cached Parquet file.
+    '''
+    log.info(f'Importing {source_path} into the PyPI cache.')
+    table = pyarrow.parquet.read_table(source_path, columns=list(COLUMNS))
+    table = table.sort_by([('name', 'ascending'), ('version', 'ascending')])
+    temp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    pyarrow.parquet.write_table(table, temp, compression='zstd')
+    os.replace(temp, path)
+    log.info(f'Cached {table.num_rows} PyPI files in {path}.')
+
+
+def batch_rows(batch):
+    '''
+    This function turns an Arrow record batch of query results into rows for
+    the staging table.
+
+    batch: A pyarrow RecordBatch with the query columns.
+
+    returns: A list of rows.
+    '''
+    columns = [
+        batch.column(c).to_pylist() for c in (
+            'name',
+            'version',
+            'filename',
+            'blake2_256_digest',
+            'upload_time',
+            'has_signature',
+            'size',
+        )
+    ]
+    columns[4] = [None if t is None else str(t) for t in columns[4]]
+    return list(zip(*columns))
+
+
+def write_files(output_conn, rows):
+    '''
+    This function writes a batch of PyPI files with set based upserts from
+    the staging table. Packages and versions already present are reused and
+    artifacts already present are updated, so a package split across
+    batches, written again after a resume or extended by an incremental load
+    is not duplicated.
+
+    output_conn: A connection to the output database.
+    rows: The staging rows for the batch.
+    '''
+    output_conn.executemany(
+        'INSERT INTO temp.pypi_files VALUES (?, ?, ?, ?, ?, ?, ?);',
+        rows
+    )
+    output_conn.execute(
+        '''
+        INSERT INTO packages (registry_id, name, versions_count)
+        SELECT DISTINCT ?, name, 0
+        FROM temp.pypi_files
+        WHERE true
+        ON CONFLICT (name, registry_id) DO NOTHING;
+        ''',
+        (Registry.PYPI,)
+    )
+    output_conn.execute(
+        '''
+        INSERT INTO versions (package_id, name)
+        SELECT DISTINCT p.id, f.version
+        FROM temp.pypi_files f
+        JOIN packages p
+        ON p.registry_id = ? AND p.name = f.name
+        WHERE true
+        ON CONFLICT (package_id, name) DO NOTHING;
+        ''',
+        (Registry.PYPI,)
+    )
+    output_conn.execute(
+        '''
+        INSERT INTO artifacts (version_id, name, type, has_sig, digest, date,
+            size)
+        SELECT v.id, f.filename, 'file', f.has_sig, f.digest, f.upload_time,
+            f.size
+        FROM temp.pypi_files f
+        JOIN packages p
+        ON p.registry_id = ? AND p.name = f.name
+        JOIN versions v
+        ON v.package_id = p.id AND v.name = f.version
+        WHERE true
+        ON CONFLICT (version_id, name) DO UPDATE SET
+            has_sig = excluded.has_sig,
+            digest = excluded.digest,
+            date = excluded.date
+        WHERE artifacts.has_sig IS NOT excluded.has_sig
+        OR artifacts.digest IS NOT excluded.digest;
+        ''',
+        (Registry.PYPI,)
+    )
+
+    # Sizes are filled in separately so they do not count as changes
+    output_conn.execute(
+        '''
+        UPDATE artifacts
+        SET size = f.size
+        FROM temp.pypi_files f
+        JOIN packages p
+        ON p.registry_id = ? AND p.name = f.name
+        JOIN versions v
+        ON v.package_id = p.id AND v.name = f.version
+        WHERE artifacts.version_id = v.id
+        AND artifacts.name = f.filename
+        AND artifacts.size IS NOT f.size;
+        ''',
+        (Registry.PYPI,)
+    )
+    output_conn.execute('DELETE FROM temp.pypi_files;')
+
+
+def finish(output_conn):
+    '''
+    This function updates the version counts of the PyPI packages in one
+    pass and records the newest upload time loaded as the watermark for the
+    next incremental load.
+
+    output_conn: A connection to the output database.
+    '''
+    output_conn.execute(
+        '''
+        UPDATE packages
+        SET versions_count = c.versions_count
+        FROM (
+            SELECT package_id, COUNT(*) AS versions_count
+            FROM versions
+            GROUP BY package_id
+        ) AS c
+        WHERE packages.id = c.package_id
+        AND packages.registry_id = ?
+        AND packages.versions_count IS NOT c.versions_count;
+        ''',
+        (Registry.PYPI,)
+    )
+    watermark = output_conn.execute(
+        '''
+        SELECT MAX(a.date)
+        FROM artifacts a
+        JOIN versions v ON a.version_id = v.id
+        JOIN packages p ON v.package_id = p.id
+        WHERE p.registry_id = ?;
+        ''',
+        (Registry.PYPI,)
+    ).fetchone()[0]
+    set_progress(output_conn, WATERMARK_KEY, watermark)
+
+
+def packages(
+    output_conn,
+    auth_path=None,
+    clean=False,
+    chunk_size=50000,
+    resume=False,
+    cache_dir=None,
+    snapshot='latest',
+    from_cache=False,
+    import_path=None,
+    incremental=False,
+):
     '''
     This function gets a list of and packages and associated metadata from
-    pypi using the ecosystems database.
+    pypi using BigQuery. The results are streamed as Arrow record batches and
+    written a batch at a time, so memory use stays bounded. After each batch
+    the last package name is checkpointed in the same transaction, and after
+    the load the newest upload time is kept for incremental loads.
 
     output_conn: The path to the output database.
     auth_path: The path to the authentication file.
     clean: Whether to clear the tables for PyPI before adding the new data.
+    chunk_size: The largest number of files written per commit.
+    resume: Whether to continue from the last checkpoint.
+    cache_dir: A directory to cache the query result in as Parquet. A cached
+    result for the same query and snapshot is used instead of BigQuery,
+    except by an incremental load with a watermark.
+    snapshot: The label of the snapshot the cached result belongs to.
+    from_cache: Whether to only load from the cache and never query BigQuery.
+    import_path: A local Parquet file to prepare the cache from.
+    incremental: Whether to only get files uploaded after the newest one
+    already loaded.
 
     returns: None
     '''
 
-    # Setup logger
-    log = logging.getLogger(__name__)
-
     # If there is an authentication path, add it to the environment variable
     if auth_path:
         log.info(f'Adding authentication path {auth_path} to environment.')
@@ -32,118 +378,90 @@ def packages(output_conn, auth_path=None, clean=False):
     # Log start of function
     log.info("Getting packages from PyPI.")
 
-    # Create the client for the bigquery database
-    client = bigquery.Client()
-
-    # Create the query
-    query = (
-        '''
-            SELECT name, version, filename, blake2_256_digest, upload_time,
-            download_url, has_signature
-            FROM `bigquery-public-data.pypi.distribution_metadata`
-        '''
-    )
-
-    # Run the query
-    query_job = client.query(query)
-
-    # Get the results
-    results = query_job.result()
-
-    # Create dict for packages
-    packages = {}
-
-    # Loop through results
-    for row in results:
-
-        name = row[0]
-        version = row[1]
-        filename = row[2]
-        digest = row[3]
-        upload_time = str(row[4])
-        download_url = row[5]
-        has_signature = row[6]
-
-        file_obj = {
-            'filename': filename,
-            'digest': digest,
-            'upload_time': upload_time,
-            'download_url': download_url,
-            'has_signature': has_signature
-        }
-
-        # Check if package is in dict
-        if name in packages:
-            # If the version is in the dictionary
-            if version in packages[name]:
-                packages[name][version][digest] = file_obj
-            else:
-                packages[name][version] = {digest: file_obj}
-        else:
-            packages[name] = {version: {digest: file_obj}}
+    # Find the cached result for the full query
+    if (from_cache or import_path is not None) and cache_dir is None:
+        log.error('The PyPI cache options need a cache directory.')
+        exit(-1)
+    cached = None
+    if cache_dir is not None:
+        cached = cache_path(cache_dir, QUERY.format(where=''), snapshot)
+        if import_path is not None:
+            import_cache(import_path, cached)
+    if from_cache and (cached is None or not cached.exists()):
+        log.error(f'No cached PyPI result for snapshot {snapshot}.')
+        exit(-1)
 
     # Clear the packages table
     if clean:
         log.info('Clearing tables for PyPI.')
-        clean_db(output_conn, 4)
+        clean_db(output_conn, Registry.PYPI)
+        with output_conn:
+            set_progress(output_conn, PROGRESS_KEY, None)
+            set_progress(output_conn, WATERMARK_KEY, None)
+    create_staging(output_conn)
+
+    # Restart at the last checkpointed package. It may have been cut off
+    # between batches, so it is read again and existing rows are skipped.
+    after = get_progress(output_conn, PROGRESS_KEY) if resume else None
+    if after is not None:
+        log.info(f'Resuming PyPI from package {after}.')
+
+    # Only get files newer than the last load. The filter is pushed into
+    # BigQuery so less of the table is scanned.
+    watermark = None
+    if incremental:
+        watermark = get_progress(output_conn, WATERMARK_KEY)
+        if watermark is None:
+            log.info('No PyPI watermark yet. Loading all files.')
+        else:
+            log.info(f'Getting PyPI files uploaded after {watermark}.')
+            watermark = datetime.fromisoformat(watermark)
+
+    # Build the filters for the query
+    conditions = []
+    params = []
+    if watermark is not None:
+        conditions.append('upload_time > @watermark')
+        params.append(bigquery.ScalarQueryParameter(
+            'watermark', 'TIMESTAMP', watermark))
+    if after is not None:
+        conditions.append('name >= @after')
+        params.append(bigquery.ScalarQueryParameter('after', 'STRING', after))
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+
+    # Read from the cache, or from BigQuery filling the cache on the way. Only
+    # the full result is cached. The cache holds a snapshot that can be older
+    # than the watermark, so an incremental load queries BigQuery unless it
+    # was told to stay offline.
+    use_cache = cached is not None and cached.exists()
+    if use_cache and watermark is not None and not from_cache:
+        log.info('Querying BigQuery for the files after the watermark '
+                 'instead of the cached snapshot.')
+        use_cache = False
+    if use_cache:
+        if watermark is not None:
+            log.warning(f'Only files in the cached snapshot {snapshot} are '
+                        'loaded. Newer uploads are not in the cache.')
+        batches = cache_batches(cached, chunk_size, after, watermark)
+    else:
+        batches = query_batches(QUERY.format(where=where), params, chunk_size)
+        if cached is not None and not conditions:
+            batches = write_cache(batches, cached)
 
     # Insert packages into output database
     log.info('Adding packages to the output database.')
-    with output_conn:
+    written = 0
+    for batch in batches:
+        for offset in range(0, batch.num_rows, chunk_size):
+            rows = batch_rows(batch.slice(offset, chunk_size))
+            with output_conn:
+                write_files(output_conn, rows)
+                set_progress(output_conn, PROGRESS_KEY, rows[-1][0])
+            written += len(rows)
+            log.info(f'Committed {written} PyPI files.')
 
-        # Create cursor
-        output_curr = output_conn.cursor()
-
-        # Iterate through packages
-        for name, versions in packages.items():
-
-            # Insert package into output database
-            output_curr.execute(
-                '''
-                    INSERT INTO packages (registry_id, name, versions_count)
-                    VALUES (?, ?, ?);
-                ''',
-                (
-                    4,               # PyPI registry_id
-                    name,            # Package name
-                    len(versions),   # Number of versions
-                )
-            )
-
-            # Get package id
-            package_id = output_curr.lastrowid
-
-            # Iterate through versions
-            for version, files in versions.items():
-
-                # Insert versions into output database
-                output_curr.execute(
-                    '''
-                        INSERT INTO versions (package_id, name)
-                        VALUES (?, ?);
-                        ''',
-                    (package_id, version)
-                )
-
-                # Get version id
-                version_id = output_curr.lastrowid
-
-                # Iterate through files
-                for digest, file in files.items():
-
-                    # Insert files into output database
-                    output_curr.execute(
-                        '''
-                            INSERT INTO artifacts (version_id, name, type,
-                                has_sig, digest, date)
-                            VALUES (?, ?, ?, ?, ?, ?);
-                            ''',
-                        (
-                            version_id,             # Version id
-                            file['filename'],       # File name
-                            'file',                 # File type
-                            file['has_signature'],  # Has signature
-                            file['digest'],         # Digest
-                            file['upload_time']     # Date
-                        )
-                    )
+    # The load is complete, so there is nothing to resume
+    log.info('Updating PyPI version counts.')
+    with output_conn:
+        finish(output_conn)
+        set_progress(output_conn, PROGRESS_KEY, None)
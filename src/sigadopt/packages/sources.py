@@ -0,0 +1,411 @@
+'''
+sources.py: This module contains the sources the packages stage can read
+ecosystems data from. A source yields the packages and versions of one
+registry in chunks, whether they come from a live PostgreSQL database, a
+local CSV/Parquet dump or an SQLite copy.
+'''
+
+# Import statements
+import os
+import csv
+import sqlite3
+import logging
+import threading
+import psycopg2
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv
+import pyarrow.parquet
+from pathlib import Path
+from argparse import ArgumentError
+from sigadopt.util.files import path_exists
+from itertools import islice
+from abc import ABC, abstractmethod
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Columns read for packages and versions, in the order they are yielded
+PACKAGE_COLUMNS = (
+    'id',
+    'name',
+    'versions_count',
+    'latest_release_published_at',
+    'first_release_published_at',
+    'downloads',
+    'downloads_period',
+)
+VERSION_COLUMNS = ('package_id', 'number', 'published_at')
+
+# Types of the CSV dump columns that must not be inferred from the first
+# block, such as version numbers that look like floats
+CSV_COLUMN_TYPES = {
+    'id': pa.int64(),
+    'registry_id': pa.int64(),
+    'package_id': pa.int64(),
+    'versions_count': pa.int64(),
+    'downloads': pa.int64(),
+    'name': pa.string(),
+    'number': pa.string(),
+    'downloads_period': pa.string(),
+}
+
+# Query for the packages of a registry
+PACKAGES_QUERY = '''
+    SELECT id, name, versions_count, latest_release_published_at,
+        first_release_published_at, downloads, downloads_period
+    FROM packages
+    WHERE registry_id = %s
+'''
+
+# Query for the versions of a registry
+VERSIONS_QUERY = '''
+    SELECT v.package_id, v.number, v.published_at
+    FROM versions v
+    JOIN packages p
+    ON v.package_id = p.id
+    WHERE p.registry_id = %s
+'''
+
+# Marker for NULL in COPY output
+COPY_NULL = '\\N'
+
+
+def chunks(rows, chunk_size):
+    '''
+    This function splits an iterable of rows into lists of a fixed size.
+
+    rows: The rows to split.
+    chunk_size: The number of rows in each list.
+
+    returns: A generator of lists of rows.
+    '''
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Source(ABC):
+    '''
+    This class is the parent class for all ecosystems sources.
+    '''
+
+    @abstractmethod
+    def packages(self, registry_id, chunk_size):
+        '''
+        This function yields the packages of a registry in chunks of
+        (id, name, versions_count, latest_release_published_at,
+        first_release_published_at, downloads, downloads_period).
+        '''
+        pass
+
+    @abstractmethod
+    def versions(self, registry_id, chunk_size):
+        '''
+        This function yields the versions of a registry in chunks of
+        (package_id, number, published_at).
+        '''
+        pass
+
+
+class PostgresSource(Source):
+    '''
+    This class reads from a live ecosystems PostgreSQL database. Rows are read
+    through server-side cursors or, optionally, with COPY ... TO STDOUT.
+    '''
+
+    def __init__(self, itersize=10000, copy=False):
+        '''
+        This function initializes the source.
+
+        itersize: The number of rows each server-side cursor fetches at a
+        time.
+        copy: Whether to read with COPY ... TO STDOUT instead of cursors.
+        '''
+        self.itersize = itersize
+        self.copy = copy
+
+    def connect(self):
+        '''
+        This function connects to the ecosystems database.
+
+        returns: A connection to the ecosystems database.
+        '''
+
+        # Get database password or use default 'postgres'
+        log.info("Connecting to input database.")
+        localhost_password = os.environ.get("PSQL_Password") or 'postgres'
+
+        # Set database credentials
+        db_credentials = {
+            "dbname": "packages_production",  # Ecosystems database name
+            "user": "postgres",  # Default PostgreSQL user
+            "password": localhost_password,  # Password for user
+            "host": "localhost",  # Database host
+            "port": "5432"  # Default PostgreSQL port
+        }
+
+        # Connect to database
+        return psycopg2.connect(**db_credentials)
+
+    def read(self, name, query, params, chunk_size):
+        '''
+        This function reads the result of a query with a fresh connection.
+
+        name: The name of the server-side cursor.
+        query: The query to run.
+        params: The parameters of the query.
+        chunk_size: The number of rows in each list.
+
+        returns: A generator of lists of rows.
+        '''
+        input_conn = self.connect()
+        try:
+            if self.copy:
+                yield from self.copy_chunks(
+                    input_conn, query, params, chunk_size)
+            else:
+                cursor = input_conn.cursor(name=name)
+                cursor.itersize = self.itersize
+                cursor.execute(query, params)
+                yield from chunks(cursor, chunk_size)
+                cursor.close()
+        finally:
+            input_conn.close()
+
+    def copy_chunks(self, input_conn, query, params, chunk_size):
+        '''
+        This function reads the result of a query with COPY ... TO STDOUT in
+        CSV form. The COPY runs on a separate thread that writes into a pipe,
+        and the CSV is parsed from the other end as it arrives.
+
+        input_conn: A connection to the ecosystems database.
+        query: The query to run.
+        params: The parameters of the query.
+        chunk_size: The number of rows in each list.
+
+        returns: A generator of lists of rows. NULL values are None and all
+        other values are strings.
+        '''
+        cursor = input_conn.cursor()
+        select = cursor.mogrify(query, params).decode('utf-8')
+        copy = f"COPY ({select}) TO STDOUT WITH " \
+            f"(FORMAT csv, NULL '{COPY_NULL}')"
+
+        # Run the COPY into one end of a pipe
+        read_fd, write_fd = os.pipe()
+        errors = []
+
+        def produce():
+            with open(write_fd, 'w', newline='', encoding='utf-8') as writer:
+                try:
+                    cursor.copy_expert(copy, writer)
+                except Exception as e:
+                    errors.append(e)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        # Parse the other end in chunks
+        with open(read_fd, 'r', newline='', encoding='utf-8') as reader:
+            rows = (
+                [None if v == COPY_NULL else v for v in row]
+                for row in csv.reader(reader)
+            )
+            yield from chunks(rows, chunk_size)
+
+        producer.join()
+        cursor.close()
+        if errors:
+            raise errors[0]
+
+    def packages(self, registry_id, chunk_size):
+        return self.read(
+            'sigadopt_packages', PACKAGES_QUERY, (registry_id,), chunk_size)
+
+    def versions(self, registry_id, chunk_size):
+        return self.read(
+            'sigadopt_versions', VERSIONS_QUERY, (registry_id,), chunk_size)
+
+
+class SQLiteSource(Source):
+    '''
+    This class reads from an SQLite copy of the ecosystems packages and
+    versions tables.
+    '''
+
+    def __init__(self, path):
+        '''
+        This function initializes the source.
+
+        path: The path to the SQLite database.
+        '''
+        self.path = path
+
+    def read(self, query, params, chunk_size):
+        '''
+        This function reads the result of a query with a fresh connection.
+
+        query: The query to run.
+        params: The parameters of the query.
+        chunk_size: The number of rows in each list.
+
+        returns: A generator of lists of rows.
+        '''
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(query.replace('%s', '?'), params)
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            conn.close()
+
+    def packages(self, registry_id, chunk_size):
+        return self.read(PACKAGES_QUERY, (registry_id,), chunk_size)
+
+    def versions(self, registry_id, chunk_size):
+        return self.read(VERSIONS_QUERY, (registry_id,), chunk_size)
+
+
+class DumpSource(Source):
+    '''
+    This class reads from a directory of ecosystems table dumps named
+    packages and versions, as Parquet (.parquet) or CSV (.csv or .csv.gz).
+    Only the needed columns are read, and rows are filtered by registry with
+    vectorized Arrow compute kernels while scanning.
+    '''
+
+    def __init__(self, path):
+        '''
+        This function initializes the source.
+
+        path: The directory holding the dump files.
+        '''
+        self.path = Path(path)
+
+    def table_path(self, table):
+        '''
+        This function finds the dump file for a table.
+
+        table: The name of the table.
+
+        returns: The path to the dump file.
+        '''
+        for suffix in ('.parquet', '.csv', '.csv.gz'):
+            path = self.path / (table + suffix)
+            if path.exists():
+                return path
+        raise FileNotFoundError(f'No dump for {table} in {self.path}.')
+
+    def batches(self, table, columns, batch_size):
+        '''
+        This function scans a dump file, reading only the given columns.
+
+        table: The name of the table.
+        columns: The columns to read.
+        batch_size: The number of rows in each batch.
+
+        returns: A generator of pyarrow RecordBatches.
+        '''
+        path = self.table_path(table)
+        log.debug(f'Scanning {path} for columns {columns}.')
+        if path.suffix == '.parquet':
+            yield from pyarrow.parquet.ParquetFile(path).iter_batches(
+                batch_size=batch_size,
+                columns=list(columns)
+            )
+        else:
+            yield from pyarrow.csv.open_csv(
+                str(path),
+                convert_options=pyarrow.csv.ConvertOptions(
+                    include_columns=list(columns),
+                    column_types={
+                        c: CSV_COLUMN_TYPES[c] for c in columns
+                        if c in CSV_COLUMN_TYPES
+                    },
+                    strings_can_be_null=True
+                )
+            )
+
+    def scan(self, table, columns, filter_columns, mask, chunk_size):
+        '''
+        This function yields the rows of a table that pass a filter.
+
+        table: The name of the table.
+        columns: The columns to yield, in order.
+        filter_columns: Additional columns the filter needs.
+        mask: A function from a RecordBatch to a boolean mask.
+        chunk_size: The number of rows in each list.
+
+        returns: A generator of lists of rows.
+        '''
+        read_columns = tuple(columns) + tuple(
+            c for c in filter_columns if c not in columns)
+
+        def rows():
+            for batch in self.batches(table, read_columns, chunk_size):
+                batch = batch.filter(mask(batch))
+                yield from zip(
+                    *(batch.column(c).to_pylist() for c in columns)
+                )
+
+        yield from chunks(rows(), chunk_size)
+
+    def packages(self, registry_id, chunk_size):
+        return self.scan(
+            'packages',
+            PACKAGE_COLUMNS,
+            ('registry_id',),
+            lambda b: pc.equal(b.column('registry_id'), registry_id),
+            chunk_size
+        )
+
+    def versions(self, registry_id, chunk_size):
+
+        # Collect the package ids of the registry from two narrow columns.
+        # This is a generator, so the scan runs on the versions reader thread.
+        ids = pa.concat_arrays([
+            b.filter(pc.equal(b.column('registry_id'), registry_id))
+            .column('id').cast(pa.int64())
+            for b in self.batches('packages', ('id', 'registry_id'), 1 << 20)
+        ] or [pa.array([], pa.int64())])
+
+        yield from self.scan(
+            'versions',
+            VERSION_COLUMNS,
+            (),
+            lambda b: pc.is_in(
+                b.column('package_id').cast(pa.int64()), value_set=ids),
+            chunk_size
+        )
+
+
+def open_source(kind='postgres', path=None, itersize=10000, copy=False):
+    '''
+    This function creates a source from command line options.
+
+    kind: The kind of source: postgres, dump or sqlite.
+    path: The path to the dump directory or SQLite database.
+    itersize: The number of rows each server-side cursor fetches at a time.
+    copy: Whether PostgreSQL is read with COPY ... TO STDOUT.
+
+    returns: A Source.
+    '''
+    if kind != 'postgres' and path is None:
+        log.error(f'The {kind} source needs --source-path.')
+        raise ArgumentError(None, f'The {kind} source needs --source-path.')
+    if path is not None:
+        path = path_exists(path, dir=kind == 'dump')
+    if kind == 'dump':
+        log.info(f'Reading ecosystems dump from {path}.')
+        return DumpSource(path)
+    if kind == 'sqlite':
+        log.info(f'Reading ecosystems SQLite database {path}.')
+        return SQLiteSource(path)
+    return PostgresSource(itersize=itersize, copy=copy)
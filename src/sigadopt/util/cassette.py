@@ -0,0 +1,176 @@
+'''
+cassette.py: This module records HTTP responses to a directory and replays
+them later. Bodies are stored once per content hash so repeated artifacts and
+pages take no extra space.
+'''
+
+# Imports
+import os
+import json
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Response headers worth keeping in a recording
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Link')
+
+
+class Cassette:
+    '''
+    This class stores recorded responses. The index maps urls to a status,
+    a few headers and the hash of the body. Bodies live under objects/ named
+    by their SHA-256, compressed when that makes them smaller.
+    '''
+
+    def __init__(self, directory, replaying=False):
+        '''
+        This function opens a cassette.
+
+        directory: The directory holding the cassette.
+        replaying: True to replay responses, False to record them.
+        '''
+        self.directory = directory
+        self.replaying = replaying
+        self.objects = directory / 'objects'
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(
+            directory / 'index.db',
+            timeout=120,
+            check_same_thread=False
+        )
+        with self.conn:
+            self.conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS interactions (
+                    url TEXT PRIMARY KEY,
+                    status INTEGER NOT NULL,
+                    headers TEXT,
+                    encoding TEXT,
+                    digest TEXT NOT NULL,
+                    compressed INTEGER NOT NULL
+                );
+                '''
+            )
+
+    def object_path(self, digest):
+        '''
+        This function gets the path of a stored body.
+
+        digest: The SHA-256 hex digest of the body.
+
+        returns: The path of the object file.
+        '''
+        return self.objects / digest[:2] / digest[2:]
+
+    def record(self, url, response):
+        '''
+        This function records a response. Not modified responses are skipped
+        because they carry no body.
+
+        url: The url the response was fetched from.
+        response: The requests.Response to record.
+        '''
+        if response.status_code == 304:
+            return
+
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        packed = zlib.compress(body, 6)
+        compressed = len(packed) < len(body)
+
+        # Write the body once, atomically so other processes never see a
+        # partial object
+        path = self.object_path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            temp = path.with_name(
+                f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            temp.write_bytes(packed if compressed else body)
+            os.replace(temp, path)
+
+        headers = {
+            k: response.headers[k] for k in KEPT_HEADERS
+            if k in response.headers
+        }
+        with self.lock, self.conn:
+            self.conn.execute(
+                '''
+                INSERT OR REPLACE INTO interactions (url, status, headers,
+                    encoding, digest, compressed)
+                VALUES (?, ?, ?, ?, ?, ?);
+                ''',
+                (
+                    url,
+                    response.status_code,
+                    json.dumps(headers),
+                    response.encoding,
+                    digest,
+                    int(compressed),
+                )
+            )
+
+    def urls(self, prefix=''):
+        '''
+        This function lists the recorded urls.
+
+        prefix: Only urls starting with this prefix are listed.
+
+        returns: A list of urls.
+        '''
+        with self.lock:
+            return [
+                row[0] for row in self.conn.execute(
+                    '''
+                    SELECT url
+                    FROM interactions
+                    WHERE substr(url, 1, ?) = ?
+                    ORDER BY url;
+                    ''',
+                    (len(prefix), prefix)
+                )
+            ]
+
+    def replay(self, url):
+        '''
+        This function replays a recorded response. Urls that were never
+        recorded come back as 404 responses.
+
+        url: The url to replay.
+
+        returns: A requests.Response.
+        '''
+        with self.lock:
+            row = self.conn.execute(
+                '''
+                SELECT status, headers, encoding, digest, compressed
+                FROM interactions
+                WHERE url = ?;
+                ''',
+                (url,)
+            ).fetchone()
+
+        response = requests.Response()
+        response.url = url
+        response.headers = CaseInsensitiveDict()
+
+        if row is None:
+            log.warning(f'No recording for {url}.')
+            response.status_code = 404
+            response._content = b''
+            return response
+
+        body = self.object_path(row[3]).read_bytes()
+        response.status_code = row[0]
+        response.headers.update(json.loads(row[1]))
+        response.encoding = row[2]
+        response._content = zlib.decompress(body) if row[4] else body
+        return response
@@ -6,6 +6,7 @@ database.py: This module contains functions to interact with the databases.
 import sqlite3
 import logging
 from enum import IntEnum
+from pathlib import Path
 
 # Create a logger
 log = logging.getLogger(__name__)
@@ -117,6 +118,17 @@ def clean_db(conn, registry_id, level=0):
             )
 
         if level <= CleanLevel.VERSIONS:
+            curr.execute(
+                '''
+                DELETE FROM changed_versions
+                WHERE version_id IN (
+                    SELECT id FROM versions WHERE package_id IN (
+                        SELECT id FROM packages WHERE registry_id = ?
+                    )
+                );
+                ''',
+                (registry_id,)
+            )
             curr.execute(
                 '''
                 DELETE FROM versions WHERE package_id IN (
@@ -127,6 +139,22 @@ def clean_db(conn, registry_id, level=0):
             )
 
         if level == CleanLevel.PACKAGES:
+            curr.execute(
+                '''
+                DELETE FROM retries WHERE package_id IN (
+                    SELECT id FROM packages WHERE registry_id = ?
+                );
+                ''',
+                (registry_id,)
+            )
+            curr.execute(
+                '''
+                DELETE FROM sample_weights WHERE package_id IN (
+                    SELECT id FROM packages WHERE registry_id = ?
+                );
+                ''',
+                (registry_id,)
+            )
             curr.execute(
                 f'DELETE FROM packages WHERE registry_id = {registry_id};'
             )
@@ -259,12 +287,21 @@ def init_db(db_conn):
                 digest TEXT,
                 date TEXT,
                 extensions TEXT,
+                size INTEGER,
                 UNIQUE (version_id, name),
                 FOREIGN KEY (version_id) REFERENCES versions (id)
             );
             '''
         )
 
+        # Databases created before artifact sizes were stored lack the column
+        columns = [
+            row[1] for row in db_conn.execute('PRAGMA table_info(artifacts);')
+        ]
+        if 'size' not in columns:
+            log.debug('Adding size column to artifact table.')
+            db_conn.execute('ALTER TABLE artifacts ADD COLUMN size INTEGER;')
+
     # Create signature table
     log.debug('Creating signature table if it does not exist.')
     with db_conn:
@@ -333,3 +370,217 @@ def init_db(db_conn):
             );
             '''
         )
+
+    # Table to hold the versions added or changed by the last refresh
+    log.debug('Creating changed_versions table if it does not exist.')
+    with db_conn:
+        db_conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS changed_versions (
+                version_id INTEGER PRIMARY KEY,
+                FOREIGN KEY (version_id) REFERENCES versions (id)
+            );
+            '''
+        )
+
+    # Table to hold packages whose versions could not be fetched
+    log.debug('Creating retries table if it does not exist.')
+    with db_conn:
+        db_conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS retries (
+                package_id INTEGER PRIMARY KEY,
+                attempts INTEGER NOT NULL,
+                error TEXT,
+                FOREIGN KEY (package_id) REFERENCES packages (id)
+            );
+            '''
+        )
+
+    # Table to hold checkpoints for resumable loads
+    log.debug('Creating progress table if it does not exist.')
+    with db_conn:
+        db_conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS progress (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            '''
+        )
+
+    # Table to hold the strata and weights of a stratified sample
+    log.debug('Creating sample_weights table if it does not exist.')
+    with db_conn:
+        db_conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS sample_weights (
+                package_id INTEGER PRIMARY KEY,
+                stratum TEXT NOT NULL,
+                population INTEGER NOT NULL,
+                sampled INTEGER NOT NULL,
+                weight REAL NOT NULL,
+                FOREIGN KEY (package_id) REFERENCES packages (id)
+            );
+            '''
+        )
+
+    # Table to hold the measured throughput of adoption runs
+    log.debug('Creating throughput table if it does not exist.')
+    with db_conn:
+        db_conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS throughput (
+                id INTEGER PRIMARY KEY,
+                registry_id INTEGER NOT NULL,
+                started TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                workers INTEGER NOT NULL,
+                artifacts INTEGER NOT NULL,
+                requests INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                FOREIGN KEY (registry_id) REFERENCES registries (id)
+            );
+            '''
+        )
+
+    # Table to hold the files listed by the Maven Central index. A file is
+    # named by its artifact, its version and the suffix, such as
+    # -sources.jar, so only the suffix is stored.
+    log.debug('Creating maven_index table if it does not exist.')
+    with db_conn:
+        db_conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS maven_index (
+                package_name TEXT NOT NULL,
+                version_name TEXT NOT NULL,
+                suffix TEXT NOT NULL,
+                has_sig INTEGER NOT NULL,
+                PRIMARY KEY (package_name, version_name, suffix)
+            ) WITHOUT ROWID;
+            '''
+        )
+
+
+def track_changes(db_conn, registry_id):
+    '''
+    This function starts recording the versions a refresh adds or changes in
+    the changed_versions table. The set from the previous refresh of the
+    registry is cleared first. Recording is done by temporary triggers, so it
+    only applies to this connection and covers every loader. An artifact
+    whose signature or digest changes also loses its signature and check, so
+    the adoption stage checks it again.
+
+    db_conn: The connection to the database.
+    registry_id: The registry being refreshed.
+    '''
+    log.info('Recording changed versions.')
+    with db_conn:
+        db_conn.execute(
+            '''
+            DELETE FROM changed_versions
+            WHERE version_id IN (
+                SELECT v.id
+                FROM versions v
+                JOIN packages p ON v.package_id = p.id
+                WHERE p.registry_id = ?
+            );
+            ''',
+            (registry_id,)
+        )
+        for name, event, column in [
+            ('version_added', 'INSERT ON versions', 'NEW.id'),
+            ('version_changed', 'UPDATE OF date ON versions', 'NEW.id'),
+            ('artifact_added', 'INSERT ON artifacts', 'NEW.version_id'),
+            (
+                'artifact_changed',
+                'UPDATE OF has_sig, digest ON artifacts',
+                'NEW.version_id'
+            ),
+        ]:
+            db_conn.execute(
+                f'''
+                CREATE TEMP TRIGGER IF NOT EXISTS {name}
+                AFTER {event}
+                BEGIN
+                    INSERT OR IGNORE INTO changed_versions (version_id)
+                    VALUES ({column});
+                END;
+                '''
+            )
+        db_conn.execute(
+            '''
+            CREATE TEMP TRIGGER IF NOT EXISTS artifact_unchecked
+            AFTER UPDATE OF has_sig, digest ON artifacts
+            BEGIN
+                DELETE FROM list_packets
+                WHERE signature_id IN (
+                    SELECT id FROM signatures WHERE artifact_id = NEW.id
+                );
+                DELETE FROM signatures WHERE artifact_id = NEW.id;
+                DELETE FROM sig_check WHERE artifact_id = NEW.id;
+            END;
+            '''
+        )
+
+
+def get_progress(db_conn, key, default=None):
+    '''
+    This function reads a checkpoint from the progress table.
+
+    db_conn: The connection to the database.
+    key: The name of the checkpoint.
+    default: The value to return if there is no checkpoint.
+
+    return: The stored value or the default.
+    '''
+    row = db_conn.execute(
+        'SELECT value FROM progress WHERE key = ?;',
+        (key,)
+    ).fetchone()
+    return default if row is None else row[0]
+
+
+def set_progress(db_conn, key, value):
+    '''
+    This function writes a checkpoint to the progress table. It does not
+    commit, so the checkpoint lands in the same transaction as the data it
+    describes. A value of None removes the checkpoint.
+
+    db_conn: The connection to the database.
+    key: The name of the checkpoint.
+    value: The value to store.
+    '''
+    if value is None:
+        db_conn.execute('DELETE FROM progress WHERE key = ?;', (key,))
+        return
+    db_conn.execute(
+        '''
+        INSERT INTO progress (key, value)
+        VALUES (?, ?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value;
+        ''',
+        (key, str(value))
+    )
+
+
+def attach_db(db_conn, db_path, schema):
+    '''
+    This function attaches another database to a connection so one statement
+    can read from it and write to the main database. A database is never
+    attached to itself; its own tables are read instead.
+
+    db_conn: The connection to attach the database to.
+    db_path: The path to the database to attach.
+    schema: The name to attach the database under.
+
+    return: The schema to read the attached database's tables from.
+    '''
+    main_path = db_conn.execute('PRAGMA database_list;').fetchone()[2]
+    if main_path and Path(main_path).resolve() == Path(db_path).resolve():
+        log.debug(f'{db_path} is the main database, not attaching it.')
+        return 'main'
+
+    log.debug(f'Attaching {db_path} as {schema}.')
+    db_conn.execute(f'ATTACH DATABASE ? AS {schema};', (str(db_path),))
+    return schema
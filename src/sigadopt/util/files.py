@@ -5,7 +5,7 @@ files.py: This script contains utility functions for file handling.
 # Import statements
 from pathlib import Path
 from argparse import ArgumentError
-import requests
+from sigadopt.util import http
 import logging
 import os
 
@@ -15,14 +15,15 @@ log = logging.getLogger(__name__)
 
 def download_file(remote_file_url, local_file_path):
     '''
-    This function downloads a file to a local path using requests.
+    This function downloads a file to a local path using the shared, rate
+    limited HTTP layer.
 
     remote_file_url: url of file to download.
     local_file_path: path to save file to.
 
     returns: Binary of file if successful, None otherwise.
     '''
-    response = requests.get(remote_file_url)
+    response = http.get(remote_file_url)
 
     if not response:
         log.error(f'Could not download file {remote_file_url}.')
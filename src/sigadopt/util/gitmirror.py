@@ -0,0 +1,182 @@
+'''
+gitmirror.py: This module keeps blobless bare mirrors of git repositories and
+reads commits and their embedded signatures from the local commit objects.
+Only commits and trees are fetched, so a mirror of a model repository stays
+small no matter how large its files are, and later fetches only bring the new
+objects.
+'''
+
+# Imports
+import logging
+from pathlib import Path
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import git
+from sigadopt.util import ratelimit
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Base url for Hugging Face git repositories
+GIT_URL = 'https://huggingface.co/'
+
+# Refs kept in a mirror
+REFSPECS = ['+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*']
+
+# Commit headers that hold an embedded signature
+SIGNATURE_HEADERS = (b'gpgsig', b'gpgsig-sha256')
+
+# Signature types by the armor header of the signature. X.509 signatures
+# from gpgsm and gitsign are both armored as signed messages.
+SIGNATURE_TYPES = {
+    b'-----BEGIN PGP SIGNATURE-----': 'PGP',
+    b'-----BEGIN SSH SIGNATURE-----': 'SSH',
+    b'-----BEGIN SIGNED MESSAGE-----': 'X509',
+    b'-----BEGIN PKCS7-----': 'X509',
+}
+
+
+def mirror_path(mirror_dir, name):
+    '''
+    This function gets the path of the mirror of a repository.
+
+    mirror_dir: The directory holding the mirrors.
+    name: The name of the repository, such as org/model.
+
+    returns: The path of the bare repository.
+    '''
+    return Path(mirror_dir) / f'{name}.git'
+
+
+def environment(token=None):
+    '''
+    This function builds the environment for git commands. The token is
+    passed as a configuration variable so it is never written to disk.
+
+    token: The API token, or None.
+
+    returns: A dictionary of environment variables.
+    '''
+    env = {'GIT_TERMINAL_PROMPT': '0'}
+    if token:
+        env.update({
+            'GIT_CONFIG_COUNT': '1',
+            'GIT_CONFIG_KEY_0': 'http.extraHeader',
+            'GIT_CONFIG_VALUE_0': f'Authorization: Bearer {token}',
+        })
+    return env
+
+
+def sync(mirror_dir, name, token=None):
+    '''
+    This function creates or updates the blobless mirror of a repository.
+    A missing mirror is cloned with --filter=blob:none and an existing one is
+    fetched, which only transfers the objects it does not have yet.
+
+    mirror_dir: The directory holding the mirrors.
+    name: The name of the repository, such as org/model.
+    token: The API token, or None.
+
+    returns: The git.Repo of the mirror.
+    '''
+    url = GIT_URL + name
+    path = mirror_path(mirror_dir, name)
+    env = environment(token)
+    host = urlsplit(url).hostname or 'localhost'
+
+    with ratelimit.limiter.limit(host) as slot:
+        if not (path / 'HEAD').exists():
+            log.debug(f'Cloning {url} into {path}.')
+            path.parent.mkdir(parents=True, exist_ok=True)
+            repo = git.Repo.clone_from(
+                url,
+                path,
+                env=env,
+                bare=True,
+                multi_options=['--filter=blob:none'],
+            )
+        else:
+            log.debug(f'Fetching {url} into {path}.')
+            repo = git.Repo(path)
+            with repo.git.custom_environment(**env):
+                repo.git.fetch(
+                    '--filter=blob:none', '--prune', 'origin', *REFSPECS)
+        slot.status = 200
+
+    return repo
+
+
+def commit_date(commit):
+    '''
+    This function formats the commit date of a commit in UTC.
+
+    commit: The git.Commit.
+
+    returns: The date as YYYY-MM-DD HH:MM:SS.
+    '''
+    return datetime.fromtimestamp(
+        commit.committed_date, timezone.utc
+    ).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def commits(repo, rev='HEAD'):
+    '''
+    This function reads the commits reachable from a revision.
+
+    repo: The git.Repo of the mirror.
+    rev: The revision to start from. HEAD is the default branch of the
+    remote.
+
+    returns: A dictionary of commit id to commit date.
+    '''
+    try:
+        return {
+            commit.hexsha: commit_date(commit)
+            for commit in repo.iter_commits(rev)
+        }
+    except git.GitCommandError:
+        # Repositories without any commits have no HEAD
+        log.debug(f'No commits in {repo.git_dir}.')
+        return {}
+
+
+def signature(repo, commit_id):
+    '''
+    This function splits a commit object into its embedded signature and
+    the payload the signature was made over, which is the raw commit without
+    the signature header.
+
+    repo: The git.Repo of the mirror.
+    commit_id: The full id of the commit.
+
+    returns: (signature, payload, type) where the signature and payload are
+    bytes and the type is taken from the armor header, such as PGP, SSH or
+    X509, and OTHER if it is not known. For an unsigned commit the signature
+    and type are None, and None is returned if the commit is not in the
+    mirror.
+    '''
+    try:
+        raw = repo.odb.stream(bytes.fromhex(commit_id)).read()
+    except (ValueError, git.BadObject, git.BadName):
+        return None
+
+    headers, sep, message = raw.partition(b'\n\n')
+    kept = []
+    sig = []
+    in_sig = False
+    for line in headers.split(b'\n'):
+        if in_sig and line.startswith(b' '):
+            sig.append(line[1:])
+            continue
+        in_sig = line.split(b' ', 1)[0] in SIGNATURE_HEADERS
+        if in_sig:
+            sig.append(line.split(b' ', 1)[1])
+        else:
+            kept.append(line)
+
+    payload = b'\n'.join(kept) + sep + message
+    if not sig:
+        return None, payload, None
+    armor = sig[0].strip()
+    return b'\n'.join(sig) + b'\n', payload, \
+        SIGNATURE_TYPES.get(armor, 'OTHER')
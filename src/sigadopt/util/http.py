@@ -0,0 +1,205 @@
+'''
+http.py: This module contains the shared HTTP layer used to fetch data from
+the registries.
+'''
+
+# Imports
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit
+from sigadopt.util import ratelimit
+from sigadopt.util.cassette import Cassette
+from sigadopt.util.http_cache import HttpCache
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Shared session so connections to the same host are reused
+session = requests.Session()
+
+# Optional response cache and cassette, set up by configure()
+cache = None
+cassette = None
+
+# Requests sent and bytes received over the network by this process
+stats = {'requests': 0, 'bytes': 0}
+stats_lock = threading.Lock()
+
+
+def configure(
+    cache_dir=None,
+    cache_ttl=86400,
+    cache_size=1024,
+    record_dir=None,
+    replay_dir=None,
+):
+    '''
+    This function configures the shared HTTP layer. It is called once with the
+    global command line arguments.
+
+    cache_dir: The directory for the on-disk response cache. If None, no
+    responses are cached.
+    cache_ttl: The number of seconds a cached response is used without
+    revalidation.
+    cache_size: The maximum size of the response cache in MiB.
+    record_dir: The directory to record all responses to.
+    replay_dir: The directory to replay recorded responses from. No requests
+    are sent when replaying.
+    '''
+    global cache, cassette
+
+    if cache_dir:
+        log.info(f'Caching HTTP responses in {cache_dir}.')
+        cache = HttpCache(
+            cache_dir,
+            ttl=cache_ttl,
+            max_size=cache_size * 1024 * 1024
+        )
+
+    if record_dir:
+        log.info(f'Recording HTTP responses to {record_dir}.')
+        cassette = Cassette(record_dir)
+    elif replay_dir:
+        log.info(f'Replaying HTTP responses from {replay_dir}.')
+        cassette = Cassette(replay_dir, replaying=True)
+
+
+def fetch(url, retries=3, **kwargs):
+    '''
+    This function performs a rate limited GET request. Requests that are
+    throttled (429/503) are retried after the limiter has backed off. When a
+    cassette is set, responses are recorded to it or replayed from it.
+
+    url: The url to get.
+    retries: The number of times to retry a throttled request.
+    kwargs: Additional keyword arguments passed to requests.
+
+    returns: A requests.Response.
+    '''
+
+    # Replays never touch the network
+    if cassette and cassette.replaying:
+        return cassette.replay(url)
+
+    host = urlsplit(url).hostname
+    for _ in range(retries + 1):
+        with ratelimit.limiter.limit(host) as slot:
+            response = session.get(url, **kwargs)
+            slot.status = response.status_code
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                slot.retry_after = int(retry_after)
+
+        count(1, len(response.content))
+
+        if response.status_code not in ratelimit.THROTTLE_STATUSES:
+            break
+        log.debug(f'Retrying throttled request to {url}.')
+
+    if cassette:
+        cassette.record(url, response)
+
+    return response
+
+
+def settings():
+    '''
+    This function gets the arguments configure() was called with, so another
+    process can set up the same HTTP layer.
+
+    returns: A dictionary of keyword arguments for configure().
+    '''
+    return {
+        'cache_dir': cache.path.parent if cache else None,
+        'cache_ttl': cache.ttl if cache else 86400,
+        'cache_size': cache.max_size // (1024 * 1024) if cache else 1024,
+        'record_dir': cassette.directory
+        if cassette and not cassette.replaying else None,
+        'replay_dir': cassette.directory
+        if cassette and cassette.replaying else None,
+    }
+
+
+def count(requests, size):
+    '''
+    This function adds to the network counters of this process. Requests
+    sent by worker processes are added when their results arrive.
+
+    requests: The number of requests sent.
+    size: The number of bytes received.
+    '''
+    with stats_lock:
+        stats['requests'] += requests
+        stats['bytes'] += size
+
+
+def counters():
+    '''
+    This function reads the network counters of this process. Responses
+    served from the cache or a cassette are not counted.
+
+    returns: A dictionary with the number of requests sent and bytes
+    received.
+    '''
+    with stats_lock:
+        return dict(stats)
+
+
+def cached_response(url):
+    '''
+    This function serves a response from the cache. When recording, it is
+    added to the cassette as well, so a replay finds every url the run read.
+
+    url: The url of the cached response.
+
+    returns: A requests.Response with the cached body.
+    '''
+    response = cache.response(url)
+    if cassette and not cassette.replaying:
+        cassette.record(url, response)
+    return response
+
+
+def get(url, cached=False, **kwargs):
+    '''
+    This function performs a GET request through the shared session.
+
+    url: The url to get.
+    cached: Whether the response may be served from, and stored in, the
+    response cache. Stale entries are revalidated with If-None-Match and
+    If-Modified-Since.
+    kwargs: Additional keyword arguments passed to requests.
+
+    returns: A requests.Response.
+    '''
+
+    # Without a cache this is a plain request
+    if not cached or cache is None:
+        return fetch(url, **kwargs)
+
+    # Serve fresh entries directly and revalidate stale ones
+    entry = cache.lookup(url)
+    headers = dict(kwargs.pop('headers', None) or {})
+    if entry:
+        etag, last_modified, fresh = entry
+        if fresh:
+            log.debug(f'Serving {url} from cache.')
+            return cached_response(url)
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+    response = fetch(url, headers=headers, **kwargs)
+
+    # Not modified, so the cached body is still good
+    if response.status_code == 304 and entry:
+        log.debug(f'Revalidated {url} in cache.')
+        cache.refresh(url)
+        return cached_response(url)
+
+    if response.status_code == 200:
+        cache.store(url, response)
+
+    return response
@@ -0,0 +1,217 @@
+'''
+http_cache.py: This module contains an on-disk cache for HTTP responses. The
+cache stores validators (ETag and Last-Modified) so that stale entries can be
+revalidated with conditional requests instead of being downloaded again.
+'''
+
+# Imports
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+
+class HttpCache:
+    '''
+    This class is an on-disk HTTP response cache backed by SQLite. Bodies are
+    stored compressed. Entries younger than the TTL are served without any
+    request, older entries are revalidated, and the least recently used
+    entries are evicted once the cache grows past its size cap.
+    '''
+
+    def __init__(self, cache_dir, ttl=86400, max_size=1024 * 1024 * 1024):
+        '''
+        This function initializes the cache.
+
+        cache_dir: The directory to keep the cache database in.
+        ttl: The number of seconds an entry is served without revalidation.
+        max_size: The maximum size of the stored bodies in bytes.
+        '''
+        self.ttl = ttl
+        self.max_size = max_size
+        self.path = cache_dir / 'http_cache.db'
+        self.lock = threading.Lock()
+
+        log.debug(f'Opening HTTP cache at {self.path}.')
+        self.conn = sqlite3.connect(
+            self.path,
+            timeout=120,
+            check_same_thread=False
+        )
+        with self.conn:
+            self.conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_type TEXT,
+                    encoding TEXT,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    fetched REAL NOT NULL,
+                    accessed REAL NOT NULL
+                );
+                '''
+            )
+            self.conn.execute(
+                '''
+                CREATE INDEX IF NOT EXISTS responses_accessed
+                ON responses (accessed);
+                '''
+            )
+
+        # Running estimate of the cache size, checked against the real size
+        # only when it crosses the cap
+        self.size = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses;'
+        ).fetchone()[0]
+
+    def lookup(self, url):
+        '''
+        This function looks up a cached entry.
+
+        url: The url of the entry.
+
+        returns: (etag, last_modified, fresh) or None if the url is not cached.
+        '''
+        with self.lock:
+            row = self.conn.execute(
+                '''
+                SELECT etag, last_modified, fetched
+                FROM responses
+                WHERE url = ?;
+                ''',
+                (url,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return row[0], row[1], time.time() - row[2] < self.ttl
+
+    def response(self, url):
+        '''
+        This function builds a response object from a cached entry and marks
+        the entry as used.
+
+        url: The url of the entry.
+
+        returns: A requests.Response with the cached body.
+        '''
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                '''
+                SELECT content_type, encoding, body
+                FROM responses
+                WHERE url = ?;
+                ''',
+                (url,)
+            ).fetchone()
+            self.conn.execute(
+                'UPDATE responses SET accessed = ? WHERE url = ?;',
+                (now, url)
+            )
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict()
+        if row[0]:
+            response.headers['Content-Type'] = row[0]
+        response.encoding = row[1]
+        response._content = zlib.decompress(row[2])
+        response.from_cache = True
+        return response
+
+    def refresh(self, url):
+        '''
+        This function marks an entry as revalidated.
+
+        url: The url of the entry.
+        '''
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                '''
+                UPDATE responses SET fetched = ?, accessed = ?
+                WHERE url = ?;
+                ''',
+                (now, now, url)
+            )
+
+    def store(self, url, response):
+        '''
+        This function stores a successful response.
+
+        url: The url the response was fetched from.
+        response: The requests.Response to store.
+        '''
+        body = zlib.compress(response.content)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                '''
+                INSERT OR REPLACE INTO responses (url, etag, last_modified,
+                    content_type, encoding, body, size, fetched, accessed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+                ''',
+                (
+                    url,
+                    response.headers.get('ETag'),
+                    response.headers.get('Last-Modified'),
+                    response.headers.get('Content-Type'),
+                    response.encoding,
+                    body,
+                    len(body),
+                    now,
+                    now,
+                )
+            )
+
+            # Evict old entries if we might be over the cap
+            self.size += len(body)
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        '''
+        This function removes the least recently used entries until the cache
+        is below 90% of its size cap. The caller must hold the lock.
+        '''
+        with self.conn:
+            self.size = self.conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM responses;'
+            ).fetchone()[0]
+            if self.size <= self.max_size:
+                return
+
+            target = self.size - int(self.max_size * 0.9)
+            log.debug(f'Evicting {target} bytes from the HTTP cache.')
+
+            # Find the cutoff access time that frees enough space
+            freed = 0
+            cutoff = None
+            cursor = self.conn.execute(
+                'SELECT size, accessed FROM responses ORDER BY accessed;'
+            )
+            for size, accessed in cursor:
+                freed += size
+                cutoff = accessed
+                if freed >= target:
+                    break
+
+            self.conn.execute(
+                'DELETE FROM responses WHERE accessed <= ?;',
+                (cutoff,)
+            )
+            self.size = self.conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM responses;'
+            ).fetchone()[0]
@@ -1,5 +1,7 @@
 '''
 pgp.py: This file contains functions to interact with pgp keys and signatures.
+gpg is started in its own session, so a Ctrl-C in the terminal does not kill
+a check that is still finishing.
 '''
 
 import subprocess
@@ -88,6 +90,7 @@ def verify(artifact_path, signature_path):
         ],
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
+        start_new_session=True,
     ).stdout.decode("utf-8")
 
     return output
@@ -111,6 +114,7 @@ def list_packets(signature_path):
         ],
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
+        start_new_session=True,
     ).stdout.decode("utf-8")
 
     # Create regex objects
@@ -158,6 +162,7 @@ def get_key(key_id):
         ],
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
+        start_new_session=True,
     ).stdout.decode("utf-8")
 
     # Check if the key is already in the keyring
@@ -178,6 +183,7 @@ def get_key(key_id):
             ],
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
+            start_new_session=True,
         ).stdout.decode("utf-8")
 
         total_output += '\n' + output
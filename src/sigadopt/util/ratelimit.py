@@ -0,0 +1,289 @@
+'''
+ratelimit.py: This module contains a per-host rate limiter. Each host gets a
+token bucket for its request rate and a concurrency limit, and both are
+adjusted with AIMD (additive increase, multiplicative decrease) from observed
+latency and 429/503 responses. The state can be shared between processes on
+the same machine through a small state file.
+'''
+
+# Imports
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+
+# Create a logger
+log = logging.getLogger(__name__)
+
+# Statuses that tell us a host wants us to slow down
+THROTTLE_STATUSES = (429, 503)
+
+
+class Slot:
+    '''
+    This class holds the outcome of a rate limited request. The caller sets
+    the status once the request is done.
+    '''
+
+    def __init__(self, host):
+        self.host = host
+        self.status = None
+        self.retry_after = None
+
+
+class RateLimiter:
+    '''
+    This class keeps a token bucket and a concurrency limit per host.
+    '''
+
+    def __init__(
+        self,
+        state_path=None,
+        rate=5.0,
+        min_rate=0.2,
+        max_rate=100.0,
+        concurrency=4.0,
+        max_concurrency=32.0,
+        target_latency=2.0,
+    ):
+        '''
+        This function initializes the rate limiter.
+
+        state_path: The path to a state file shared by all processes on this
+        machine. If None, the state is kept in memory.
+        rate: The initial number of requests per second for a new host.
+        min_rate: The lowest request rate the limiter will back off to.
+        max_rate: The highest request rate the limiter will grow to.
+        concurrency: The initial number of requests in flight for a new host.
+        max_concurrency: The highest number of requests in flight.
+        target_latency: Requests slower than this (in seconds) stop the
+        concurrency from growing and shrink it gently.
+        '''
+        self.state_path = state_path
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.lock = threading.Lock()
+        self.memory = {}
+
+    @contextmanager
+    def state(self):
+        '''
+        This function yields the state of all hosts for a read-modify-write
+        cycle. The state is written back when the context exits.
+        '''
+        with self.lock:
+
+            # In-memory state for a single process
+            if self.state_path is None:
+                yield self.memory
+                return
+
+            # Shared state guarded by an exclusive file lock
+            with open(self.state_path, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    raw = f.read()
+                    try:
+                        state = json.loads(raw) if raw else {}
+                    except json.JSONDecodeError:
+                        log.warning('Resetting corrupt rate limit state.')
+                        state = {}
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(state, f)
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def host_state(self, state, host, now):
+        '''
+        This function gets the state for a host, creating it if needed, and
+        refills its token bucket.
+
+        state: The state of all hosts.
+        host: The host name.
+        now: The current time.
+
+        returns: The state dictionary for the host.
+        '''
+        h = state.get(host)
+        if h is None:
+            h = state[host] = {
+                'rate': self.rate,
+                'tokens': 1.0,
+                'stamp': now,
+                'concurrency': self.concurrency,
+                'in_flight': {},
+                'blocked_until': 0.0,
+            }
+
+        # Refill the bucket, allowing at most one second of burst
+        h['tokens'] = min(
+            max(h['rate'], 1.0),
+            h['tokens'] + (now - h['stamp']) * h['rate']
+        )
+        h['stamp'] = now
+
+        # Forget requests from processes that no longer exist
+        for pid in list(h['in_flight']):
+            if int(pid) != os.getpid() and not pid_alive(int(pid)):
+                del h['in_flight'][pid]
+
+        return h
+
+    def acquire(self, host):
+        '''
+        This function blocks until a request to the host is allowed.
+
+        host: The host name.
+        '''
+        pid = str(os.getpid())
+        while True:
+            with self.state() as state:
+                now = time.time()
+                h = self.host_state(state, host, now)
+
+                in_flight = sum(h['in_flight'].values())
+                wait = max(0.0, h['blocked_until'] - now)
+                if not wait and in_flight >= int(h['concurrency']):
+                    wait = 1.0 / h['rate']
+                if not wait and h['tokens'] < 1.0:
+                    wait = (1.0 - h['tokens']) / h['rate']
+
+                if not wait:
+                    h['tokens'] -= 1.0
+                    h['in_flight'][pid] = h['in_flight'].get(pid, 0) + 1
+                    return
+
+            time.sleep(min(wait, 5.0))
+
+    def release(self, host, latency, status=None, retry_after=None):
+        '''
+        This function frees a request slot and adapts the host limits.
+
+        host: The host name.
+        latency: The number of seconds the request took.
+        status: The HTTP status of the request, if there was one.
+        retry_after: The number of seconds the host asked us to wait.
+        '''
+        pid = str(os.getpid())
+        with self.state() as state:
+            now = time.time()
+            h = self.host_state(state, host, now)
+
+            # Free the slot
+            count = h['in_flight'].get(pid, 0) - 1
+            if count > 0:
+                h['in_flight'][pid] = count
+            else:
+                h['in_flight'].pop(pid, None)
+
+            # Multiplicative decrease when the host pushes back
+            if status in THROTTLE_STATUSES:
+                h['rate'] = max(self.min_rate, h['rate'] / 2)
+                h['concurrency'] = max(1.0, h['concurrency'] / 2)
+                h['tokens'] = min(h['tokens'], 0.0)
+                if retry_after:
+                    h['blocked_until'] = max(
+                        h['blocked_until'], now + retry_after)
+                log.info(
+                    f'Throttled by {host} ({status}). Backing off to '
+                    f'{h["rate"]:.2f} req/s and '
+                    f'{int(h["concurrency"])} in flight.'
+                )
+
+            # Slow responses mean we are near capacity
+            elif latency > self.target_latency:
+                h['concurrency'] = max(1.0, h['concurrency'] * 0.9)
+
+            # Additive increase, roughly one unit per round trip
+            else:
+                h['rate'] = min(self.max_rate, h['rate'] + 1 / h['rate'])
+                h['concurrency'] = min(
+                    self.max_concurrency,
+                    h['concurrency'] + 1 / h['concurrency']
+                )
+
+    @contextmanager
+    def limit(self, host):
+        '''
+        This function wraps a request to a host. The caller should set the
+        status (and retry_after if known) on the yielded slot.
+
+        host: The host name.
+        '''
+        self.acquire(host)
+        slot = Slot(host)
+        start = time.time()
+        try:
+            yield slot
+        finally:
+            self.release(
+                host,
+                time.time() - start,
+                slot.status,
+                slot.retry_after
+            )
+
+
+def pid_alive(pid):
+    '''
+    This function checks if a process is still running.
+
+    pid: The process id.
+
+    returns: True if the process exists, False otherwise.
+    '''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Limiter shared by everything in this process
+limiter = RateLimiter()
+
+
+def configure(state_path=None, **limits):
+    '''
+    This function configures the shared rate limiter.
+
+    state_path: The path to a state file used to share limits with other
+    processes on this machine. If None, limits are kept in memory.
+    limits: Keyword arguments for RateLimiter, such as rate and max_rate.
+    '''
+    global limiter
+
+    if state_path:
+        log.info(f'Sharing rate limits through {state_path}.')
+    limiter = RateLimiter(state_path=state_path, **limits)
+
+
+def settings():
+    '''
+    This function gets the settings of the shared rate limiter, so another
+    process can set up the same limiter.
+
+    returns: A dictionary of keyword arguments for configure().
+    '''
+    return {
+        'state_path': limiter.state_path,
+        'rate': limiter.rate,
+        'min_rate': limiter.min_rate,
+        'max_rate': limiter.max_rate,
+        'concurrency': limiter.concurrency,
+        'max_concurrency': limiter.max_concurrency,
+        'target_latency': limiter.target_latency,
+    }